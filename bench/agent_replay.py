@@ -0,0 +1,252 @@
+"""
+Agent pipeline throughput without root, a kernel or a cluster.
+
+    python3 bench/agent_replay.py generate --out /tmp/rec.txt [--services 50 --pods 3 --events 1000000]
+    python3 bench/agent_replay.py run --file /tmp/rec.txt [--rate 0]
+    python3 bench/agent_replay.py sweep --file /tmp/rec.txt
+
+Recordings are what the sensors read: bpftrace stdout (LAT/CONN/ERR/EDGE/CGRM lines,
+@map drains, FLUSH markers) or, for *.bin, packed event_t records from the ring buffer.
+IPv4 connects are recorded as production sees them: a drained @conn map before every
+FLUSH (text), or one CONN record per new (cgroup, service) edge, nothing for addresses
+no service owns (*.bin, IP map loaded in kernel).
+Next to each one, <file>.meta.json stands in for Kubernetes: pods (name, uid, app, ip),
+services (name, ip) and the cgroup id -> pod uid map.
+
+run feeds a recording through the agent's own code: the sensor decoder, the sink
+handlers (cgroup -> service attribution, counters, topology) and the collect() that
+serves the aggregator. Pods and services arrive through the agent's informer handlers.
+--rate paces arrivals (events/s, 0 = as fast as possible). Per-event latency runs from
+an event's arrival to the moment the pipeline has handled it. sweep doubles the rate
+until the pipeline falls behind and reports the last rate it sustained.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import socket
+import struct
+import sys
+import time
+import uuid
+from array import array
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "agent"))
+with contextlib.redirect_stdout(io.StringIO()):
+    import agent
+import sensors
+from ipmap import ipv4_key
+
+# --- RECORDING ---
+
+def generate(args):
+    rng = random.Random(args.seed)
+    pods, services, cgroups = [], [], {}
+    for s in range(args.services):
+        app = f"svc-{s}"
+        services.append({"name": app, "ip": f"10.96.{s // 250}.{s % 250 + 1}"})
+        for p in range(args.pods):
+            uid = str(uuid.UUID(int=rng.getrandbits(128)))
+            n = s * args.pods + p
+            pod = {"name": f"{app}-{p}", "uid": uid, "app": app, "ip": f"10.244.{n // 250}.{n % 250 + 1}",
+                   "cgroup": rng.getrandbits(40), "pid": 1000 + n}
+            pods.append(pod)
+            cgroups[str(pod["cgroup"])] = uid
+    with open(args.out + ".meta.json", "w") as f:
+        json.dump({"pods": pods, "services": services, "cgroups": cgroups}, f)
+
+    binary = args.out.endswith(".bin")
+    known = {s["ip"] for s in services}
+    out = open(args.out, "wb" if binary else "w")
+    conns, edges = {}, set()  # text: @conn counts until the next drain, bin: edges already sent up
+    for i in range(args.events):
+        pod = rng.choice(pods)
+        if rng.random() < args.conn_ratio:
+            # Mostly calls to known services, a few to addresses nobody owns
+            ip = rng.choice(services)["ip"] if rng.random() < 0.95 else f"203.0.113.{rng.randint(1, 254)}"
+            if binary:
+                # Later connects on the edge (and unmapped ones) only add to kernel counters
+                if ip in known and (pod["cgroup"], ip) not in edges:
+                    edges.add((pod["cgroup"], ip))
+                    out.write(struct.pack(sensors.EVENT_FORMAT, sensors.EVENT_CONN, 0, pod["pid"], pod["cgroup"], 2,
+                                          socket.inet_aton(ip) + bytes(12)))
+            else:
+                key = (pod["cgroup"], ipv4_key(ip))
+                conns[key] = conns.get(key, 0) + 1
+        else:
+            lat_us = int(rng.lognormvariate(8, 1)) + 1
+            status = 503 if rng.random() < 0.05 else 200
+            if binary:
+                out.write(struct.pack(sensors.EVENT_FORMAT, sensors.EVENT_LAT, status, pod["pid"], pod["cgroup"], lat_us,
+                                      (1).to_bytes(4, "little") + bytes(12)))
+            else: out.write(f"LAT {pod['cgroup']} {pod['pid']} {lat_us} {status}\n")
+        if not binary and ((i + 1) % args.flush_every == 0 or i + 1 == args.events):
+            out.writelines(f"@conn[{cg}, {addr}]: {n}\n" for (cg, addr), n in conns.items())
+            out.write("FLUSH\n")
+            conns = {}
+    out.close()
+    print(f"[*] Wrote {args.events} events for {len(pods)} pods / {len(services)} services to {args.out}")
+
+# --- FAKE KUBERNETES ---
+
+def load_metadata(path):
+    """Deliver pods and services through the agent's informer handlers, and the cgroup map."""
+    with open(path + ".meta.json") as f: meta = json.load(f)
+    for p in meta["pods"]:
+        pod = SimpleNamespace(metadata=SimpleNamespace(name=p["name"], namespace="default", uid=p["uid"],
+                                                       labels={"app": p["app"]}),
+                              status=SimpleNamespace(pod_ip=p["ip"]))
+        agent.on_pod_event("ADDED", pod, None)
+    for s in meta["services"]:
+        svc = SimpleNamespace(metadata=SimpleNamespace(name=s["name"], namespace="default", labels={"app": s["name"]}),
+                              spec=SimpleNamespace(cluster_ip=s["ip"]))
+        agent.on_service_event("ADDED", svc, None)
+    # What a walk of /sys/fs/cgroup would have found; never walk the real one
+    agent.RESOLVER.cgid_to_uid = {int(cg): uid for cg, uid in meta["cgroups"].items()}
+    agent.RESOLVER.last_scan = float("inf")
+
+def reset_agent():
+    agent.METRICS_STORE = agent.ServiceCounters()
+    agent.EDGE_STORE = agent.EdgeCounters()
+    agent.TOPOLOGY_STORE.clear()
+    agent.EDGE_SEEN.clear()
+    agent.UNMAPPED_SEEN.clear()
+    agent.SENSOR_STATS.clear()
+    agent.RESOLVER.hits = agent.RESOLVER.misses = 0
+
+# --- REPLAY ---
+
+def rss_mb():
+    with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def paced_lines(lines, rate, latencies):
+    """Yield lines at `rate`; the next request for a line means the previous one is handled."""
+    start = time.perf_counter()
+    arrival = None
+    for i, line in enumerate(lines):
+        now = time.perf_counter()
+        if arrival is not None: latencies.append(now - arrival)
+        if rate:
+            arrival = start + i / rate
+            if arrival - now > 0.001: time.sleep(arrival - now)
+            # Handed over a little early (not worth a sleep): it arrives now
+            arrival = min(arrival, time.perf_counter())
+        else: arrival = now
+        yield line
+    latencies.append(time.perf_counter() - arrival)
+
+def replay_records(data, rate, latencies, batch, poll_ms=100):
+    """
+    Feed packed records as the ring buffer poll would: whatever arrived during one
+    poll interval (at most `batch`) is handed over once that interval is over.
+    """
+    size = sensors.EVENT_SIZE
+    n = len(data) // size
+    if rate: batch = max(1, min(batch, int(rate * poll_ms / 1000)))
+    view = memoryview(data)
+    start = time.perf_counter()
+    for first in range(0, n, batch):
+        last = min(first + batch, n)
+        arrivals = [start + i / rate for i in range(first, last)] if rate else None
+        if rate:
+            wait = arrivals[-1] - time.perf_counter()
+            if wait > 0: time.sleep(wait)
+        begin = time.perf_counter()
+        sensors.decode_records(view[first * size:last * size], agent.Sink)
+        done = time.perf_counter()
+        if rate: latencies.extend(done - a for a in arrivals)
+        else: latencies.extend([(done - begin) / (last - first)] * (last - first))
+    return n
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+def run_once(path, data, rate, batch):
+    reset_agent()
+    latencies = array("d")
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    # Per-request log lines are part of the hot loop: write them, just not to the terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if path.endswith(".bin"): events = replay_records(data, rate, latencies, batch)
+        else:
+            events = len(data)
+            sensors.BpftraceSensor(agent.Sink, aggregate=False).consume(paced_lines(data, rate, latencies))
+    elapsed = time.perf_counter() - start
+
+    collect_start = time.perf_counter()
+    payload = agent.MetricsHandler.collect(object.__new__(agent.MetricsHandler))
+    collect_ms = (time.perf_counter() - collect_start) * 1000
+    lat = sorted(latencies)
+    requests = sum(m["count"] for m in payload["metrics"].values())
+    return {"events": events, "elapsed_s": elapsed, "events_per_s": events / max(elapsed, 1e-9),
+            "lat_p50_us": percentile(lat, 0.5) * 1e6, "lat_p99_us": percentile(lat, 0.99) * 1e6,
+            "lat_max_us": (lat[-1] if lat else 0) * 1e6, "collect_ms": collect_ms,
+            "rss_growth_mb": rss_mb() - rss_before, "requests": requests, "services": len(payload["metrics"]),
+            "edges": sum(len(v) for v in payload["topology"].values()),
+            "resolver_hit_rate": agent.RESOLVER.stats()["hit_rate"]}
+
+def load(path):
+    if path.endswith(".bin"):
+        with open(path, "rb") as f: return f.read()
+    with open(path) as f: return f.readlines()
+
+def report(rate, r):
+    print(f"{'max' if not rate else f'{rate:,.0f}':>10} | {r['events_per_s']:>12,.0f} | {r['lat_p50_us']:>8.1f} {r['lat_p99_us']:>9.1f} "
+          f"{r['lat_max_us']:>10.0f} | {r['collect_ms']:>7.1f} | {r['rss_growth_mb']:>6.1f}")
+
+HEADER = f"{'rate':>10} | {'events/s':>12} | {'p50 us':>8} {'p99 us':>9} {'max us':>10} | {'collect':>7} | {'RSS MB':>6}"
+
+def run(args):
+    load_metadata(args.file)
+    data = load(args.file)
+    print(f"[*] {args.file}: {len(data) // sensors.EVENT_SIZE if args.file.endswith('.bin') else len(data):,} events | "
+          f"peak RSS so far {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    print(HEADER)
+    r = run_once(args.file, data, args.rate, args.batch)
+    report(args.rate, r)
+    print(f"[*] {r['requests']:,} requests attributed to {r['services']} services, {r['edges']} edges, "
+          f"resolver hit rate {r['resolver_hit_rate']}")
+
+def sweep(args):
+    load_metadata(args.file)
+    data = load(args.file)
+    print(HEADER)
+    best = run_once(args.file, data, 0, args.batch)
+    report(0, best)
+    # Sustained: keeps pace with arrivals and no event waits longer than one flush interval
+    rate, sustained = max(1000, int(best["events_per_s"] / 8)), None
+    while rate <= best["events_per_s"] * 1.5:
+        r = run_once(args.file, data, rate, args.batch)
+        report(rate, r)
+        if r["events_per_s"] < rate * 0.95 or r["lat_p99_us"] > 1e6: break
+        sustained = rate
+        rate *= 2
+    print(f"[*] Max sustained: {sustained:,} events/s" if sustained else "[*] Could not sustain the lowest rate")
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    gen = sub.add_parser("generate")
+    gen.add_argument("--out", required=True)
+    gen.add_argument("--services", type=int, default=50)
+    gen.add_argument("--pods", type=int, default=3)
+    gen.add_argument("--events", type=int, default=1000000)
+    gen.add_argument("--conn-ratio", type=float, default=0.01)
+    gen.add_argument("--flush-every", type=int, default=10000)
+    gen.add_argument("--seed", type=int, default=1)
+    for name in ("run", "sweep"):
+        p = sub.add_parser(name)
+        p.add_argument("--file", required=True)
+        p.add_argument("--rate", type=float, default=0)
+        p.add_argument("--batch", type=int, default=65536, help="max records per ring buffer poll (*.bin)")
+    args = parser.parse_args()
+    {"generate": generate, "run": run, "sweep": sweep}[args.cmd](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Sync round latency of the sharded aggregator as replicas and agents grow together.
+
+    REDIS_HOST=localhost python3 bench/aggregator_shards.py [--replicas 1,2,4,8 --agents-per-replica 50]
+
+Simulated agents are HTTP servers (spread over --agent-procs processes) that serve the
+agent's /metrics payload with cumulative counters growing at --rate requests/s per
+service. Every replica is its own process running shard.run_round, the sharded round of
+src/aggregator/app.py: heartbeat, scrape the agents the ring gives it, ingest,
+exchange partials, leader writes, build the graph from the merge.
+
+For each replica count n, n * --agents-per-replica agents are synced once by n
+replicas ("sharded") and once by a single replica ("single"). Reported per round,
+after --warmup seconds: p50/p99 sync latency over all replicas, agents covered, and
+the merged request rate over the expected one (1.0 = nothing lost or double counted).
+--kill also stops one replica halfway and reports how long until every agent is
+scraped again. Needs as many cores as replicas + agent processes for the sharded
+column to stay flat. Uses database 15 and flushes it.
+"""
+import argparse
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import multiprocessing as mp
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "aggregator"))
+from common.sketch import LatencySketch
+from common.wire import WireEncoder
+from rollup import Rollups, DEFAULT_WINDOW
+from scraper import AgentScraper
+from series import SeriesStore
+import shard
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+# Shape of every service's latency histogram (value us -> share of requests)
+LATENCY_SHAPE = {800: 0.4, 1500: 0.3, 5000: 0.2, 20000: 0.08, 100000: 0.02}
+
+# --- SIMULATED AGENTS ---
+
+def agent_payload(start, services, rate, now):
+    elapsed = now - start
+    count = int(rate * elapsed)
+    sketch = LatencySketch()
+    for value_us, share in LATENCY_SHAPE.items(): sketch.add(value_us, int(count * share))
+    sum_us = int(sum(v * s for v, s in LATENCY_SHAPE.items()) * count)
+    metrics = {f"svc-{i}": {"count": count, "sum_us": sum_us, "errors": count // 100,
+                            "responses": {"2xx": count - count // 100, "5xx": count // 100},
+                            "sketch": sketch.to_wire()} for i in range(services)}
+    edges = [{"src": f"svc-{i}", "dst": f"svc-{i + 1}", "count": count, "sum_us": sum_us, "errors": 0,
+              "bytes": count * 512, "last_seen": now} for i in range(services - 1)]
+    return {"agent_start": start, "timestamp": now, "metrics": metrics,
+            "topology": {e["src"]: [e["dst"]] for e in edges}, "edges": edges, "sensor": {}}
+
+def serve_agents(ports, services, rate, ready):
+    start = time.time()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # Same negotiation as the agent: compact deltas for scrapers that ask
+            body, content_type, encoding = self.server.wire.encode(
+                agent_payload(start, services, rate, time.time()), self.headers.get("Accept", ""),
+                self.headers.get("Accept-Encoding", ""), self.headers.get("X-Wire-Ack"))
+            self.send_response(200)
+            self.send_header("Content-type", content_type)
+            if encoding: self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): return
+
+    for port in ports:
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.wire = WireEncoder(start)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ready.set()
+    signal.pause()
+
+# --- REPLICAS ---
+
+def run_replica(replica_id, urls, interval, results, stop):
+    """app.py's sharded loop: shard.run_round over every agent, minus Kubernetes."""
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    redis_conn = redis.Redis(host=REDIS_HOST, port=6379, db=15, decode_responses=True)
+    member = shard.ShardMember(replica_id, ttl=max(3, 3 * interval))
+    scraper = AgentScraper(max_workers=32)
+    rollups, series = Rollups(slot_seconds=2), SeriesStore(slot_seconds=2)
+    while not stop.is_set():
+        round_start = time.perf_counter()
+        _, merged, stats = shard.run_round(member, redis_conn, scraper, rollups, series, urls)
+        elapsed = time.perf_counter() - round_start
+        rps = sum(m[DEFAULT_WINDOW]["rps"] for m in merged.values()) if member.leader else None
+        results.put((replica_id, time.time(), elapsed, stats["ok"], len(member.members), rps))
+        stop.wait(max(0, interval - elapsed))
+    member.leave(redis_conn)
+
+# --- ONE CONFIGURATION ---
+
+def run_config(args, replicas, agents, port_base):
+    redis.Redis(host=REDIS_HOST, port=6379, db=15).flushdb()
+    ports = list(range(port_base, port_base + agents))
+    urls = {f"agent-{i}": f"http://127.0.0.1:{port}" for i, port in enumerate(ports)}
+    hosts = []
+    for k in range(args.agent_procs):
+        ready = mp.Event()
+        p = mp.Process(target=serve_agents, args=(ports[k::args.agent_procs], args.services, args.rate, ready), daemon=True)
+        p.start()
+        ready.wait()
+        hosts.append(p)
+
+    results, procs = mp.Queue(), []
+    for i in range(replicas):
+        stop = mp.Event()
+        p = mp.Process(target=run_replica, args=(f"replica-{i}", urls, args.interval, results, stop), daemon=True)
+        p.start()
+        procs.append((p, stop))
+
+    start = time.time()
+    rounds = []
+    killed_at = None
+    while time.time() - start < args.duration:
+        if args.kill and replicas > 1 and killed_at is None and time.time() - start > args.duration / 2:
+            procs[-1][1].set()
+            killed_at = time.time()
+        try: rounds.append(results.get(timeout=0.5))
+        except queue.Empty: pass
+    for p, stop in procs: stop.set()
+    for p, _ in procs: p.join(timeout=5)
+    for p in hosts: p.terminate()
+
+    measured = sorted(r[2] for r in rounds if r[1] - start > args.warmup)
+    rps = [r[5] for r in rounds if r[5] is not None and r[1] - start > args.warmup]
+    expected = agents * args.services * args.rate
+    # Agents covered at the end: sum over live replicas of the last round each one finished
+    latest = {}
+    for r in rounds:
+        if r[1] > rounds[-1][1] - 1.5 * args.interval: latest[r[0]] = r[3]
+    recovered = None
+    if killed_at is not None:
+        # First time after the kill that the surviving replicas scraped every agent in one round each
+        seen = {}
+        for r in rounds:
+            if r[1] < killed_at or r[0] == f"replica-{replicas - 1}": continue
+            seen[r[0]] = r[3]
+            if sum(seen.values()) >= agents and len(seen) >= replicas - 1:
+                recovered = r[1] - killed_at
+                break
+    pct = lambda p: measured[min(len(measured) - 1, int(p * len(measured)))] * 1000 if measured else 0.0
+    return {"p50_ms": pct(0.5), "p99_ms": pct(0.99), "covered": sum(latest.values()),
+            "rps_ratio": (sum(rps) / len(rps)) / expected if rps else 0.0, "recovered_s": recovered}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", default="1,2,4,8")
+    parser.add_argument("--agents-per-replica", type=int, default=50)
+    parser.add_argument("--services", type=int, default=20, help="services reported by every agent")
+    parser.add_argument("--rate", type=float, default=50, help="requests/s per service per agent")
+    parser.add_argument("--agent-procs", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=2, help="seconds between sync rounds")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=12)
+    parser.add_argument("--kill", action="store_true", help="stop one replica halfway through the sharded runs")
+    parser.add_argument("--port-base", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'replicas':>8} {'agents':>6} | {'sharded p50':>11} {'p99':>7} {'covered':>7} {'rps':>5} | "
+          f"{'single p50':>10} {'p99':>7} {'covered':>7} {'rps':>5}{' | recovered' if args.kill else ''}")
+    for n in [int(x) for x in args.replicas.split(",")]:
+        agents = n * args.agents_per_replica
+        sharded = run_config(args, n, agents, args.port_base)
+        single = run_config(args, 1, agents, args.port_base) if n > 1 else sharded
+        recovered = ""
+        if args.kill:
+            recovered = " | " + (f"{sharded['recovered_s']:.1f}s" if sharded["recovered_s"] is not None else "-")
+        print(f"{n:>8} {agents:>6} | {sharded['p50_ms']:>9.0f}ms {sharded['p99_ms']:>5.0f}ms {sharded['covered']:>7} "
+              f"{sharded['rps_ratio']:>5.2f} | {single['p50_ms']:>8.0f}ms {single['p99_ms']:>5.0f}ms {single['covered']:>7} "
+              f"{single['rps_ratio']:>5.2f}{recovered}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Critical-path RCA on synthetic dependency graphs.
+
+    python3 bench/rca_synthetic.py [--services 50,200,500,1000] [--trials 20]
+
+Builds layered call graphs (fan-out, repeated calls, a few cycle-closing edges),
+makes one random service below the entry tier slow (depth 1, a direct dependency of
+an entry service, or deeper), derives every service's inclusive latency bottom-up
+and checks which tier src/controller/rca.py and the old one-hop rule would scale.
+Both are scored on the same trials: hit rates count the trials where an entry service
+breaches its SLO, overall and split by the depth of the slow service.
+Also times a full build against an incremental update after one service changes.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "controller"))
+from rca import CriticalPath
+
+def make_graph(n, rng, layers=6, back_edges=3):
+    tiers = [[] for _ in range(layers)]
+    for i in range(n): tiers[min(i * layers // n, layers - 1)].append(f"svc-{i}")
+    topology, calls = {}, {}
+    for depth, tier in enumerate(tiers[:-1]):
+        for svc in tier:
+            children = rng.sample(tiers[depth + 1], min(len(tiers[depth + 1]), rng.randint(1, 3)))
+            topology[svc] = children
+            for child in children: calls[(svc, child)] = rng.choice((1, 1, 1, 2))
+    # Cycle-closing calls with a trickle of traffic (retries, callbacks)
+    for _ in range(back_edges):
+        src = rng.choice(tiers[-2])
+        dst = rng.choice(tiers[0])
+        topology.setdefault(src, []).append(dst)
+        calls[(src, dst)] = 0.001
+    return tiers, topology, calls
+
+def observe(tiers, topology, calls, exclusive, entry_rps=100.0):
+    """Metrics and edge stats as the aggregator would report them (sequential calls)."""
+    rps = {svc: 0.0 for tier in tiers for svc in tier}
+    for svc in tiers[0]: rps[svc] = entry_rps
+    for tier in tiers:
+        for svc in tier:
+            for child in topology.get(svc, []):
+                if child in tiers[0]: continue
+                rps[child] += rps[svc] * calls[(svc, child)]
+    latency = {}
+    for tier in reversed(tiers):
+        for svc in tier:
+            latency[svc] = exclusive[svc] + sum(calls[(svc, c)] * latency.get(c, 0) for c in topology.get(svc, []))
+    metrics = {svc: {"latency": latency[svc], "rps": rps[svc]} for svc in latency}
+    edges = {svc: {c: {"rps": rps[svc] * calls[(svc, c)], "latency": latency.get(c, 0)} for c in children}
+             for svc, children in topology.items()}
+    return metrics, edges
+
+def one_hop(svc, metrics, topology, slo):
+    """The controller's original rule: first child over its SLO, else the service itself."""
+    for child in topology.get(svc, []):
+        if metrics[child]["latency"] > slo[child]: return child
+    return svc
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--services", default="50,200,500,1000")
+    parser.add_argument("--trials", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'services':>8} | {'rca hit':>7} {'1-hop hit':>9} | {'depth 1':>15} | {'depth 2+':>15} | "
+          f"{'full ms':>7} {'incr ms':>7} {'recomputed':>10}")
+    for n in [int(x) for x in args.services.split(",")]:
+        full_ms, incr_ms, recomputed = 0.0, 0.0, 0
+        # depth bucket -> [breached trials, rca hits, one-hop hits]
+        scores = {"1": [0, 0, 0], "2+": [0, 0, 0]}
+        for _ in range(args.trials):
+            tiers, topology, calls = make_graph(n, rng)
+            exclusive = {svc: rng.uniform(1, 5) for tier in tiers for svc in tier}
+            healthy, _ = observe(tiers, topology, calls, exclusive)
+            # SLOs with 50% headroom over healthy latency
+            slo = {svc: m["latency"] * 1.5 for svc, m in healthy.items()}
+
+            # Slow enough to push the entry services that call it past their SLO
+            called = {c for children in topology.values() for c in children}
+            depth, slow = rng.choice([(d, svc) for d, tier in enumerate(tiers) if d for svc in tier if svc in called])
+            exclusive[slow] += max(m["latency"] for m in healthy.values())
+            metrics, edges = observe(tiers, topology, calls, exclusive)
+
+            start = time.perf_counter()
+            engine = CriticalPath().update(metrics, topology, edges)
+            full_ms += (time.perf_counter() - start) * 1000
+
+            # Entry service the slow one hurts the most
+            root = max(tiers[0], key=lambda s: metrics[s]["latency"] / slo[s])
+            reduction = metrics[root]["latency"] - slo[root]
+            if reduction > 0:
+                # Only reachable from entry services that stay within SLO otherwise
+                score = scores["1" if depth == 1 else "2+"]
+                score[0] += 1
+                score[1] += engine.scale_target(root, reduction)["target"] == slow
+                score[2] += one_hop(root, metrics, topology, slo) == slow
+
+            # Next round: one leaf changes
+            leaf = rng.choice(tiers[-1])
+            exclusive[leaf] += 1
+            metrics, edges = observe(tiers, topology, calls, exclusive)
+            start = time.perf_counter()
+            engine.update(metrics, topology, edges)
+            incr_ms += (time.perf_counter() - start) * 1000
+            recomputed += engine.recomputed
+
+        t = args.trials
+        b, hits, naive_hits = (sum(x) for x in zip(*scores.values()))
+        rate = lambda hit, trials: f"{hit / trials:.0%}" if trials else "-"
+        by_depth = " | ".join(f"{rate(sc[1], sc[0]):>4} {rate(sc[2], sc[0]):>4} ({sc[0]:>3})" for sc in scores.values())
+        print(f"{n:>8} | {rate(hits, b):>7} {rate(naive_hits, b):>9} | {by_depth} | "
+              f"{full_ms / t:>7.2f} {incr_ms / t:>7.2f} {recomputed / t:>10.0f}")
+
+if __name__ == "__main__":
+    main()
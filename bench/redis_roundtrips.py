@@ -0,0 +1,90 @@
+"""
+Round trips and wall time of the aggregator's Redis paths as the service count grows.
+
+    REDIS_HOST=localhost python3 bench/redis_roundtrips.py [--services 10,100,1000,5000]
+
+Compares the original per-command code ("naive") with src/aggregator/store.py
+("batched"). Uses database 15 and flushes it.
+"""
+import argparse
+import os
+import sys
+import time
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "aggregator"))
+from common.sketch import LatencySketch
+from rollup import Partial, EdgePartial, WINDOWS
+import store
+
+ROUND_TRIPS = 0
+_send = redis.connection.Connection.send_packed_command
+
+def counting_send(self, *args, **kwargs):
+    global ROUND_TRIPS
+    ROUND_TRIPS += 1
+    return _send(self, *args, **kwargs)
+
+redis.connection.Connection.send_packed_command = counting_send
+
+def make_round(n):
+    merged = {}
+    edges = {}
+    now = time.time()
+    for i in range(n):
+        sketch = LatencySketch()
+        for v in (800, 1200, 5000, 20000): sketch.add(v, 10)
+        partial = Partial(40, 270000, 1, sketch)
+        merged[f"svc-{i}"] = {name: partial.stats(seconds) for name, seconds in WINDOWS.items()}
+        edge = {**EdgePartial(20, 135000, 0, 40960).stats(10), "last_seen": now}
+        edges[f"svc-{i}"] = {f"svc-{(i + 1) % n}": edge, f"svc-{(i + 7) % n}": edge}
+    return merged, edges
+
+# --- The original code paths, for comparison ---
+def naive_write(r, merged, edges):
+    for svc, acc in merged.items():
+        r.hset(f"metric:{svc}", mapping=store.metric_fields(acc))
+        r.sadd("services", svc)
+        r.expire(f"metric:{svc}", 30)
+    for src, dests in edges.items():
+        for dst in dests:
+            r.sadd(f"topo:{src}", dst)
+            r.sadd("services", src)
+            r.sadd("services", dst)
+
+def naive_read(r):
+    resp_metrics, resp_topo = {}, {}
+    for svc in r.smembers("services"):
+        resp_metrics[svc] = store.parse_metric(r.hgetall(f"metric:{svc}"))
+        links = r.smembers(f"topo:{svc}")
+        if links: resp_topo[svc] = list(links)
+    return {"metrics": resp_metrics, "topology": resp_topo}
+
+def measure(fn, *args):
+    global ROUND_TRIPS
+    ROUND_TRIPS = 0
+    start = time.perf_counter()
+    result = fn(*args)
+    return ROUND_TRIPS, (time.perf_counter() - start) * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--services", default="10,100,1000,5000")
+    args = parser.parse_args()
+
+    r = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=6379, db=15, decode_responses=True)
+    print(f"{'services':>8} | {'path':<7} | {'sync RTs':>8} {'sync ms':>8} | {'graph RTs':>9} {'graph ms':>8}")
+    for n in [int(x) for x in args.services.split(",")]:
+        merged, edges = make_round(n)
+        for name, write, read in (("naive", naive_write, naive_read), ("batched", store.write_round, store.read_graph)):
+            r.flushdb()
+            w_rt, w_ms, _ = measure(write, r, merged, edges)
+            read(r)  # warm up (loads the Lua script)
+            g_rt, g_ms, graph = measure(read, r)
+            assert len(graph["metrics"]) == n
+            print(f"{n:>8} | {name:<7} | {w_rt:>8} {w_ms:>8.1f} | {g_rt:>9} {g_ms:>8.1f}")
+    r.flushdb()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Time to SLO recovery under a load ramp, on a live cluster.
+
+    make traffic   # traffic-gen deployed, controller + aggregator running
+    AGGREGATOR_URL=http://localhost:8000 python3 bench/slo_recovery.py [--peak 6 --ramp 120 --hold 240]
+
+Ramps deploy/02-demo-apps/traffic-generator.yaml from 1 to --peak replicas over --ramp
+seconds, holds, then goes back to 1. Every second it reads /api/graph and the
+ServiceSLOs and reports, per service: seconds in breach, time from the first breach
+to the last recovery, and the largest replica count the controller reached.
+Run it once with the controller's FORECAST_HORIZON=0 (reactive) and once with the
+default to compare.
+"""
+import argparse
+import os
+import time
+import requests
+from kubernetes import client, config
+
+AGGREGATOR_URL = os.getenv("AGGREGATOR_URL", "http://localhost:8000")
+LATENCY_FIELDS = {"mean": "latency", "p50": "p50", "p90": "p90", "p99": "p99", "p999": "p999"}
+
+def slos(custom_api):
+    items = custom_api.list_namespaced_custom_object("autoscaling.fyp.io", "v1alpha1", "default", "serviceslos")["items"]
+    return {i["spec"]["targetDeployment"]: (i["spec"].get("sloLatency", 30), i["spec"].get("sloPercentile", "mean"))
+            for i in items if i.get("spec", {}).get("targetDeployment")}
+
+def set_traffic(app_api, replicas):
+    app_api.patch_namespaced_deployment_scale("traffic-gen", "default", {"spec": {"replicas": replicas}})
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peak", type=int, default=6)
+    parser.add_argument("--ramp", type=int, default=120)
+    parser.add_argument("--hold", type=int, default=240)
+    parser.add_argument("--cooldown", type=int, default=60)
+    args = parser.parse_args()
+
+    try: config.load_incluster_config()
+    except: config.load_kube_config()
+    app_api, custom_api = client.AppsV1Api(), client.CustomObjectsApi()
+    targets = slos(custom_api)
+
+    breach_s = {svc: 0 for svc in targets}
+    first_breach, last_recovery, peak_replicas = {}, {}, {svc: 0 for svc in targets}
+    in_breach = set()
+    set_traffic(app_api, 1)
+    start = time.time()
+    total = args.ramp + args.hold + args.cooldown
+    level = 1
+    print(f"[*] Ramping traffic-gen 1 -> {args.peak} over {args.ramp}s, holding {args.hold}s")
+    while (t := time.time() - start) < total:
+        want = 1 + round((args.peak - 1) * min(t / args.ramp, 1)) if t < args.ramp + args.hold else 1
+        if want != level:
+            set_traffic(app_api, want)
+            level = want
+        try: metrics = requests.get(f"{AGGREGATOR_URL}/api/graph", timeout=2).json().get("metrics", {})
+        except Exception as e:
+            print(f"⏳ Waiting for Aggregator... ({e})")
+            metrics = {}
+        for svc, (slo, percentile) in targets.items():
+            m = metrics.get(svc)
+            if not isinstance(m, dict): continue
+            latency = m.get(LATENCY_FIELDS.get(percentile, "latency"), m.get("latency", 0))
+            if latency > slo:
+                breach_s[svc] += 1
+                first_breach.setdefault(svc, t)
+                in_breach.add(svc)
+            elif svc in in_breach:
+                in_breach.discard(svc)
+                last_recovery[svc] = t
+            try: peak_replicas[svc] = max(peak_replicas[svc], app_api.read_namespaced_deployment_scale(svc, "default").spec.replicas)
+            except Exception: pass
+        time.sleep(max(0, 1 - (time.time() - start - t)))
+    set_traffic(app_api, 1)
+
+    print(f"{'service':<12} | {'breach s':>8} | {'recovery s':>10} | {'peak replicas':>13}")
+    for svc in sorted(targets):
+        if svc in first_breach:
+            end = last_recovery.get(svc) if svc not in in_breach else None
+            recovery = f"{end - first_breach[svc]:.0f}" if end is not None else "never"
+        else: recovery = "-"
+        print(f"{svc:<12} | {breach_s[svc]:>8} | {recovery:>10} | {peak_replicas[svc]:>13}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Bytes and CPU of the agent -> aggregator scrape formats (src/common/wire.py).
+
+    python3 bench/wire_format.py [--services 200 --edges 600 --churn 1.0,0.2 --rounds 50]
+
+Builds collect()-shaped payloads for one agent and scrapes them --rounds times.
+Between scrapes a --churn fraction of services and edges see traffic, one table per
+value. 1.0 is what a busy agent sends: its counters are cumulative and last_seen is
+refreshed, so every active service and edge changes on every scrape. Every
+format/compression pair is reported with the size of the first (full) response,
+the average steady-state response, and encode (agent) / decode (aggregator) time
+per scrape, including (de)compression. Each decoded payload is checked against
+what the agent collected. msgpack / zstd rows need those packages installed.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from common.sketch import LatencySketch
+from common import wire
+
+def make_state(args, rng):
+    services = [f"svc-{i}" for i in range(args.services)]
+    metrics = {}
+    for svc in services:
+        sketch = LatencySketch()
+        for _ in range(args.buckets): sketch.add(int(rng.lognormvariate(8, 1.5)) + 1, rng.randint(1, 1000))
+        metrics[svc] = {"count": sketch.count, "sum_us": sketch.count * 4000, "errors": 0, "responses": {"2xx": sketch.count}, "sketch": sketch}
+    edges = {}
+    while len(edges) < args.edges:
+        src, dst = rng.sample(services, 2)
+        edges[(src, dst)] = {"count": 0, "sum_us": 0, "errors": 0, "bytes": 0, "last_seen": time.time()}
+    return metrics, edges
+
+def traffic(metrics, edges, churn, rng):
+    now = time.time()
+    for m in rng.sample(list(metrics.values()), int(len(metrics) * churn)):
+        n = rng.randint(1, 500)
+        m["sketch"].add(int(rng.lognormvariate(8, 1.5)) + 1, n)
+        m["count"] += n
+        m["sum_us"] += n * 4000
+        m["responses"]["2xx"] += n
+    for e in rng.sample(list(edges.values()), int(len(edges) * churn)):
+        e["count"] += 10
+        e["sum_us"] += 40000
+        e["bytes"] += 5120
+        e["last_seen"] = round(now, 3)
+
+def collect(metrics, edges, start):
+    """Same shape as MetricsHandler.collect()."""
+    topology = {}
+    for src, dst in edges: topology.setdefault(src, []).append(dst)
+    return {"agent_start": start, "timestamp": time.time(),
+            "metrics": {svc: {**{k: v for k, v in m.items() if k != "sketch"}, "responses": dict(m["responses"]),
+                              "sketch": m["sketch"].to_wire()} for svc, m in metrics.items()},
+            "topology": topology,
+            "edges": [{"src": src, "dst": dst, **e} for (src, dst), e in edges.items()],
+            "sensor": {}}
+
+def same(a, b):
+    norm = lambda p: {**p, "topology": {k: sorted(v) for k, v in p["topology"].items()},
+                      "edges": sorted(p["edges"], key=lambda e: (e["src"], e["dst"]))}
+    return norm(a) == norm(b)
+
+def run(args, churn, content_type, encoding):
+    rng = random.Random(args.seed)
+    metrics, edges = make_state(args, rng)
+    start = time.time()
+    encoder, decoder = wire.WireEncoder(start), wire.WireDecoder()
+    accept = content_type
+    accept_encoding = encoding or ""
+    sizes, encode_s, decode_s = [], 0.0, 0.0
+    for r in range(args.rounds):
+        if r: traffic(metrics, edges, churn, rng)
+        payload = collect(metrics, edges, start)
+        t0 = time.perf_counter()
+        body, ctype, enc = encoder.encode(payload, accept, accept_encoding, decoder.ack)
+        t1 = time.perf_counter()
+        decoded = decoder.decode(wire.decompress(body, enc), ctype)
+        t2 = time.perf_counter()
+        if not same(decoded, payload): raise SystemExit(f"❌ {content_type} {encoding}: decoded payload differs in round {r}")
+        sizes.append(len(body))
+        if r:
+            encode_s += t1 - t0
+            decode_s += t2 - t1
+    steady = args.rounds - 1
+    return sizes[0], sum(sizes[1:]) / steady, encode_s / steady * 1e6, decode_s / steady * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--services", type=int, default=200)
+    parser.add_argument("--edges", type=int, default=600)
+    parser.add_argument("--buckets", type=int, default=30, help="latency buckets per service")
+    parser.add_argument("--churn", default="1.0,0.2", help="shares of services/edges with traffic between scrapes")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    formats = [wire.JSON, wire.COMPACT_JSON] + ([wire.MSGPACK] if wire.msgpack else [])
+    encodings = [None, "gzip"] + (["zstd"] if wire.zstandard else [])
+    for churn in [float(x) for x in args.churn.split(",")]:
+        print(f"\n{args.services} services, {args.edges} edges, {churn:.0%} changing per scrape")
+        print(f"{'format':<24} {'encoding':<8} | {'full B':>9} {'steady B':>9} | {'encode us':>9} {'decode us':>9}")
+        baseline = None
+        for content_type in formats:
+            for encoding in encodings:
+                full, steady, enc_us, dec_us = run(args, churn, content_type, encoding)
+                baseline = baseline or steady
+                print(f"{content_type:<24} {encoding or '-':<8} | {full:>9,} {steady:>9,.0f} | {enc_us:>9,.0f} {dec_us:>9,.0f}"
+                      f"  ({steady / baseline:.1%} of JSON)", flush=True)
+    if not wire.msgpack: print("[*] msgpack not installed: compact JSON only")
+    if not wire.zstandard: print("[*] zstandard not installed: no zstd rows")
+
+if __name__ == "__main__":
+    main()
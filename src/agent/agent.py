@@ -1,215 +1,305 @@
-import subprocess
 import threading
 import json
 import time
 import os
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from kubernetes import client, config
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from common.sketch import LatencySketch, bucket_index
+from common.kube_cache import Informer, object_key
+from common.wire import WireEncoder
+from cgroups import CgroupResolver
+from counters import ServiceCounters, EdgeCounters
+from ipmap import ServiceIpMap
+from sensors import make_sensor, response_class
+from telemetry import Telemetry, AdaptiveSampler
 
 TARGET_NAMESPACE = os.getenv("TARGET_NAMESPACE", "default")
 MY_PID = os.getpid()
 
-print(f"[*] Unified Agent - Namespace: {TARGET_NAMESPACE}", flush=True)
+# "aggregate": latency is bucketed into per-cgroup histograms inside the kernel
+#              and drained every FLUSH_INTERVAL seconds (cost ~ number of services)
+# "events":    one printf per HTTP request (cost ~ number of requests)
+AGENT_MODE = os.getenv("AGENT_MODE", "aggregate")
+FLUSH_INTERVAL = int(os.getenv("FLUSH_INTERVAL", "1"))
+# "bpftrace" (text), "ringbuf" (BCC, binary records) or "replay" (REPLAY_FILE, no kernel needed)
+SENSOR_BACKEND = os.getenv("SENSOR_BACKEND", "bpftrace")
+REPLAY_FILE = os.getenv("REPLAY_FILE", "")
+# Cap on the agent's own CPU (cores, e.g. 0.2); above it per-request events are sampled. 0 = off
+CPU_BUDGET = float(os.getenv("CPU_BUDGET", "0"))
+CGROUP_ROOT = "/sys/fs/cgroup"
 
-METRICS_STORE = {}
+print(f"[*] Unified Agent - Namespace: {TARGET_NAMESPACE} | Mode: {AGENT_MODE} | Sensor: {SENSOR_BACKEND}", flush=True)
+
+METRICS_STORE = ServiceCounters()
 TOPOLOGY_STORE = {}
+# Per-edge call counters and the last time each edge was used (connect or traffic)
+EDGE_STORE = EdgeCounters()
+EDGE_SEEN = {}
 IP_TO_SVC = {}
-UID_TO_SVC = {}
-CGROUP_TO_SVC = {}
-LAST_SCRAPE_TIME = time.time()
+# IP_TO_SVC's IPv4 half, mirrored into the kernel so connect() is resolved there (ringbuf sensor)
+KERNEL_IPS = ServiceIpMap()
+# Destinations already reported as unmapped, so each one is logged once
+UNMAPPED_SEEN = set()
+RESOLVER = CgroupResolver(CGROUP_ROOT, rescan_interval=FLUSH_INTERVAL)
+# Cumulative request-correlation counters reported by the sensor (dropped, unmatched, ...)
+SENSOR_STATS = {}
+AGENT_START = time.time()
+TELEMETRY = Telemetry()
+SAMPLER = AdaptiveSampler(CPU_BUDGET) if CPU_BUDGET > 0 else None
+# Compact/delta scrape responses for aggregators that ask (see common/wire.py)
+WIRE = WireEncoder(AGENT_START)
 
 def get_k8s_client():
+    # Imported here: the sensing pipeline runs without a cluster (bench/agent_replay.py)
+    from kubernetes import client, config
     try: config.load_incluster_config()
     except: config.load_kube_config()
     return client.CoreV1Api()
 
-def k8s_metadata_updater():
-    global IP_TO_SVC, UID_TO_SVC
+# IP -> object key that owns it, so a late DELETE can't unmap an IP already reused by another object
+IP_OWNER = {}
+
+def map_ip(ip, app, key):
+    IP_TO_SVC[ip] = app
+    IP_OWNER[ip] = key
+    KERNEL_IPS.set(ip, app)
+
+def unmap_ip(ip, key):
+    if IP_OWNER.get(ip) == key:
+        IP_TO_SVC.pop(ip, None)
+        IP_OWNER.pop(ip, None)
+        KERNEL_IPS.remove(ip)
+
+def on_pod_event(event_type, pod, old):
+    key = object_key(pod)
+    # 1. Drop whatever the previous version of this pod contributed
+    if old is not None:
+        if old.status.pod_ip: unmap_ip(old.status.pod_ip, key)
+        if old.metadata.uid: RESOLVER.remove_pod(old.metadata.uid)
+    if event_type == "DELETED": return
+
+    # 2. Map Pod IPs & UIDs
+    app = (pod.metadata.labels or {}).get("app")
+    if not app: return
+    if pod.status.pod_ip: map_ip(pod.status.pod_ip, app, key)
+    if pod.metadata.uid: RESOLVER.add_pod(pod.metadata.uid, app)
+
+def on_service_event(event_type, svc, old):
+    key = object_key(svc)
+    if old is not None and old.spec.cluster_ip: unmap_ip(old.spec.cluster_ip, key)
+    if event_type == "DELETED": return
+
+    # FALLBACK: If no 'app' label, use the Service Name!
+    # This fixes the "UNMAPPED: 172.20.130.122" issue
+    app = (svc.metadata.labels or {}).get("app") or svc.metadata.name
+    if svc.spec.cluster_ip and svc.spec.cluster_ip != "None":
+        map_ip(svc.spec.cluster_ip, app, key)
+
+def start_metadata_cache():
+    # List+watch instead of relisting every 2s. Pods that stop running leave the
+    # field selector and arrive as DELETED, which releases their IP.
     v1 = get_k8s_client()
-    while True:
-        try:
-            new_ip_map = {}
-            new_uid_map = {}
-            pods = v1.list_namespaced_pod(TARGET_NAMESPACE)
-            
-            # 1. Map Pod IPs & UIDs
-            for pod in pods.items:
-                if not pod.metadata.labels: continue
-                app = pod.metadata.labels.get("app")
-                if not app: continue
-                
-                if pod.status.pod_ip: 
-                    new_ip_map[pod.status.pod_ip] = app
-                
-                if pod.metadata.uid:
-                    uid = pod.metadata.uid
-                    new_uid_map[uid] = app
-                    new_uid_map[uid.replace("-", "_")] = app
-                    new_uid_map[uid.replace("-", "")] = app
-            
-            # 2. Map Service ClusterIPs (THE FIX IS HERE)
-            services = v1.list_namespaced_service(TARGET_NAMESPACE)
-            for svc in services.items:
-                app = None
-                
-                # Try to get 'app' label
-                if svc.metadata.labels:
-                    app = svc.metadata.labels.get("app")
-                
-                # FALLBACK: If no label, use the Service Name!
-                # This fixes the "UNMAPPED: 172.20.130.122" issue
-                if not app: 
-                    app = svc.metadata.name 
-                
-                if svc.spec.cluster_ip and svc.spec.cluster_ip != "None":
-                    new_ip_map[svc.spec.cluster_ip] = app
-            
-            IP_TO_SVC = new_ip_map
-            UID_TO_SVC = new_uid_map
-
-        except Exception as e:
-            print(f"K8s Error: {e}")
-        time.sleep(2) 
-
-def get_service_from_pid(pid):
-    if pid in CGROUP_TO_SVC: return CGROUP_TO_SVC[pid]
-    try:
-        with open(f"/proc/{pid}/cgroup", "r") as f: content = f.read()
-        for uid, app in UID_TO_SVC.items():
-            if uid.lower() in content.lower():
-                CGROUP_TO_SVC[pid] = app
-                return app
-    except: pass
-    return None
+    pods = Informer(v1.list_namespaced_pod, TARGET_NAMESPACE, field_selector="status.phase=Running")
+    pods.add_handler(on_pod_event)
+    services = Informer(v1.list_namespaced_service, TARGET_NAMESPACE)
+    services.add_handler(on_service_event)
+    pods.start()
+    services.start()
+    return pods, services
+
+def record_latency(svc, sum_us, count, buckets):
+    METRICS_STORE.record(svc, sum_us, count, buckets)
 
 class MetricsHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the aggregator reuses one connection per agent across rounds
+    protocol_version = "HTTP/1.1"
+    timeout = 60
+
     def do_GET(self):
-        global LAST_SCRAPE_TIME
+        if self.path.split("?")[0] == "/telemetry":
+            body, content_type, encoding = json.dumps(self.telemetry()).encode(), "application/json", None
+        else:
+            start = time.perf_counter()
+            body, content_type, encoding = WIRE.encode(self.collect(), self.headers.get("Accept", ""),
+                                                       self.headers.get("Accept-Encoding", ""), self.headers.get("X-Wire-Ack"))
+            TELEMETRY.add_time("encode", time.perf_counter() - start)
+            TELEMETRY.add("scrape_bytes", len(body))
         self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', content_type)
+        if encoding: self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
+        self.wfile.write(body)
 
-        current_time = time.time()
-        time_delta = current_time - LAST_SCRAPE_TIME
-        if time_delta < 1: time_delta = 1 
-
+    def collect(self):
+        # Cumulative since AGENT_START and never reset: reading is side-effect free,
+        # consumers diff consecutive readings to get rates (a changed agent_start means restart).
         final_data = {
+            "agent_start": AGENT_START,
+            "timestamp": time.time(),
             "metrics": {},
-            "topology": {k: list(v) for k, v in TOPOLOGY_STORE.items()}
+            "topology": {k: list(v) for k, v in list(TOPOLOGY_STORE.items())},
+            "edges": self.collect_edges(),
+            "sensor": dict(SENSOR_STATS)
         }
-        
-        for svc, data in METRICS_STORE.items():
-            count = data["count"]
-            if count > 0:
-                avg_latency_ms = round((data["sum_us"] / count) / 1000.0, 3)
-                rps = round(count / time_delta, 2)
-                error_rate = round(data["errors"] / time_delta, 2)
-                
-                final_data["metrics"][svc] = {
-                    "latency": avg_latency_ms,
-                    "rps": rps,
-                    "error_rate": error_rate,
-                    "count": count
-                }
-                data["errors"] = 0 
-                data["sum_us"] = 0
-                data["count"] = 0
-
-        LAST_SCRAPE_TIME = current_time
-        self.wfile.write(json.dumps(final_data).encode())
-    def log_message(self, format, *args): return
+        for svc, data in METRICS_STORE.snapshot().items():
+            final_data["metrics"][svc] = {
+                "count": data["count"],
+                "sum_us": data["sum_us"],
+                "errors": data["errors"],
+                "responses": data["responses"],
+                "sketch": LatencySketch(data["buckets"]).to_wire()
+            }
+        return final_data
 
-def run_agent():
-    # BPF Code (IPv4 + IPv6 support)
-    BPF_CODE = """
-    #include <linux/in.h>
-    #include <linux/in6.h>
-
-    tracepoint:syscalls:sys_enter_read { @buf_ptr[tid] = args->buf; }
-    tracepoint:syscalls:sys_enter_recvfrom { @buf_ptr[tid] = args->ubuf; }
-    
-    tracepoint:syscalls:sys_exit_read, tracepoint:syscalls:sys_exit_recvfrom {
-        if (@buf_ptr[tid] != 0 && args->ret > 4) {
-             $first4 = *(uint32 *)@buf_ptr[tid];
-             if ($first4 == 0x20544547 || $first4 == 0x54534F50) {
-                  @start[tid] = nsecs;
-             }
-        }
-        delete(@buf_ptr[tid]);
-    }    
-    
-    tracepoint:syscalls:sys_enter_write, tracepoint:syscalls:sys_enter_sendto {
-        if (@start[tid] != 0) {
-            $delta_us = (nsecs - @start[tid]) / 1000;
-            if ($delta_us > 0) { printf("LAT %d %d\\n", pid, $delta_us); }
-            delete(@start[tid]);
-        }
-    }
-    
-    tracepoint:syscalls:sys_enter_connect {
-        $addr = (struct sockaddr *)args->uservaddr;
-        if ($addr->sa_family == 2) {
-            $addr4 = (struct sockaddr_in *)args->uservaddr;
-            printf("CONN %d %s\\n", pid, ntop($addr4->sin_addr.s_addr));
-        }
-        if ($addr->sa_family == 10) {
-            $addr6 = (struct sockaddr_in6 *)args->uservaddr;
-            printf("CONN %d %s\\n", pid, ntop($addr6->sin6_addr.in6_u.u6_addr8));
+    def collect_edges(self):
+        counters = EDGE_STORE.snapshot()
+        empty = {"count": 0, "sum_us": 0, "errors": 0, "bytes": 0}
+        return [{"src": src, "dst": dst, **counters.get((src, dst), empty), "last_seen": seen}
+                for (src, dst), seen in list(EDGE_SEEN.items())]
+
+    def telemetry(self):
+        """What the agent itself handled, lost and cost (counters cumulative, rates per second)."""
+        return {
+            "agent_start": AGENT_START,
+            "timestamp": time.time(),
+            "mode": AGENT_MODE,
+            "sensor_backend": SENSOR_BACKEND,
+            **TELEMETRY.snapshot(),
+            "sensor": dict(SENSOR_STATS),
+            "resolver": RESOLVER.stats(),
+            "sampling": {"every": SAMPLER.every if SAMPLER else 1, "cpu_budget": CPU_BUDGET},
+            "stores": {"services": len(METRICS_STORE.snapshot()), "edges": len(EDGE_SEEN), "ips": len(IP_TO_SVC)},
+            "kernel_ips": KERNEL_IPS.stats()
         }
-    }
-    """
-    with open("sensor.bt", "w") as f: f.write(BPF_CODE)
-    
-    process = subprocess.Popen(["bpftrace", "sensor.bt"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
-    print("[*] Unified Sensor Running...", flush=True)
 
-    def log_stderr():
-        for line in process.stderr: print(f"BPF ERROR: {line.strip()}", flush=True)
-    threading.Thread(target=log_stderr, daemon=True).start()
+    def log_message(self, format, *args): return
+
+# --- SENSOR SINK: called by the sensor backend (see sensors.py) ---
+def on_histogram(hist, sums):
+    for cgid, buckets in hist.items():
+        svc = RESOLVER.resolve(cgid)
+        if not svc: continue
+        record_latency(svc, sums.get(cgid, 0), sum(buckets.values()), buckets)
+
+def on_responses(codes):
+    for cgid, counts in codes.items():
+        svc = RESOLVER.resolve(cgid)
+        if not svc: continue
+        classes = {}
+        for code, n in counts.items():
+            cls = response_class(code)
+            classes[cls] = classes.get(cls, 0) + n
+        METRICS_STORE.record_responses(svc, classes)
+
+def on_latency(cgid, pid, lat_us, status=0, weight=1):
+    if pid == MY_PID: return
+    svc = RESOLVER.resolve(cgid)
+    if not svc: return
+    record_latency(svc, lat_us * weight, weight, {bucket_index(lat_us): weight})
+    if status: METRICS_STORE.record_responses(svc, {response_class(status // 100): weight})
+
+def link(svc, dest_svc, now, via=""):
+    """Record that svc called dest_svc; logged the first time."""
+    if svc == dest_svc: return
+    dests = TOPOLOGY_STORE.setdefault(svc, set())
+    if dest_svc not in dests:
+        dests.add(dest_svc)
+        print(f"🔗 NEW LINK: {svc} -> {dest_svc}{f' ({via})' if via else ''}", flush=True)
+    EDGE_SEEN[(svc, dest_svc)] = now
+
+def on_connect(cgid, pid, dest_ip):
+    if pid == MY_PID: return
+    svc = RESOLVER.resolve(cgid)
+    if not svc: return
+    if dest_ip.startswith("::ffff:"): dest_ip = dest_ip.replace("::ffff:", "")
+    dest_svc = IP_TO_SVC.get(dest_ip)
+
+    if dest_svc: link(svc, dest_svc, time.time(), dest_ip)
+    elif not dest_ip.startswith("127.") and not dest_ip.startswith("0.0."):
+        unmapped(svc, dest_ip)
+        on_sensor_stats({"conn_unmapped": 1})
 
+def unmapped(svc, dest_ip):
+    """Log an outbound IP no service owns, once per (svc, IP)."""
+    if (svc, dest_ip) in UNMAPPED_SEEN: return
+    if len(UNMAPPED_SEEN) > 4096: UNMAPPED_SEEN.clear()
+    UNMAPPED_SEEN.add((svc, dest_ip))
+    print(f"❓ UNMAPPED: {svc} -> {dest_ip}", flush=True)
+
+def on_connects(counts):
+    """connect() counts per (cgroup, destination IP), drained from the kernel every interval."""
+    now = time.time()
+    missed = 0
+    for (cgid, dest_ip), n in counts.items():
+        dest_svc = IP_TO_SVC.get(dest_ip)
+        svc = RESOLVER.resolve(cgid)
+        if not dest_svc:
+            # Same counter the ring buffer sensor keeps in kernel (loopback is never drained)
+            missed += n
+            if svc: unmapped(svc, dest_ip)
+        elif svc: link(svc, dest_svc, now, dest_ip)
+    if missed: on_sensor_stats({"conn_unmapped": missed})
+    TELEMETRY.add("connects", sum(counts.values()))
+
+def on_service_connects(counts):
+    """Same, with the destination already resolved in kernel: only keeps the edges alive."""
+    now = time.time()
+    for (cgid, dest_svc), n in counts.items():
+        svc = RESOLVER.resolve(cgid)
+        if svc: link(svc, dest_svc, now)
+    TELEMETRY.add("connects", sum(counts.values()))
+
+def on_edges(edges):
+    now = time.time()
+    for (cgid, dest_ip), (count, sum_us, errors, nbytes) in edges.items():
+        svc = RESOLVER.resolve(cgid)
+        dest_svc = IP_TO_SVC.get(dest_ip)
+        if not svc or not dest_svc or svc == dest_svc: continue
+        EDGE_STORE.record(svc, dest_svc, count, sum_us, errors, nbytes)
+        EDGE_SEEN[(svc, dest_svc)] = now
+        TOPOLOGY_STORE.setdefault(svc, set()).add(dest_svc)
+
+def on_sensor_stats(delta):
+    for name, n in delta.items():
+        SENSOR_STATS[name] = SENSOR_STATS.get(name, 0) + n
+    if delta.get("dropped") or delta.get("unmatched"):
+        print(f"⚠️ Correlation: {delta.get('dropped', 0)} dropped, {delta.get('unmatched', 0)} unmatched", flush=True)
+
+class Sink:
+    histogram = staticmethod(on_histogram)
+    latency = staticmethod(on_latency)
+    responses = staticmethod(on_responses)
+    connect = staticmethod(on_connect)
+    connects = staticmethod(on_connects)
+    service_connects = staticmethod(on_service_connects)
+    edges = staticmethod(on_edges)
+    cgroup_removed = staticmethod(RESOLVER.forget)
+    sensor_stats = staticmethod(on_sensor_stats)
+
+def watch_overhead():
+    """Once a second: refresh telemetry rates and adjust sampling to the CPU budget."""
     while True:
-        line = process.stdout.readline()
-        if not line: break
-        try:
-            parts = line.split()
-            if len(parts) < 3: continue
-            event = parts[0]
-            pid = int(parts[1])
-            
-            if pid == MY_PID: continue
-            svc = get_service_from_pid(pid)
-            
-            if event == "CONN":
-                dest_ip = parts[2]
-                if dest_ip.startswith("::ffff:"): dest_ip = dest_ip.replace("::ffff:", "")
-                dest_svc = IP_TO_SVC.get(dest_ip)
-                
-                if svc:
-                    if dest_svc:
-                        if svc != dest_svc:
-                            if svc not in TOPOLOGY_STORE: TOPOLOGY_STORE[svc] = set()
-                            TOPOLOGY_STORE[svc].add(dest_svc)
-                            print(f"🔗 NEW LINK: {svc} -> {dest_svc} ({dest_ip})", flush=True)
-                    else:
-                        # Log unmapped IPs (excluding localhost/DNS usually)
-                        if not dest_ip.startswith("127.") and not dest_ip.startswith("0.0."):
-                            print(f"❓ UNMAPPED: {svc} -> {dest_ip}", flush=True)
-
-            if not svc: continue
-            
-            if event == "LAT":
-                lat_us = int(parts[2])
-                if svc not in METRICS_STORE: METRICS_STORE[svc] = {"sum_us": 0, "count": 0, "errors": 0}
-                METRICS_STORE[svc]["sum_us"] += lat_us
-                METRICS_STORE[svc]["count"] += 1
-                print(f"✅ {svc}: {lat_us/1000}ms", flush=True)
-            
-        except Exception as e:
-            pass
+        time.sleep(1)
+        TELEMETRY.tick()
+        # Only the agent's own CPU: that is what sampling can bring down
+        cpu = TELEMETRY.cpu["agent"]
+        if SAMPLER is not None and SAMPLER.update(cpu):
+            print(f"🎚️ Sampling 1 in {SAMPLER.every} requests (agent CPU {cpu:.0%} of a core, budget {CPU_BUDGET:.0%})", flush=True)
+        if TELEMETRY.rates.get("lost_per_s") or TELEMETRY.rates.get("overflow_per_s"):
+            print(f"⚠️ Sensor losing events: {TELEMETRY.rates.get('lost_per_s', 0)}/s lost by bpftrace, "
+                  f"{TELEMETRY.rates.get('overflow_per_s', 0)}/s batch overflow", flush=True)
+
+def run_agent():
+    RESOLVER.scan()
+    sensor = make_sensor(SENSOR_BACKEND, Sink, aggregate=AGENT_MODE == "aggregate",
+                         flush_interval=FLUSH_INTERVAL, my_pid=MY_PID, replay_file=REPLAY_FILE,
+                         telemetry=TELEMETRY, sampler=SAMPLER, ip_map=KERNEL_IPS)
+    sensor.run()
 
 def main():
-    threading.Thread(target=k8s_metadata_updater, daemon=True).start()
-    threading.Thread(target=lambda: HTTPServer(('0.0.0.0', 5000), MetricsHandler).serve_forever(), daemon=True).start()
+    start_metadata_cache()
+    threading.Thread(target=lambda: ThreadingHTTPServer(('0.0.0.0', 5000), MetricsHandler).serve_forever(), daemon=True).start()
+    threading.Thread(target=watch_overhead, daemon=True).start()
     run_agent()
 
 if __name__ == "__main__":
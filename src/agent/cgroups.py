@@ -0,0 +1,80 @@
+import os
+import re
+import time
+
+# Pod directories look like ".../kubepods-burstable-pod<uid_with_underscores>.slice" (systemd
+# driver) or ".../kubepods/burstable/pod<uid>/" (cgroupfs driver). Container cgroups live below.
+POD_UID_RE = re.compile(r"pod([0-9a-f]{8}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{12})", re.IGNORECASE)
+
+def normalize_uid(uid):
+    return uid.lower().replace("_", "-")
+
+class CgroupResolver:
+    """
+    cgroup id -> service, in two hash lookups: cgroup id -> pod UID -> app label.
+
+    The cgroup id emitted by BPF is the inode of the cgroup v2 directory, so the first
+    index is built by walking the cgroup tree once and parsing the pod UID out of each path.
+    The second index is updated incrementally from the pod watch.
+    """
+
+    def __init__(self, root="/sys/fs/cgroup", rescan_interval=1.0, negative_ttl=30.0):
+        self.root = root
+        self.rescan_interval = rescan_interval
+        self.negative_ttl = negative_ttl
+        self.cgid_to_uid = {}
+        self.uid_to_svc = {}
+        self.unknown = {}  # cgid -> time a fresh scan last failed to find it (host processes)
+        self.last_scan = 0
+        self.hits = self.misses = self.scans = 0
+
+    def add_pod(self, uid, app):
+        self.uid_to_svc[normalize_uid(uid)] = app
+
+    def remove_pod(self, uid):
+        self.uid_to_svc.pop(normalize_uid(uid), None)
+
+    def scan(self):
+        new_map = {}
+        for root, dirs, _ in os.walk(self.root):
+            for d in dirs:
+                match = POD_UID_RE.search(d) or POD_UID_RE.search(root)
+                if not match: continue
+                try: new_map[os.stat(os.path.join(root, d)).st_ino] = normalize_uid(match.group(1))
+                except OSError: pass
+        self.cgid_to_uid = new_map
+        self.last_scan = time.time()
+        self.scans += 1
+        self.unknown = {c: t for c, t in self.unknown.items() if self.last_scan - t < self.negative_ttl}
+
+    def resolve(self, cgid):
+        svc = self._resolve(cgid)
+        if svc is None: self.misses += 1
+        else: self.hits += 1
+        return svc
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "scans": self.scans, "cgroups": len(self.cgid_to_uid), "pods": len(self.uid_to_svc),
+                "negative": len(self.unknown)}
+
+    def _resolve(self, cgid):
+        uid = self.cgid_to_uid.get(cgid)
+        if uid is None:
+            # New pod since the last walk? Rescan, but no more than once per interval,
+            # and remember misses so host processes don't trigger a walk every time.
+            now = time.time()
+            if now - self.unknown.get(cgid, 0) < self.negative_ttl: return None
+            if now - self.last_scan < self.rescan_interval: return None
+            self.scan()
+            uid = self.cgid_to_uid.get(cgid)
+            if uid is None:
+                self.unknown[cgid] = now
+                return None
+        return self.uid_to_svc.get(uid)
+
+    def forget(self, cgid):
+        # cgroup_rmdir: the inode may be reused by a future cgroup
+        self.cgid_to_uid.pop(cgid, None)
+        self.unknown.pop(cgid, None)
@@ -0,0 +1,100 @@
+import threading
+
+# Response classes that count as errors: server failures and requests that never got an answer
+ERROR_CLASSES = ("5xx", "timeout", "reset")
+
+class ShardedCounters:
+    """Every writer thread accumulates into its own shard, so the hot path takes no lock."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.shards_lock: self.shards.append(shard)
+        return shard
+
+    def _shards(self):
+        with self.shards_lock: return list(self.shards)
+
+class ServiceCounters(ShardedCounters):
+    """
+    Monotonic per-service counters (count, latency sum, errors, histogram buckets,
+    responses by class: 2xx/4xx/5xx/timeout/reset).
+
+    Readers sum the shards. Nothing is ever reset: scrapers diff two readings, so any
+    number of them can scrape without stealing each other's data.
+    """
+
+    def _entry(self, svc):
+        shard = self._shard()
+        entry = shard.get(svc)
+        if entry is None: entry = shard[svc] = {"count": 0, "sum_us": 0, "errors": 0, "buckets": {}, "responses": {}}
+        return entry
+
+    def record(self, svc, sum_us, count, buckets):
+        entry = self._entry(svc)
+        entry["sum_us"] += sum_us
+        entry["count"] += count
+        hist = entry["buckets"]
+        for idx, n in buckets.items():
+            hist[idx] = hist.get(idx, 0) + n
+
+    def record_errors(self, svc, n=1):
+        self._entry(svc)["errors"] += n
+
+    def record_responses(self, svc, classes):
+        """classes: {"2xx": n, "5xx": n, "timeout": n, ...}"""
+        responses = self._entry(svc)["responses"]
+        for cls, n in classes.items():
+            responses[cls] = responses.get(cls, 0) + n
+        errors = sum(classes.get(cls, 0) for cls in ERROR_CLASSES)
+        if errors: self.record_errors(svc, errors)
+
+    def snapshot(self):
+        """{svc: {count, sum_us, errors, buckets, responses}} summed over all shards."""
+        out = {}
+        for shard in self._shards():
+            # list()/dict() copies run without releasing the GIL, so they can't see a
+            # half-inserted key; a reading may lag the writer by one event at most.
+            for svc, entry in list(shard.items()):
+                acc = out.get(svc)
+                if acc is None: acc = out[svc] = {"count": 0, "sum_us": 0, "errors": 0, "buckets": {}, "responses": {}}
+                acc["count"] += entry["count"]
+                acc["sum_us"] += entry["sum_us"]
+                acc["errors"] += entry["errors"]
+                for idx, n in dict(entry["buckets"]).items():
+                    acc["buckets"][idx] = acc["buckets"].get(idx, 0) + n
+                for cls, n in dict(entry["responses"]).items():
+                    acc["responses"][cls] = acc["responses"].get(cls, 0) + n
+        return out
+
+class EdgeCounters(ShardedCounters):
+    """Monotonic per-edge (src svc, dst svc) call counters: count, latency sum, errors, bytes."""
+
+    def record(self, src, dst, count, sum_us, errors, nbytes):
+        shard = self._shard()
+        entry = shard.get((src, dst))
+        if entry is None: entry = shard[(src, dst)] = [0, 0, 0, 0]
+        entry[0] += count
+        entry[1] += sum_us
+        entry[2] += errors
+        entry[3] += nbytes
+
+    def snapshot(self):
+        """{(src, dst): {count, sum_us, errors, bytes}} summed over all shards."""
+        out = {}
+        for shard in self._shards():
+            for edge, entry in list(shard.items()):
+                acc = out.get(edge)
+                if acc is None: acc = out[edge] = {"count": 0, "sum_us": 0, "errors": 0, "bytes": 0}
+                count, sum_us, errors, nbytes = entry
+                acc["count"] += count
+                acc["sum_us"] += sum_us
+                acc["errors"] += errors
+                acc["bytes"] += nbytes
+        return out
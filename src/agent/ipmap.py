@@ -0,0 +1,66 @@
+import socket
+import struct
+import threading
+
+def ipv4_key(ip):
+    """The u32 BPF reads from sin_addr.s_addr (network byte order, read as little-endian)."""
+    return struct.unpack("<I", socket.inet_aton(ip))[0]
+
+class ServiceIpMap:
+    """
+    IPv4 -> service, mirrored into a BPF hash so connect() can be resolved in kernel.
+
+    Kept current from the pod/service watch. Services are interned to ids that never
+    change for the agent's lifetime: the kernel's seen-edge map is keyed on them, so an
+    IP that moves to another service shows up as a new edge. Mappings made before the
+    BPF program is loaded are written when it attaches.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ips = {}
+        self.ids = {}
+        self.names = []
+        self.table = None
+        self.updates = self.failures = 0
+
+    def service_id(self, svc):
+        sid = self.ids.get(svc)
+        if sid is None:
+            sid = self.ids[svc] = len(self.names)
+            self.names.append(svc)
+        return sid
+
+    def name(self, sid):
+        return self.names[sid] if 0 <= sid < len(self.names) else None
+
+    def set(self, ip, svc):
+        try: key = ipv4_key(ip)
+        except OSError: return  # IPv6: resolved in userspace
+        with self.lock:
+            self.ips[ip] = svc
+            if self.table is not None: self._write(key, self.service_id(svc))
+
+    def remove(self, ip):
+        with self.lock:
+            if self.ips.pop(ip, None) is None or self.table is None: return
+            try: del self.table[self.table.Key(ipv4_key(ip))]
+            except KeyError: pass
+
+    def attach(self, table):
+        """Load every known mapping into `table` (a BCC hash u32 -> u32), then write through."""
+        with self.lock:
+            self.table = table
+            for ip, svc in self.ips.items(): self._write(ipv4_key(ip), self.service_id(svc))
+
+    def _write(self, key, sid):
+        try:
+            self.table[self.table.Key(key)] = self.table.Leaf(sid)
+            self.updates += 1
+        except Exception:
+            # Map full: those connects stay unmapped until an entry is freed
+            self.failures += 1
+
+    def stats(self):
+        return {"ips": len(self.ips), "services": len(self.names), "updates": self.updates,
+                "failures": self.failures, "attached": self.table is not None}
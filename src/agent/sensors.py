@@ -0,0 +1,1047 @@
+import ctypes
+import os
+import random
+import socket
+import struct
+import subprocess
+import threading
+import time
+from common.sketch import bucket_index
+from telemetry import Telemetry
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Sensor backends. Each one turns kernel activity into calls on a sink:
+#
+#   sink.histogram({cgid: {bucket: n}}, {cgid: sum_us})   latency, pre-bucketed
+#   sink.responses({cgid: {code: n}})                      outcomes, see response_class()
+#   sink.latency(cgid, pid, lat_us, status, weight)        latency + HTTP status, one request
+#                                                          (standing for `weight` when sampled)
+#   sink.connect(cgid, pid, dest_ip)                       outbound connect(): first one on an edge
+#                                                          (ringbuf), IPv6, or before the IP map is loaded
+#   sink.connects({(cgid, dest_ip): n})                    connect() counts drained from the kernel
+#   sink.service_connects({(cgid, svc): n})                same, destination already resolved in kernel
+#   sink.edges({(cgid, dest_ip): (count, sum_us, errors, bytes)})  client-side calls per edge
+#   sink.cgroup_removed(cgid)                              cgroup_rmdir
+#   sink.sensor_stats({"dropped": n, "unmatched": n})      correlation counters (deltas)
+#
+# "bpftrace": text program, compiled by bpftrace at start-up, stdout parsed line by line.
+# "ringbuf":  BCC program writing fixed-layout binary records to a BPF ring buffer.
+# "replay":   feeds a recorded file (text lines or binary records) through the same
+#             decoders, so both paths can be benchmarked without a kernel.
+#
+# Every backend also reports on itself to a telemetry.Telemetry (events, decode time,
+# losses, map occupancy) and, given an AdaptiveSampler, keeps only 1 in sampler.every
+# per-request events, weighted so that counts scale back up.
+
+# Response outcome codes: HTTP status class (2 = 2xx ...) or a negated errno
+RESPONSE_ERRNO = {110: "timeout", 104: "reset", 32: "reset"}
+
+def response_class(code):
+    if code < 0: return RESPONSE_ERRNO.get(-code, "reset")
+    return f"{code}xx"
+
+# =============================================================================
+# bpftrace (text)
+# =============================================================================
+
+# Emitted at the end of a request. $delta_us holds the latency, $status the HTTP status code.
+EMIT_EVENTS = """
+            if ($delta_us > 0) { printf("LAT %d %d %d %d\\n", cgroup, pid, $delta_us, $status); }
+"""
+
+# Log-linear bucket index: 4 linear sub-buckets per power of two (see common/sketch.py)
+EMIT_AGGREGATE = """
+            if ($delta_us > 0 && pid != __MY_PID__) {
+                $v = $delta_us; $b = 0;
+                if ($v >= 65536) { $v = $v >> 16; $b = $b + 16; }
+                if ($v >= 256) { $v = $v >> 8; $b = $b + 8; }
+                if ($v >= 16) { $v = $v >> 4; $b = $b + 4; }
+                if ($v >= 4) { $v = $v >> 2; $b = $b + 2; }
+                if ($v >= 2) { $b = $b + 1; }
+                $idx = $delta_us;
+                if ($b >= 2) { $idx = 4 * $b - 8 + ($delta_us >> ($b - 2)); }
+                @lat_hist[cgroup, $idx] = count();
+                @lat_sum[cgroup] = sum($delta_us);
+                @resp[cgroup, $status / 100] = count();
+            }
+"""
+
+# Emitted when a client reads the status line of a response on an outbound connection.
+# $edge_ip is the IPv4 destination as a u32 (network byte order), $edge_bytes both directions.
+EMIT_EDGE_EVENTS = """
+                printf("EDGE %d %d %d %d %d %d\\n", cgroup, pid, $edge_ip, $edge_us, $edge_status, $edge_bytes);
+"""
+
+EMIT_EDGE_AGGREGATE = """
+                if (pid != __MY_PID__) {
+                    @edge_n[cgroup, $edge_ip] = count();
+                    @edge_us[cgroup, $edge_ip] = sum($edge_us);
+                    @edge_bytes[cgroup, $edge_ip] = sum($edge_bytes);
+                    if ($edge_status >= 500) { @edge_err[cgroup, $edge_ip] = count(); }
+                }
+"""
+
+# Emitted when a read/write fails on a connection with a request in flight. $err holds the errno.
+EMIT_ERROR_EVENTS = """
+            if (pid != __MY_PID__) { printf("ERR %d %d %d\\n", cgroup, pid, $err); }
+"""
+
+EMIT_ERROR_AGGREGATE = """
+            if (pid != __MY_PID__) { @resp[cgroup, -$err] = count(); }
+"""
+
+DRAIN_AGGREGATE = """
+        print(@lat_hist); print(@lat_sum); print(@resp);
+        clear(@lat_hist); clear(@lat_sum); clear(@resp);
+        print(@edge_n); print(@edge_us); print(@edge_err); print(@edge_bytes);
+        clear(@edge_n); clear(@edge_us); clear(@edge_err); clear(@edge_bytes);
+"""
+
+# Every FLUSH_INTERVAL: correlation counters (and histograms in aggregate mode)
+DRAIN = """
+    interval:s:__FLUSH_INTERVAL__ {
+        __DRAIN_AGGREGATE__
+        print(@dropped); print(@unmatched); print(@conn);
+        clear(@dropped); clear(@unmatched); clear(@conn);
+        printf("FLUSH\\n");
+    }
+"""
+
+# Requests are correlated per connection, keyed on (pid, fd) rather than thread id:
+# Go moves goroutines between threads, and keep-alive/pipelined connections carry
+# several requests. Each request read gets a sequence number on its connection and
+# the N-th "HTTP/..." status line written back completes the N-th request.
+#   @dropped:   requests still in flight when their connection was closed
+#   @unmatched: status lines written on a server connection with nothing in flight
+# The status code is read from the status line ("HTTP/1.1 503 ..." -> bytes 9..11).
+# ETIMEDOUT (110), ECONNRESET (104) or EPIPE (32) on a connection with a request in
+# flight completes that request as a timeout/reset instead.
+#
+# The client side of every call is timed too, per (source cgroup, IPv4 destination):
+# connect() records the destination of the fd, the first request written on it starts
+# the clock and the status line read back stops it (one call in flight per connection).
+#
+# IPv4 connect()s are counted in kernel per (cgroup, destination) and drained every
+# interval instead of printed one by one; loopback and 0.0.0.0 are skipped outright.
+#
+# Per-(pid, fd) state is deleted on close(). A process that exits or execs without
+# closing is swept instead: @maxfd keeps the highest fd each process has state on, and
+# its fds up to that (at most MAX_FD_SWEEP) are cleared. Maps are sized explicitly
+# (BPFTRACE_MAP_KEYS), bpftrace's default of 4096 keys is reached by one busy node.
+#
+# Methods (little-endian first 4 bytes): "GET " "POST" "PUT " "DELE" "HEAD" "PATC"
+
+# BPF Code (IPv4 + IPv6 support)
+BPFTRACE_PROGRAM = """
+    #include <linux/in.h>
+    #include <linux/in6.h>
+
+    // --- Request side: read, recvfrom, readv, recvmsg ---
+    tracepoint:syscalls:sys_enter_read { @rbuf[tid] = args->buf; @rfd[tid] = args->fd; }
+    tracepoint:syscalls:sys_enter_recvfrom { @rbuf[tid] = args->ubuf; @rfd[tid] = args->fd; }
+    tracepoint:syscalls:sys_enter_readv { @rbuf[tid] = *(uint64 *)args->vec; @rfd[tid] = args->fd; }
+    // struct user_msghdr: msg_iov sits at offset 16
+    tracepoint:syscalls:sys_enter_recvmsg { @rbuf[tid] = *(uint64 *)*(uint64 *)(args->msg + 16); @rfd[tid] = args->fd; }
+
+    tracepoint:syscalls:sys_exit_read, tracepoint:syscalls:sys_exit_recvfrom,
+    tracepoint:syscalls:sys_exit_readv, tracepoint:syscalls:sys_exit_recvmsg {
+        if (@rbuf[tid] != 0 && (args->ret == -110 || args->ret == -104)) {
+            $fd = @rfd[tid];
+            $seq = @resp_seq[pid, $fd];
+            if ($seq < @req_seq[pid, $fd]) {
+                $err = -args->ret;
+                __EMIT_ERR__
+                delete(@start[pid, $fd, $seq]);
+                @resp_seq[pid, $fd] = $seq + 1;
+            }
+        }
+        // Client side: response read on an outbound connection
+        if (@rbuf[tid] != 0 && args->ret > 0 && @caddr[pid, @rfd[tid]] != 0) {
+            $fd = @rfd[tid];
+            @cbytes[pid, $fd] = @cbytes[pid, $fd] + args->ret;
+            if (@cstart[pid, $fd] != 0 && args->ret >= 12 && *(uint32 *)@rbuf[tid] == 0x50545448) {
+                $edge_us = (nsecs - @cstart[pid, $fd]) / 1000;
+                $edge_status = (*(uint8 *)(@rbuf[tid] + 9) - 48) * 100 + (*(uint8 *)(@rbuf[tid] + 10) - 48) * 10
+                               + (*(uint8 *)(@rbuf[tid] + 11) - 48);
+                $edge_ip = @caddr[pid, $fd];
+                $edge_bytes = @cbytes[pid, $fd];
+                __EMIT_EDGE__
+                delete(@cstart[pid, $fd]);
+                @cbytes[pid, $fd] = 0;
+            }
+        }
+        if (@rbuf[tid] != 0 && args->ret > 4) {
+             $first4 = *(uint32 *)@rbuf[tid];
+             if ($first4 == 0x20544547 || $first4 == 0x54534F50 || $first4 == 0x20545550 ||
+                 $first4 == 0x454C4544 || $first4 == 0x44414548 || $first4 == 0x43544150) {
+                  $fd = @rfd[tid];
+                  $seq = @req_seq[pid, $fd];
+                  @start[pid, $fd, $seq] = nsecs;
+                  @req_seq[pid, $fd] = $seq + 1;
+                  if ($fd > @maxfd[pid]) { @maxfd[pid] = $fd; }
+             }
+        }
+        delete(@rbuf[tid]);
+        delete(@rfd[tid]);
+    }
+
+    // --- Response side: write, sendto, writev, sendmsg (only on server connections that carried
+    //     a request, or outbound connections we saw connect) ---
+    tracepoint:syscalls:sys_enter_write { if (@req_seq[pid, args->fd] != 0 || @caddr[pid, args->fd] != 0) { @wbuf[tid] = args->buf; @wfd[tid] = args->fd; } }
+    tracepoint:syscalls:sys_enter_sendto { if (@req_seq[pid, args->fd] != 0 || @caddr[pid, args->fd] != 0) { @wbuf[tid] = args->buff; @wfd[tid] = args->fd; } }
+    tracepoint:syscalls:sys_enter_writev { if (@req_seq[pid, args->fd] != 0 || @caddr[pid, args->fd] != 0) { @wbuf[tid] = *(uint64 *)args->vec; @wfd[tid] = args->fd; } }
+    tracepoint:syscalls:sys_enter_sendmsg { if (@req_seq[pid, args->fd] != 0 || @caddr[pid, args->fd] != 0) { @wbuf[tid] = *(uint64 *)*(uint64 *)(args->msg + 16); @wfd[tid] = args->fd; } }
+
+    tracepoint:syscalls:sys_exit_write, tracepoint:syscalls:sys_exit_sendto,
+    tracepoint:syscalls:sys_exit_writev, tracepoint:syscalls:sys_exit_sendmsg {
+        // Client side: request written on an outbound connection
+        if (@wbuf[tid] != 0 && args->ret > 0 && @caddr[pid, @wfd[tid]] != 0) {
+            $fd = @wfd[tid];
+            @cbytes[pid, $fd] = @cbytes[pid, $fd] + args->ret;
+            if (@cstart[pid, $fd] == 0 && args->ret > 4) {
+                $first4 = *(uint32 *)@wbuf[tid];
+                if ($first4 == 0x20544547 || $first4 == 0x54534F50 || $first4 == 0x20545550 ||
+                    $first4 == 0x454C4544 || $first4 == 0x44414548 || $first4 == 0x43544150) {
+                    @cstart[pid, $fd] = nsecs;
+                }
+            }
+        }
+        if (@wbuf[tid] != 0 && (args->ret == -110 || args->ret == -104 || args->ret == -32)) {
+            $fd = @wfd[tid];
+            $seq = @resp_seq[pid, $fd];
+            if ($seq < @req_seq[pid, $fd]) {
+                $err = -args->ret;
+                __EMIT_ERR__
+                delete(@start[pid, $fd, $seq]);
+                @resp_seq[pid, $fd] = $seq + 1;
+            }
+        }
+        // Only the status line starts a response; body writes are ignored
+        if (@wbuf[tid] != 0 && args->ret >= 12 && *(uint32 *)@wbuf[tid] == 0x50545448) {
+            $fd = @wfd[tid];
+            $seq = @resp_seq[pid, $fd];
+            if ($seq < @req_seq[pid, $fd]) {
+                $delta_us = (nsecs - @start[pid, $fd, $seq]) / 1000;
+                $status = (*(uint8 *)(@wbuf[tid] + 9) - 48) * 100 + (*(uint8 *)(@wbuf[tid] + 10) - 48) * 10
+                          + (*(uint8 *)(@wbuf[tid] + 11) - 48);
+                __EMIT__
+                delete(@start[pid, $fd, $seq]);
+                @resp_seq[pid, $fd] = $seq + 1;
+            } else {
+                @unmatched = count();
+            }
+        }
+        delete(@wbuf[tid]);
+        delete(@wfd[tid]);
+    }
+
+    tracepoint:syscalls:sys_enter_close {
+        $req = @req_seq[pid, args->fd];
+        if ($req != 0) {
+            $resp = @resp_seq[pid, args->fd];
+            if ($req > $resp) {
+                @dropped = sum($req - $resp);
+                delete(@start[pid, args->fd, $resp]);
+            }
+            delete(@req_seq[pid, args->fd]);
+            delete(@resp_seq[pid, args->fd]);
+        }
+        if (@caddr[pid, args->fd] != 0) {
+            delete(@caddr[pid, args->fd]);
+            delete(@cstart[pid, args->fd]);
+            delete(@cbytes[pid, args->fd]);
+        }
+    }
+
+    tracepoint:syscalls:sys_enter_connect {
+        $addr = (struct sockaddr *)args->uservaddr;
+        if ($addr->sa_family == 2) {
+            $addr4 = (struct sockaddr_in *)args->uservaddr;
+            @caddr[pid, args->fd] = $addr4->sin_addr.s_addr;
+            if (args->fd > @maxfd[pid]) { @maxfd[pid] = args->fd; }
+            $first = $addr4->sin_addr.s_addr & 0xff;
+            if ($first != 127 && $first != 0) { @conn[cgroup, $addr4->sin_addr.s_addr] = count(); }
+        }
+        if ($addr->sa_family == 10) {
+            $addr6 = (struct sockaddr_in6 *)args->uservaddr;
+            printf("CONN %d %d %s\\n", cgroup, pid, ntop($addr6->sin6_addr.in6_u.u6_addr8));
+        }
+    }
+
+    // Invalidation: per-thread state dies with the thread, cgroup ids can be reused
+    tracepoint:sched:sched_process_exit {
+        delete(@rbuf[tid]);
+        delete(@rfd[tid]);
+        delete(@wbuf[tid]);
+        delete(@wfd[tid]);
+    }
+
+    // Per-connection state of a process that is gone (or replaced its image) without close()
+    tracepoint:sched:sched_process_exit /pid == tid/, tracepoint:sched:sched_process_exec {
+        $max = @maxfd[pid];
+        $fd = 0;
+        while ($fd <= $max && $fd < __MAX_FD_SWEEP__) {
+            if (@req_seq[pid, $fd] != 0) {
+                delete(@start[pid, $fd, @resp_seq[pid, $fd]]);
+                delete(@req_seq[pid, $fd]);
+                delete(@resp_seq[pid, $fd]);
+            }
+            if (@caddr[pid, $fd] != 0) {
+                delete(@caddr[pid, $fd]);
+                delete(@cstart[pid, $fd]);
+                delete(@cbytes[pid, $fd]);
+            }
+            $fd = $fd + 1;
+        }
+        delete(@maxfd[pid]);
+    }
+
+    tracepoint:cgroup:cgroup_rmdir {
+        printf("CGRM %d\\n", args->id);
+    }
+"""
+
+# Keys per bpftrace map, and how many fds of an exiting process are swept (bounded loop)
+BPFTRACE_MAP_KEYS = 65536
+MAX_FD_SWEEP = 1024
+
+def bpftrace_program(aggregate, flush_interval, my_pid):
+    program = BPFTRACE_PROGRAM.replace("__EMIT__", EMIT_AGGREGATE if aggregate else EMIT_EVENTS)
+    program = program.replace("__EMIT_ERR__", EMIT_ERROR_AGGREGATE if aggregate else EMIT_ERROR_EVENTS)
+    program = program.replace("__EMIT_EDGE__", EMIT_EDGE_AGGREGATE if aggregate else EMIT_EDGE_EVENTS)
+    program += DRAIN.replace("__DRAIN_AGGREGATE__", DRAIN_AGGREGATE if aggregate else "")
+    program = program.replace("__MAX_FD_SWEEP__", str(MAX_FD_SWEEP))
+    return program.replace("__FLUSH_INTERVAL__", str(flush_interval)).replace("__MY_PID__", str(my_pid))
+
+# Drained edge maps -> position in the (count, sum_us, errors, bytes) tuple
+EDGE_MAPS = {"@edge_n": 0, "@edge_us": 1, "@edge_err": 2, "@edge_bytes": 3}
+
+def format_ipv4(addr):
+    """u32 s_addr as printed by bpftrace/BCC (network byte order read as little-endian)."""
+    return socket.inet_ntoa(struct.pack("<I", addr))
+
+class BpftraceSensor:
+    def __init__(self, sink, aggregate=True, flush_interval=1, my_pid=0, telemetry=None, sampler=None):
+        self.sink = sink
+        self.program = bpftrace_program(aggregate, flush_interval, my_pid)
+        self.telemetry = telemetry or Telemetry()
+        # In aggregate mode userspace cost is per service, not per request: nothing to sample
+        self.sampler = None if aggregate else sampler
+
+    def run(self):
+        with open("sensor.bt", "w") as f: f.write(self.program)
+        # Map size: BPFTRACE_MAP_KEYS_MAX in older bpftrace, BPFTRACE_MAX_MAP_KEYS in newer ones
+        env = {**os.environ, "BPFTRACE_MAP_KEYS_MAX": str(BPFTRACE_MAP_KEYS), "BPFTRACE_MAX_MAP_KEYS": str(BPFTRACE_MAP_KEYS)}
+        process = subprocess.Popen(["bpftrace", "sensor.bt"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+                                   env=env)
+        self.telemetry.watch(process.pid)
+        print("[*] Unified Sensor Running (bpftrace)...", flush=True)
+
+        def log_stderr():
+            for line in process.stderr:
+                if self.telemetry.stderr_line(line): print(f"⚠️ BPF: {line.strip()}", flush=True)
+                else: print(f"BPF ERROR: {line.strip()}", flush=True)
+        threading.Thread(target=log_stderr, daemon=True).start()
+
+        self.consume(iter(process.stdout.readline, ""))
+
+    def consume(self, lines):
+        sink, telemetry, sampler = self.sink, self.telemetry, self.sampler
+        # Drained map entries, handed to the sink when FLUSH arrives
+        pending_hist = {}
+        pending_sum = {}
+        pending_resp = {}
+        pending_edges = {}  # (cgid, ip) -> [count, sum_us, errors, bytes]
+        pending_conns = {}  # (cgid, ip) -> connect() count
+        # Own counters, handed to telemetry on FLUSH instead of taking its lock per line
+        events = discarded = sampled_out = 0
+        parse_s = 0.0
+        every = 1
+
+        for line in lines:
+            # print(@map) ends every map with an empty line
+            if not line or line.isspace(): continue
+            start = time.perf_counter()
+            events += 1
+            try:
+                # Per-request lines (events mode): keep 1 in `every`, weighted
+                if every > 1 and line[0] in "LE" and (line.startswith("LAT") or line.startswith("EDGE")):
+                    if random.random() * every >= 1:
+                        sampled_out += 1
+                        continue
+                if line.startswith("@"):
+                    # @lat_hist[<cgroup>, <bucket>]: <count>  /  @lat_sum[<cgroup>]: <sum_us>
+                    name, _, rest = line.partition("[")
+                    keys, _, value = rest.partition("]: ")
+                    keys = keys.split(", ")
+                    if name == "@lat_hist":
+                        buckets = pending_hist.setdefault(int(keys[0]), {})
+                        buckets[int(keys[1])] = int(value)
+                    elif name == "@lat_sum":
+                        pending_sum[int(keys[0])] = int(value)
+                    elif name == "@resp":
+                        pending_resp.setdefault(int(keys[0]), {})[int(keys[1])] = int(value)
+                    elif name == "@conn":
+                        pending_conns[(int(keys[0]), format_ipv4(int(keys[1])))] = int(value)
+                    elif name in EDGE_MAPS:
+                        edge = pending_edges.setdefault((int(keys[0]), format_ipv4(int(keys[1]))), [0, 0, 0, 0])
+                        edge[EDGE_MAPS[name]] = int(value)
+                    elif name.startswith("@dropped") or name.startswith("@unmatched"):
+                        # Unkeyed maps print as "@dropped: <n>"
+                        name, _, value = line.partition(": ")
+                        sink.sensor_stats({name[1:]: int(value)})
+                    continue
+
+                if line.startswith("FLUSH"):
+                    sink.histogram(pending_hist, pending_sum)
+                    if pending_resp: sink.responses(pending_resp)
+                    if pending_edges: sink.edges(pending_edges)
+                    if pending_conns: sink.connects(pending_conns)
+                    # Entries drained from the aggregate maps this interval
+                    telemetry.gauge("map.lat_hist", sum(len(b) for b in pending_hist.values()))
+                    telemetry.gauge("map.edges", len(pending_edges))
+                    telemetry.gauge("map.conn", len(pending_conns))
+                    pending_hist = {}
+                    pending_sum = {}
+                    pending_resp = {}
+                    pending_edges = {}
+                    pending_conns = {}
+                    self.report(events, discarded, sampled_out, parse_s)
+                    events = discarded = sampled_out = 0
+                    parse_s = 0.0
+                    if sampler is not None: every = sampler.every
+                    continue
+
+                parts = line.split()
+                event = parts[0]
+
+                if event == "CGRM":
+                    sink.cgroup_removed(int(parts[1]))
+                    continue
+
+                # <EVENT> <cgroup> <pid> <value>
+                if len(parts) < 4:
+                    discarded += 1
+                    continue
+                if event == "LAT":
+                    status = int(parts[4]) if len(parts) > 4 else 0
+                    sink.latency(int(parts[1]), int(parts[2]), int(parts[3]), status, every)
+                elif event == "ERR":
+                    sink.responses({int(parts[1]): {-int(parts[3]): 1}})
+                elif event == "EDGE":
+                    # EDGE <cgroup> <pid> <ip u32> <us> <status> <bytes>
+                    sink.edges({(int(parts[1]), format_ipv4(int(parts[3]))):
+                                (every, int(parts[4]) * every, int(int(parts[5]) >= 500) * every, int(parts[6]) * every)})
+                elif event == "CONN":
+                    sink.connect(int(parts[1]), int(parts[2]), parts[3])
+                else: discarded += 1
+
+            except Exception:
+                # Malformed line or a sink error: counted, never fatal
+                discarded += 1
+            finally:
+                parse_s += time.perf_counter() - start
+        self.report(events, discarded, sampled_out, parse_s)
+
+    def report(self, events, discarded, sampled_out, parse_s):
+        self.telemetry.add("events", events)
+        if discarded: self.telemetry.add("discarded", discarded)
+        if sampled_out: self.telemetry.add("sampled_out", sampled_out)
+        self.telemetry.add_time("parse", parse_s)
+
+# =============================================================================
+# BCC ring buffer (binary)
+# =============================================================================
+
+EVENT_LAT, EVENT_CONN, EVENT_CGRM, EVENT_ERR = 1, 2, 3, 4
+
+# struct event_t, little-endian, 40 bytes
+EVENT_FORMAT = "<HHIQQ16s"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+if np is not None:
+    EVENT_DTYPE = np.dtype([("kind", "<u2"), ("status", "<u2"), ("pid", "<u4"), ("cgroup", "<u8"),
+                            ("value", "<u8"), ("weight", "<u4"), ("addr_rest", "V12")])
+
+RINGBUF_PROGRAM = r"""
+#include <uapi/linux/ptrace.h>
+#include <linux/socket.h>
+#include <linux/uio.h>
+#include <linux/in.h>
+#include <linux/in6.h>
+
+struct event_t {
+    u16 kind;      // 1 = LAT, 2 = CONN, 3 = CGRM, 4 = ERR
+    u16 status;    // LAT: HTTP status code
+    u32 pid;
+    u64 cgroup;
+    u64 value;     // LAT: latency in us, CONN: address family, ERR: errno
+    u8 addr[16];   // CONN: IPv4 in the first 4 bytes, or IPv6. LAT: u32 sampling weight
+};
+
+BPF_RINGBUF_OUTPUT(events, __RINGBUF_PAGES__);
+
+// Request/response correlation per connection (see BPFTRACE_PROGRAM): up to
+// MAX_INFLIGHT pipelined requests per (pid, fd), completed in order.
+#define MAX_INFLIGHT 8
+#define IS_REQUEST(w) ((w) == 0x20544547 || (w) == 0x54534F50 || (w) == 0x20545550 || \
+                       (w) == 0x454C4544 || (w) == 0x44414548 || (w) == 0x43544150)
+#define STATUS_LINE 0x50545448  // "HTTP"
+#define IS_FAILURE(ret) ((ret) == -110 || (ret) == -104 || (ret) == -32)  // ETIMEDOUT, ECONNRESET, EPIPE
+#define STAT_DROPPED 0
+#define STAT_UNMATCHED 1
+#define STAT_RINGBUF_FULL 2
+#define STAT_SAMPLED_OUT 3
+#define STAT_CONN_UNMAPPED 4
+
+struct conn_key_t { u32 pid; u32 fd; };
+struct conn_t { u32 req_seq; u32 resp_seq; u64 start[MAX_INFLIGHT]; };
+struct io_t { u64 buf; u32 fd; };
+
+// LRU: a process that exits or execs without close() leaves its entries behind; they
+// age out instead of filling the map and silently stopping tracking of new connections
+BPF_TABLE("lru_hash", struct conn_key_t, struct conn_t, conns, 65536);
+
+// Client side per (source cgroup, IPv4 destination), summed in kernel and drained by
+// userspace: connect() records the destination of the fd, the first request written
+// starts the clock, the status line read back stops it (one call in flight per connection).
+struct client_t { u32 daddr; u32 pad; u64 start; u64 bytes; };
+struct edge_key_t { u64 cgroup; u32 daddr; u32 pad; };
+struct edge_t { u64 count; u64 sum_us; u64 errors; u64 bytes; };
+
+BPF_TABLE("lru_hash", struct conn_key_t, struct client_t, clients, 65536);
+BPF_HASH(edges, struct edge_key_t, struct edge_t, 16384);
+BPF_HASH(reads, u32, struct io_t);
+BPF_HASH(writes, u32, struct io_t);
+BPF_PERCPU_ARRAY(stats, u64, 5);
+// Set by userspace under a CPU budget: emit 1 in `sampling[0]` latency records
+BPF_ARRAY(sampling, u32, 1);
+
+// connect() resolved in kernel: IPv4 -> service id, written by userspace from the pod and
+// service watch (ipmap.py). Per (source cgroup, destination service) the first connect
+// is sent up as an event, later ones only add to a count userspace drains every interval.
+// Until userspace sets ipmap_ready[0], every connect() is sent up.
+struct seen_key_t { u64 cgroup; u32 svc; u32 pad; };
+BPF_HASH(svc_ips, u32, u32, 65536);
+BPF_TABLE("lru_hash", struct seen_key_t, u64, seen_edges, 16384);
+BPF_ARRAY(ipmap_ready, u32, 1);
+
+static void stat_add(int i, u64 n) {
+    u64 *v = stats.lookup(&i);
+    if (v) *v += n;
+}
+
+static u64 iov_base(u64 vec) {
+    struct iovec iov = {};
+    bpf_probe_read_user(&iov, sizeof(iov), (void *)vec);
+    return (u64)iov.iov_base;
+}
+
+static u64 msg_iov_base(u64 msg) {
+    struct user_msghdr hdr = {};
+    bpf_probe_read_user(&hdr, sizeof(hdr), (void *)msg);
+    return iov_base((u64)hdr.msg_iov);
+}
+
+// A read/write failed with a request in flight on the connection: complete it as an error
+static void on_failure(struct conn_key_t *key, long ret) {
+    struct conn_t *c = conns.lookup(key);
+    if (!c || c->resp_seq == c->req_seq) return;
+    c->resp_seq++;
+    if (key->pid == __MY_PID__) return;
+
+    struct event_t *e = events.ringbuf_reserve(sizeof(struct event_t));
+    if (!e) {
+        stat_add(STAT_RINGBUF_FULL, 1);
+        return;
+    }
+    // Ring buffer memory is not zeroed: no stale kernel bytes (padding, unused addr) go to userspace
+    __builtin_memset(e, 0, sizeof(*e));
+    e->kind = 4;
+    e->status = 0;
+    e->pid = key->pid;
+    e->cgroup = bpf_get_current_cgroup_id();
+    e->value = -ret;
+    events.ringbuf_submit(e, 0);
+}
+
+static void edge_add(u32 daddr, u64 delta_us, u16 status, u64 bytes) {
+    struct edge_key_t key = {.cgroup = bpf_get_current_cgroup_id(), .daddr = daddr};
+    struct edge_t zero = {};
+    struct edge_t *e = edges.lookup_or_try_init(&key, &zero);
+    if (!e) return;
+    __sync_fetch_and_add(&e->count, 1);
+    __sync_fetch_and_add(&e->sum_us, delta_us);
+    __sync_fetch_and_add(&e->bytes, bytes);
+    if (status >= 500) __sync_fetch_and_add(&e->errors, 1);
+}
+
+static u16 parse_status(u8 *line) {
+    // "HTTP/1.1 503 ..."
+    return (line[9] - '0') * 100 + (line[10] - '0') * 10 + (line[11] - '0');
+}
+
+static int on_read_enter(u32 fd, u64 buf) {
+    u32 tid = bpf_get_current_pid_tgid();
+    struct io_t io = {.buf = buf, .fd = fd};
+    reads.update(&tid, &io);
+    return 0;
+}
+
+static int on_read_exit(long ret) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tid = pid_tgid;
+    struct io_t *io = reads.lookup(&tid);
+    if (!io) return 0;
+    if (ret == -110 || ret == -104) {
+        struct conn_key_t key = {.pid = pid_tgid >> 32, .fd = io->fd};
+        on_failure(&key, ret);
+    }
+    struct conn_key_t ckey = {.pid = pid_tgid >> 32, .fd = io->fd};
+    struct client_t *cl = clients.lookup(&ckey);
+    if (cl && ret > 0) {
+        // Client side: response read on an outbound connection
+        cl->bytes += ret;
+        u8 line[12] = {};
+        u32 first4 = 0;
+        if (cl->start && ret >= 12) {
+            bpf_probe_read_user(line, sizeof(line), (void *)io->buf);
+            __builtin_memcpy(&first4, line, sizeof(first4));
+        }
+        if (first4 == STATUS_LINE && ckey.pid != __MY_PID__) {
+            edge_add(cl->daddr, (bpf_ktime_get_ns() - cl->start) / 1000, parse_status(line), cl->bytes);
+            cl->start = 0;
+            cl->bytes = 0;
+        }
+    } else if (ret > 4) {
+        u32 first4 = 0;
+        bpf_probe_read_user(&first4, sizeof(first4), (void *)io->buf);
+        if (IS_REQUEST(first4)) {
+            struct conn_key_t key = {.pid = pid_tgid >> 32, .fd = io->fd};
+            struct conn_t zero = {};
+            struct conn_t *c = conns.lookup_or_try_init(&key, &zero);
+            if (c) {
+                // Pipeline deeper than we track: give up on the oldest request
+                if (c->req_seq - c->resp_seq >= MAX_INFLIGHT) {
+                    c->resp_seq++;
+                    stat_add(STAT_DROPPED, 1);
+                }
+                c->start[c->req_seq & (MAX_INFLIGHT - 1)] = bpf_ktime_get_ns();
+                c->req_seq++;
+            }
+        }
+    }
+    reads.delete(&tid);
+    return 0;
+}
+
+static int on_write_enter(u32 fd, u64 buf) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    struct conn_key_t key = {.pid = pid_tgid >> 32, .fd = fd};
+    // Only server connections that carried a request, or outbound connections we saw connect
+    if (!conns.lookup(&key) && !clients.lookup(&key)) return 0;
+    u32 tid = pid_tgid;
+    struct io_t io = {.buf = buf, .fd = fd};
+    writes.update(&tid, &io);
+    return 0;
+}
+
+static int on_write_exit(long ret) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tid = pid_tgid;
+    struct io_t *io = writes.lookup(&tid);
+    if (!io) return 0;
+    struct conn_key_t key = {.pid = pid_tgid >> 32, .fd = io->fd};
+    u8 line[12] = {};
+    if (ret >= 12) bpf_probe_read_user(line, sizeof(line), (void *)io->buf);
+    writes.delete(&tid);
+    if (IS_FAILURE(ret)) {
+        on_failure(&key, ret);
+        return 0;
+    }
+    u32 first4 = 0;
+    __builtin_memcpy(&first4, line, sizeof(first4));
+
+    struct client_t *cl = clients.lookup(&key);
+    if (cl) {
+        // Client side: request written on an outbound connection
+        if (ret > 0) cl->bytes += ret;
+        if (!cl->start && IS_REQUEST(first4)) cl->start = bpf_ktime_get_ns();
+        return 0;
+    }
+
+    // Only the status line starts a response; body writes are ignored
+    if (first4 != STATUS_LINE) return 0;
+    u16 status = parse_status(line);
+
+    struct conn_t *c = conns.lookup(&key);
+    if (!c) return 0;
+    if (c->resp_seq == c->req_seq) {
+        stat_add(STAT_UNMATCHED, 1);
+        return 0;
+    }
+    u64 delta_us = (bpf_ktime_get_ns() - c->start[c->resp_seq & (MAX_INFLIGHT - 1)]) / 1000;
+    c->resp_seq++;
+    if (delta_us == 0 || key.pid == __MY_PID__) return 0;
+
+    u32 zero = 0;
+    u32 *every = sampling.lookup(&zero);
+    u32 weight = every && *every > 1 ? *every : 1;
+    if (weight > 1 && bpf_get_prandom_u32() % weight) {
+        stat_add(STAT_SAMPLED_OUT, 1);
+        return 0;
+    }
+
+    struct event_t *e = events.ringbuf_reserve(sizeof(struct event_t));
+    if (!e) {
+        stat_add(STAT_RINGBUF_FULL, 1);
+        return 0;
+    }
+    __builtin_memset(e, 0, sizeof(*e));
+    e->kind = 1;
+    e->status = status;
+    e->pid = key.pid;
+    e->cgroup = bpf_get_current_cgroup_id();
+    e->value = delta_us;
+    __builtin_memcpy(e->addr, &weight, sizeof(weight));
+    events.ringbuf_submit(e, 0);
+    return 0;
+}
+
+TRACEPOINT_PROBE(syscalls, sys_enter_read) { return on_read_enter(args->fd, (u64)args->buf); }
+TRACEPOINT_PROBE(syscalls, sys_enter_recvfrom) { return on_read_enter(args->fd, (u64)args->ubuf); }
+TRACEPOINT_PROBE(syscalls, sys_enter_readv) { return on_read_enter(args->fd, iov_base((u64)args->vec)); }
+TRACEPOINT_PROBE(syscalls, sys_enter_recvmsg) { return on_read_enter(args->fd, msg_iov_base((u64)args->msg)); }
+TRACEPOINT_PROBE(syscalls, sys_exit_read) { return on_read_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_exit_recvfrom) { return on_read_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_exit_readv) { return on_read_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_exit_recvmsg) { return on_read_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_enter_write) { return on_write_enter(args->fd, (u64)args->buf); }
+TRACEPOINT_PROBE(syscalls, sys_enter_sendto) { return on_write_enter(args->fd, (u64)args->buff); }
+TRACEPOINT_PROBE(syscalls, sys_enter_writev) { return on_write_enter(args->fd, iov_base((u64)args->vec)); }
+TRACEPOINT_PROBE(syscalls, sys_enter_sendmsg) { return on_write_enter(args->fd, msg_iov_base((u64)args->msg)); }
+TRACEPOINT_PROBE(syscalls, sys_exit_write) { return on_write_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_exit_sendto) { return on_write_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_exit_writev) { return on_write_exit(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_exit_sendmsg) { return on_write_exit(args->ret); }
+
+TRACEPOINT_PROBE(syscalls, sys_enter_close) {
+    struct conn_key_t key = {.pid = bpf_get_current_pid_tgid() >> 32, .fd = args->fd};
+    struct conn_t *c = conns.lookup(&key);
+    if (c && c->req_seq != c->resp_seq) stat_add(STAT_DROPPED, c->req_seq - c->resp_seq);
+    if (c) conns.delete(&key);
+    clients.delete(&key);
+    return 0;
+}
+
+TRACEPOINT_PROBE(syscalls, sys_enter_connect) {
+    u16 family = 0;
+    bpf_probe_read_user(&family, sizeof(family), (void *)args->uservaddr);
+    if (family != AF_INET && family != AF_INET6) return 0;
+
+    u32 pid = bpf_get_current_pid_tgid() >> 32;
+    if (family == AF_INET) {
+        // Remember the destination of the fd for the client-side edge metrics
+        struct sockaddr_in *sa = (struct sockaddr_in *)args->uservaddr;
+        struct conn_key_t key = {.pid = pid, .fd = args->fd};
+        struct client_t cl = {};
+        bpf_probe_read_user(&cl.daddr, sizeof(cl.daddr), &sa->sin_addr.s_addr);
+        clients.update(&key, &cl);
+
+        // Loopback and 0.0.0.0 never name a service
+        u32 first = cl.daddr & 0xff;
+        if (first == 127 || first == 0) return 0;
+        int zero = 0;
+        u32 *ready = ipmap_ready.lookup(&zero);
+        if (ready && *ready) {
+            u32 *svc = svc_ips.lookup(&cl.daddr);
+            if (!svc) {
+                stat_add(STAT_CONN_UNMAPPED, 1);
+                return 0;
+            }
+            struct seen_key_t sk = {.cgroup = bpf_get_current_cgroup_id(), .svc = *svc};
+            u64 *n = seen_edges.lookup(&sk);
+            if (n) {
+                __sync_fetch_and_add(n, 1);
+                return 0;
+            }
+            u64 one = 1;
+            seen_edges.update(&sk, &one);
+            // New edge: also sent up below
+        }
+    }
+
+    struct event_t *e = events.ringbuf_reserve(sizeof(struct event_t));
+    if (!e) {
+        stat_add(STAT_RINGBUF_FULL, 1);
+        return 0;
+    }
+    __builtin_memset(e, 0, sizeof(*e));
+    if (family == AF_INET) {
+        struct sockaddr_in *sa = (struct sockaddr_in *)args->uservaddr;
+        bpf_probe_read_user(e->addr, 4, &sa->sin_addr.s_addr);
+    } else {
+        struct sockaddr_in6 *sa = (struct sockaddr_in6 *)args->uservaddr;
+        bpf_probe_read_user(e->addr, 16, &sa->sin6_addr);
+    }
+    e->kind = 2;
+    e->status = 0;
+    e->pid = pid;
+    e->cgroup = bpf_get_current_cgroup_id();
+    e->value = family;
+    events.ringbuf_submit(e, 0);
+    return 0;
+}
+
+// Invalidation: per-thread state dies with the thread, cgroup ids can be reused
+TRACEPOINT_PROBE(sched, sched_process_exit) {
+    u32 tid = bpf_get_current_pid_tgid();
+    reads.delete(&tid);
+    writes.delete(&tid);
+    return 0;
+}
+
+TRACEPOINT_PROBE(cgroup, cgroup_rmdir) {
+    struct event_t *e = events.ringbuf_reserve(sizeof(struct event_t));
+    if (!e) {
+        stat_add(STAT_RINGBUF_FULL, 1);
+        return 0;
+    }
+    __builtin_memset(e, 0, sizeof(*e));
+    e->kind = 3;
+    e->status = 0;
+    e->pid = 0;
+    e->cgroup = args->id;
+    e->value = 0;
+    events.ringbuf_submit(e, 0);
+    return 0;
+}
+"""
+
+def format_addr(family, addr):
+    if family == 2: return socket.inet_ntop(socket.AF_INET, addr[:4])
+    return socket.inet_ntop(socket.AF_INET6, addr)
+
+def bucket_indices(values):
+    """Vectorized common.sketch.bucket_index over a uint64 array."""
+    v = np.maximum(values, 1).astype(np.uint64)
+    b = np.floor(np.log2(v.astype(np.float64))).astype(np.int64)
+    shift = np.maximum(b - 2, 0).astype(np.uint64)
+    return np.where(v < 4, v.astype(np.int64), 4 * b - 8 + (v >> shift).astype(np.int64))
+
+def decode_records(data, sink):
+    """
+    Decode a batch of packed event_t records. Latency records are folded into one
+    histogram call and their status codes into one responses call, each counted
+    `weight` times (sampled records; 0 in old recordings means 1).
+    """
+    n = len(data) // EVENT_SIZE
+    if n == 0: return 0
+    hist, sums, resp = {}, {}, {}
+
+    if np is not None:
+        records = np.frombuffer(data, dtype=EVENT_DTYPE, count=n)
+        lat = records[records["kind"] == EVENT_LAT]
+        if len(lat):
+            cgroups, inverse = np.unique(lat["cgroup"], return_inverse=True)
+            idx = bucket_indices(lat["value"])
+            classes = lat["status"] // 100
+            weights = np.maximum(lat["weight"], 1).astype(np.int64)
+            for i, cgid in enumerate(cgroups.tolist()):
+                mask = inverse == i
+                w = weights[mask]
+                ids, at = np.unique(idx[mask], return_inverse=True)
+                hist[cgid] = dict(zip(ids.tolist(), np.bincount(at, weights=w).astype(np.int64).tolist()))
+                sums[cgid] = int((lat["value"][mask].astype(np.int64) * w).sum())
+                codes, at = np.unique(classes[mask], return_inverse=True)
+                resp[cgid] = dict(zip(codes.tolist(), np.bincount(at, weights=w).astype(np.int64).tolist()))
+        # connect(), failures and cgroup removal are rare, handle them one by one
+        others = np.nonzero(records["kind"] != EVENT_LAT)[0]
+        rows = [struct.unpack_from(EVENT_FORMAT, data, int(i) * EVENT_SIZE) for i in others]
+    else:
+        rows = []
+        for row in struct.iter_unpack(EVENT_FORMAT, data[:n * EVENT_SIZE]):
+            kind, status, pid, cgid, value, addr = row
+            if kind == EVENT_LAT:
+                w = int.from_bytes(addr[:4], "little") or 1
+                buckets = hist.setdefault(cgid, {})
+                idx = bucket_index(value)
+                buckets[idx] = buckets.get(idx, 0) + w
+                sums[cgid] = sums.get(cgid, 0) + value * w
+                codes = resp.setdefault(cgid, {})
+                codes[status // 100] = codes.get(status // 100, 0) + w
+            else: rows.append(row)
+
+    for kind, status, pid, cgid, value, addr in rows:
+        if kind == EVENT_ERR:
+            codes = resp.setdefault(cgid, {})
+            codes[-value] = codes.get(-value, 0) + 1
+    if hist: sink.histogram(hist, sums)
+    if resp: sink.responses(resp)
+    for kind, status, pid, cgid, value, addr in rows:
+        if kind == EVENT_CONN: sink.connect(cgid, pid, format_addr(value, addr))
+        elif kind == EVENT_CGRM: sink.cgroup_removed(cgid)
+    return n
+
+class RingBufSensor:
+    """
+    BCC backend. The poll callback only memmoves each record into a preallocated
+    buffer; the batch is decoded in one go (NumPy view) once the poll returns.
+    """
+
+    STATS = ("dropped", "unmatched", "ringbuf_full", "sampled_out", "conn_unmapped")
+    MAPS = ("conns", "clients", "edges", "reads", "writes", "svc_ips", "seen_edges")
+    OCCUPANCY_EVERY = 10  # stats intervals between map occupancy counts (they walk the keys)
+
+    def __init__(self, sink, my_pid=0, ringbuf_pages=256, batch_records=65536, poll_ms=100, stats_interval=1,
+                 telemetry=None, sampler=None, ip_map=None):
+        self.sink = sink
+        self.telemetry = telemetry or Telemetry()
+        self.sampler = sampler
+        self.ip_map = ip_map
+        self.seen_counts = {}  # (cgroup, svc id) -> cumulative connects at the last drain
+        self.program = RINGBUF_PROGRAM.replace("__MY_PID__", str(my_pid)).replace("__RINGBUF_PAGES__", str(ringbuf_pages))
+        self.buf = bytearray(batch_records * EVENT_SIZE)
+        self.buf_addr = ctypes.addressof((ctypes.c_char * len(self.buf)).from_buffer(self.buf))
+        self.used = 0
+        self.overflow = 0
+        self.poll_ms = poll_ms
+        self.stats_interval = stats_interval
+        self.stats_seen = [0] * len(self.STATS)
+
+    def _on_event(self, ctx, data, size):
+        if self.used + EVENT_SIZE > len(self.buf):
+            self.overflow += 1
+            return
+        ctypes.memmove(self.buf_addr + self.used, data, EVENT_SIZE)
+        self.used += EVENT_SIZE
+
+    def flush(self):
+        if self.overflow:
+            # Batch buffer full before the poll returned: those records are gone
+            self.telemetry.add("overflow", self.overflow)
+            self.overflow = 0
+        if self.used:
+            start = time.perf_counter()
+            try: self.telemetry.add("events", decode_records(memoryview(self.buf)[:self.used], self.sink))
+            except Exception as e:
+                self.telemetry.add("discarded", self.used // EVENT_SIZE)
+                print(f"Decode error: {e}", flush=True)
+            self.telemetry.add_time("parse", time.perf_counter() - start)
+            self.used = 0
+
+    def apply_sampling(self, table):
+        if self.sampler is None: return
+        every = self.sampler.every
+        if table[ctypes.c_int(0)].value != every: table[ctypes.c_int(0)] = ctypes.c_uint32(every)
+
+    def count_maps(self, bpf):
+        for name in self.MAPS: self.telemetry.gauge(f"map.{name}", len(bpf[name]))
+
+    def read_stats(self, table):
+        """Per-CPU kernel counters are cumulative; hand the sink what changed since last time."""
+        delta = {}
+        for i, name in enumerate(self.STATS):
+            total = sum(table[ctypes.c_int(i)])
+            if total != self.stats_seen[i]: delta[name] = total - self.stats_seen[i]
+            self.stats_seen[i] = total
+        if delta: self.sink.sensor_stats(delta)
+
+    def drain_edges(self, table):
+        """Take the per-edge sums accumulated in kernel since the last drain."""
+        edges = {}
+        for key, e in table.items_lookup_and_delete_batch():
+            edges[(key.cgroup, format_ipv4(key.daddr))] = (e.count, e.sum_us, e.errors, e.bytes)
+        if edges: self.sink.edges(edges)
+
+    def drain_connects(self, table):
+        """Connects per (cgroup, service) since the last drain. Counts are cumulative: the map only forgets by LRU."""
+        current, delta = {}, {}
+        for key, n in table.items():
+            k = (key.cgroup, key.svc)
+            current[k] = n.value
+            prev = self.seen_counts.get(k, 0)
+            # Evicted and seen again: the count restarted
+            d = n.value - prev if n.value >= prev else n.value
+            svc = self.ip_map.name(key.svc)
+            if d > 0 and svc is not None: delta[(key.cgroup, svc)] = delta.get((key.cgroup, svc), 0) + d
+        self.seen_counts = current
+        if delta: self.sink.service_connects(delta)
+
+    def run(self):
+        from bcc import BPF
+        bpf = BPF(text=self.program)
+        bpf["events"].open_ring_buffer(self._on_event)
+        stats = bpf["stats"]
+        edges = bpf["edges"]
+        sampling = bpf["sampling"]
+        seen_edges = bpf["seen_edges"]
+        if self.ip_map is not None:
+            self.ip_map.attach(bpf["svc_ips"])
+            bpf["ipmap_ready"][ctypes.c_int(0)] = ctypes.c_uint32(1)
+        print("[*] Unified Sensor Running (ring buffer)...", flush=True)
+        next_stats = time.monotonic() + self.stats_interval
+        rounds = 0
+        while True:
+            bpf.ring_buffer_poll(self.poll_ms)
+            self.flush()
+            if time.monotonic() >= next_stats:
+                self.read_stats(stats)
+                self.drain_edges(edges)
+                if self.ip_map is not None: self.drain_connects(seen_edges)
+                self.apply_sampling(sampling)
+                if rounds % self.OCCUPANCY_EVERY == 0: self.count_maps(bpf)
+                rounds += 1
+                next_stats += self.stats_interval
+
+# =============================================================================
+# Replay
+# =============================================================================
+
+class ReplaySensor:
+    """
+    Feeds a recording through the real decoders: *.bin holds packed event_t records
+    (ring buffer path), anything else is bpftrace stdout text.
+    """
+
+    def __init__(self, sink, path, batch_records=65536, telemetry=None):
+        self.sink = sink
+        self.path = path
+        self.batch_bytes = batch_records * EVENT_SIZE
+        self.telemetry = telemetry or Telemetry()
+
+    def run(self):
+        start = time.perf_counter()
+        if self.path.endswith(".bin"):
+            events = 0
+            with open(self.path, "rb") as f:
+                while True:
+                    chunk = f.read(self.batch_bytes)
+                    if not chunk: break
+                    events += decode_records(chunk, self.sink)
+            self.telemetry.add("events", events)
+            self.telemetry.add_time("parse", time.perf_counter() - start)
+        else:
+            with open(self.path) as f:
+                lines = f.readlines()
+            events = len(lines)
+            BpftraceSensor(self.sink, telemetry=self.telemetry).consume(lines)
+        elapsed = time.perf_counter() - start
+        print(f"[*] Replayed {events} records from {self.path} in {elapsed:.3f}s "
+              f"({events / max(elapsed, 1e-9):,.0f}/s)", flush=True)
+        return events, elapsed
+
+def make_sensor(backend, sink, aggregate=True, flush_interval=1, my_pid=0, replay_file=None,
+                telemetry=None, sampler=None, ip_map=None):
+    if backend == "replay": return ReplaySensor(sink, replay_file, telemetry=telemetry)
+    if backend == "ringbuf":
+        try:
+            import bcc  # noqa: F401
+            return RingBufSensor(sink, my_pid=my_pid, telemetry=telemetry, sampler=sampler, ip_map=ip_map)
+        except ImportError:
+            print("[!] BCC not available, falling back to bpftrace", flush=True)
+    return BpftraceSensor(sink, aggregate=aggregate, flush_interval=flush_interval, my_pid=my_pid,
+                          telemetry=telemetry, sampler=sampler)
@@ -0,0 +1,101 @@
+import math
+import os
+import re
+import threading
+import time
+
+# Agent self-telemetry: what the sensor handled, lost and cost, served on /telemetry.
+#
+#   TELEMETRY.add("events", n)        cumulative counters (rates computed on tick())
+#   TELEMETRY.add_time("parse", s)    time spent decoding, per second of wall time
+#   TELEMETRY.gauge("map.conns", n)   last value wins (map occupancy, ...)
+#   TELEMETRY.watch(pid)              also count a helper process' CPU (bpftrace)
+
+LOST_RE = re.compile(r"Lost (\d+) events")
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def process_cpu(pid):
+    """utime + stime of another process, in seconds (None once it is gone)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f: fields = f.read().rpartition(")")[2].split()
+        return (int(fields[11]) + int(fields[12])) / CLK_TCK
+    except (OSError, IndexError, ValueError):
+        return None
+
+class Telemetry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.times = {}
+        self.gauges = {}
+        self.rates = {}
+        self.cpu = {"agent": 0.0, "helpers": 0.0, "total": 0.0}  # cores, over the last tick
+        self.helpers = {}  # pid -> last cpu seconds
+        self.last = None   # (wall, agent cpu, counters, times) at the previous tick
+
+    def add(self, name, n=1):
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        with self.lock: self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def watch(self, pid):
+        self.helpers[pid] = process_cpu(pid) or 0.0
+
+    def stderr_line(self, line):
+        """bpftrace reports events it could not push to userspace as 'Lost N events'."""
+        m = LOST_RE.search(line)
+        if m: self.add("lost", int(m.group(1)))
+        return m is not None
+
+    def tick(self):
+        """Recompute rates and CPU use since the previous tick."""
+        now, agent_cpu = time.monotonic(), time.process_time()
+        helpers = 0.0
+        for pid, seen in list(self.helpers.items()):
+            cpu = process_cpu(pid)
+            if cpu is None:
+                del self.helpers[pid]
+                continue
+            helpers += cpu - seen
+            self.helpers[pid] = cpu
+        with self.lock:
+            counters, times = dict(self.counters), dict(self.times)
+        if self.last is not None:
+            wall = max(now - self.last[0], 1e-9)
+            self.rates = {f"{name}_per_s": round((n - self.last[2].get(name, 0)) / wall, 1) for name, n in counters.items()}
+            self.rates.update({f"{name}_share": round((s - self.last[3].get(name, 0.0)) / wall, 4) for name, s in times.items()})
+            self.cpu = {"agent": round((agent_cpu - self.last[1]) / wall, 4), "helpers": round(helpers / wall, 4)}
+            self.cpu["total"] = round(self.cpu["agent"] + self.cpu["helpers"], 4)
+        self.last = (now, agent_cpu, counters, times)
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            times = {name: round(s, 3) for name, s in self.times.items()}
+        return {"counters": counters, "seconds": times, "rates": dict(self.rates),
+                "gauges": dict(self.gauges), "cpu": dict(self.cpu)}
+
+class AdaptiveSampler:
+    """
+    Keeps agent CPU under `budget` (cores) by keeping 1 in `every` per-request events.
+    Kept events carry weight `every`, so counts and sums stay unbiased. Backs off
+    multiplicatively when over budget, recovers by halving once well below it.
+    """
+
+    def __init__(self, budget, max_every=1024):
+        self.budget = budget
+        self.max_every = max_every
+        self.every = 1
+
+    def update(self, cpu):
+        previous = self.every
+        if self.budget <= 0: self.every = 1
+        elif cpu > self.budget:
+            self.every = min(self.max_every, math.ceil(self.every * cpu / self.budget))
+        elif cpu < self.budget / 2 and self.every > 1:
+            self.every = max(1, self.every // 2)
+        return self.every != previous
@@ -1,5 +1,7 @@
 import subprocess
 import re
+import socket
+import struct
 import sys
 import os
 
@@ -51,16 +53,23 @@ def get_source_name(pid):
     return "Unknown"
 
 # --- BPF SCRIPT ---
+# connect()s are counted in kernel per (pid, destination) and drained every 2s, so a
+# pooled client reconnecting in a loop costs one line per interval, not one per call.
+# Loopback never names a service and is skipped in kernel.
 BPF_SCRIPT = """
 #include <linux/in.h>
 tracepoint:syscalls:sys_enter_connect {
     $addr = (struct sockaddr_in *)args->uservaddr;
-    if ($addr->sin_family == 2) {
-        printf("CONN PID:%d DEST:%s\\n", pid, ntop($addr->sin_addr.s_addr));
+    if ($addr->sin_family == 2 && ($addr->sin_addr.s_addr & 0xff) != 127) {
+        @conn[pid, $addr->sin_addr.s_addr] = count();
     }
 }
+interval:s:2 { print(@conn); clear(@conn); }
 """
 
+# (source, destination ip) pairs already printed
+SEEN = set()
+
 def main():
     # Write BPF
     with open("env.bt", "w") as f: f.write(BPF_SCRIPT)
@@ -74,16 +83,22 @@ def main():
         line = process.stdout.readline()
         if not line: break
         
-        match = re.search(r'CONN PID:(\d+) DEST:([0-9\.]+)', line)
-        if match:
-            pid = int(match.group(1))
-            dest_ip = match.group(2)
+        # @conn[<pid>, <s_addr>]: <count>
+        if not line.startswith("@conn["): continue
+        keys, _, _ = line[len("@conn["):].partition("]")
+        pid, _, addr = keys.partition(", ")
+        try:
+            pid = int(pid)
+            dest_ip = socket.inet_ntoa(struct.pack("<I", int(addr)))
+        except ValueError:
+            continue
             
-            # Get Source from Env Var
-            source = get_source_name(pid)
-            
-            if not dest_ip.startswith("127.") and source != "Unknown":
-                 print(f"🔗 [GRAPH] {source} --> {dest_ip}", flush=True)
+        # Get Source from Env Var
+        source = get_source_name(pid)
+
+        if source != "Unknown" and (source, dest_ip) not in SEEN:
+            SEEN.add((source, dest_ip))
+            print(f"🔗 [GRAPH] {source} --> {dest_ip}", flush=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
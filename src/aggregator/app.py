@@ -1,10 +1,21 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
-import requests
 import threading
 import time
+import os
+import signal
+import socket
+import sys
 import redis
 from kubernetes import client, config
+from common.kube_cache import Informer
+from scraper import AgentScraper
+from rollup import Rollups
+from snapshot import SnapshotStore
+from series import SeriesStore
+import history
+import shard
+import store
 
 app = Flask(__name__)
 CORS(app)
@@ -21,10 +32,33 @@ def get_redis():
     except:
         return None
 
+# Same server, bytes in and out: the history records are packed binary
+r_raw = None
+def get_redis_raw():
+    global r_raw
+    if r_raw is None: r_raw = redis.Redis(host='redis', port=6379, db=0)
+    return r_raw
+
 try: config.load_incluster_config()
 except: config.load_kube_config()
 v1 = client.CoreV1Api()
 
+# Running agents, kept current by a watch instead of a LIST every sync
+AGENTS = Informer(v1.list_namespaced_pod, "default", label_selector="app=bpf-agent",
+                  field_selector="status.phase=Running").start()
+
+SCRAPER = AgentScraper(max_workers=int(os.getenv("SCRAPE_WORKERS", "32")),
+                       round_deadline=float(os.getenv("SCRAPE_DEADLINE", "1.5")))
+
+ROLLUPS = Rollups(slot_seconds=2)
+SNAPSHOTS = SnapshotStore()
+SERIES = SeriesStore(slot_seconds=2)
+
+# Sharded mode: replicas split the agents by consistent hashing and merge each other's
+# partials through Redis (see shard.py). Off: one replica scrapes every agent.
+SHARDED = os.getenv("AGGREGATOR_SHARDED", "0") == "1"
+SHARD = shard.ShardMember(os.getenv("REPLICA_ID") or socket.gethostname()) if SHARDED else None
+
 def fetch_from_agents():
     while True:
         try:
@@ -33,47 +67,44 @@ def fetch_from_agents():
                 time.sleep(2)
                 continue
 
-            pods = v1.list_namespaced_pod("default", label_selector="app=bpf-agent")
-            
-            for pod in pods.items:
-                pod_ip = pod.status.pod_ip
-                if not pod_ip: continue
-                
-                try:
-                    # 1. SCRAPE
-                    url = f"http://{pod_ip}:5000"
-                    response = requests.get(url, timeout=1)
-                    if response.status_code != 200: continue
-                    data = response.json()
-                    
-                    # 2. DUMP METRICS TO REDIS
-                    metrics = data.get("metrics", {})
-                    for svc, m in metrics.items():
-                        # Save metric data
-                        redis_conn.hset(f"metric:{svc}", mapping={
-                            "latency": str(m["latency"]),
-                            "rps": str(m["rps"]),
-                            "error_rate": str(m["error_rate"]),
-                            "count": str(m["count"])
-                        })
-                        # Mark service as active
-                        redis_conn.sadd("services", svc)
-                        # Set expiry so old dead nodes eventually disappear (30s)
-                        redis_conn.expire(f"metric:{svc}", 30)
-
-                    # 3. DUMP TOPOLOGY TO REDIS
-                    topo = data.get("topology", {})
-                    for src, dests in topo.items():
-                        for dst in dests:
-                            redis_conn.sadd(f"topo:{src}", dst)
-                            # Ensure both sides are in the service list
-                            redis_conn.sadd("services", src)
-                            redis_conn.sadd("services", dst)
-
-                except Exception as e:
-                    pass
-            
-            print(f"✅ Synced {len(pods.items)} agents to Redis", flush=True)
+            round_start = time.perf_counter()
+            targets = {pod.metadata.name: f"http://{pod.status.pod_ip}:5000" for pod in AGENTS.list() if pod.status.pod_ip}
+            if SHARD is None:
+                # 1. SCRAPE (concurrently, keep-alive)
+                payloads, stats = SCRAPER.scrape(targets)
+
+                # 2. ADD PER-AGENT PARTIALS (SERVICES AND EDGES) TO THE ROLLING WINDOWS
+                write_start = time.perf_counter()
+                now = time.time()
+                stats["ingest_failed"] = ROLLUPS.ingest_all(payloads, now)
+
+                # A service with replicas on several nodes is reported by several agents:
+                # every window sums all agents' partials instead of keeping the last one.
+                merged = ROLLUPS.merged(now)
+                slots = SERIES.record(ROLLUPS, now)
+
+                # 3. MERGE TOPOLOGY: only edges used within EDGE_TTL, with their call rates
+                edges = ROLLUPS.merged_edges(now)
+
+                # 4. DUMP TO REDIS (one pipelined round trip), plus the finished slots into the history
+                store.write_round(redis_conn, merged, edges, now)
+                for epoch, partials in slots.items(): history.write_slot(redis_conn, epoch * SERIES.slot_seconds, partials)
+
+                # 5. BUILD THE GRAPH SNAPSHOT ONCE, every client is served from it
+                graph = store.read_graph(redis_conn, now)
+                stats["write_s"] = time.perf_counter() - write_start
+            else:
+                # Sharded: our share of the agents, merged with every replica's (see shard.run_round)
+                graph, _, stats = shard.run_round(SHARD, redis_conn, SCRAPER, ROLLUPS, SERIES, targets)
+            snap = SNAPSHOTS.publish(graph)
+
+            total_s = time.perf_counter() - round_start
+            shard_info = f" | shard {SHARD.replica_id} ({len(SHARD.members)} replicas{', leader' if SHARD.leader else ''})" if SHARD else ""
+            print(f"✅ Synced {stats['ok']}/{stats['agents']} agents to Redis "
+                  f"(failed {stats['failed']}, timed out {stats['timed_out']}, ingest failed {stats['ingest_failed']}) | "
+                  f"scrape {stats['scrape_s']*1000:.0f}ms (p50 {stats['p50_s']*1000:.0f}ms, max {stats['max_s']*1000:.0f}ms, "
+                  f"{stats['bytes']/1024:.0f}KB) | "
+                  f"write {stats['write_s']*1000:.0f}ms | total {total_s*1000:.0f}ms | graph v{snap.version}{shard_info}", flush=True)
 
         except Exception as e:
             print(f"Loop Error: {e}")
@@ -82,45 +113,87 @@ def fetch_from_agents():
 
 threading.Thread(target=fetch_from_agents, daemon=True).start()
 
+def snapshot_response(snap, body):
+    headers = {"ETag": snap.etag, "X-Graph-Version": str(snap.version), "Cache-Control": "no-cache"}
+    if request.if_none_match.contains_weak(snap.etag.strip('"')):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
 @app.route('/api/graph')
 def get_graph():
+    snap = SNAPSHOTS.current
+    if snap is not None: return snapshot_response(snap, snap.body)
+
+    # No sync round finished yet
     redis_conn = get_redis()
     if not redis_conn: return jsonify({"error": "Redis unavailable"}), 500
-
-    resp_metrics = {}
-    resp_topo = {}
-
-    # 1. Get All Services
-    services = redis_conn.smembers("services")
-    
-    for svc in services:
-        # Fetch Metrics
-        m = redis_conn.hgetall(f"metric:{svc}")
-        if m:
-            resp_metrics[svc] = {
-                "latency": float(m["latency"]),
-                "rps": float(m["rps"]),
-                "error_rate": float(m["error_rate"]),
-                "count": int(m["count"])
-            }
-        else:
-            # Default if no traffic right now
-            resp_metrics[svc] = {"latency": 0, "rps": 0, "error_rate": 0, "count": 0}
-
-        # Fetch Topology
-        links = redis_conn.smembers(f"topo:{svc}")
-        if links:
-            resp_topo[svc] = list(links)
-
-    return jsonify({
-        "metrics": resp_metrics,
-        "topology": resp_topo
-    })
+    return jsonify(store.read_graph(redis_conn))
+
+@app.route('/api/graph/delta')
+def get_graph_delta():
+    """Only what changed since ?since=<version>. since=0 (or a version too old or from another replica) returns everything."""
+    snap, body = SNAPSHOTS.delta(request.args.get("since", "0"))
+    if snap is None: return jsonify({"error": "No snapshot yet"}), 503
+    return Response(body, mimetype="application/json",
+                    headers={"X-Graph-Version": str(snap.version), "Cache-Control": "no-cache"})
+
+@app.route('/api/stream')
+def stream_graph():
+    """
+    Server-Sent Events: one 'delta' event (same body as /api/graph/delta) as soon as
+    each sync round publishes a new snapshot. Reconnecting clients resume from
+    Last-Event-ID, a fresh client gets the full graph first.
+    """
+    since = request.args.get("since") or request.headers.get("Last-Event-ID", "0")
+
+    def events(since):
+        yield "retry: 2000\n\n"
+        while True:
+            if SNAPSHOTS.wait_newer(since, timeout=15):
+                snap, body = SNAPSHOTS.delta(since)
+                since = snap.version
+                yield f"id: {snap.version}\nevent: delta\ndata: {body.decode()}\n\n"
+            else:
+                # Keep proxies from closing an idle stream
+                yield ": ping\n\n"
+
+    return Response(events(since), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/series')
+def get_series():
+    """Per-slot rps/latency history: ?svc=a,b (default all) &points=N (default all kept)."""
+    services = [s for s in request.args.get("svc", "").split(",") if s]
+    return jsonify(SERIES.query(services, request.args.get("points", type=int)))
+
+@app.route('/api/history')
+def get_history():
+    """
+    Downsampled history: ?svc=a,b (default all) &from=&to= (unix seconds, default the
+    last hour) &step= (seconds, default: finest tier within history.MAX_POINTS points).
+    """
+    redis_conn = get_redis()
+    if not redis_conn: return jsonify({"error": "Redis unavailable"}), 500
+    now = time.time()
+    services = [s for s in request.args.get("svc", "").split(",") if s] or sorted(redis_conn.smembers("services"))
+    end = request.args.get("to", now, type=float)
+    start = request.args.get("from", end - 3600, type=float)
+    if start >= end: return jsonify({"error": "from must be before to"}), 400
+    return jsonify(history.query(get_redis_raw(), services, start, end, request.args.get("step", type=float), now))
 
 @app.route('/api/reset')
 def reset():
     get_redis().flushdb()
     return "OK"
 
+def leave(signum, frame):
+    # Hand our agents over now instead of after MEMBER_TTL
+    redis_conn = get_redis()
+    if SHARD is not None and redis_conn:
+        try: SHARD.leave(redis_conn)
+        except Exception: pass
+    sys.exit(0)
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=8000)
\ No newline at end of file
+    signal.signal(signal.SIGTERM, leave)
+    app.run(host='0.0.0.0', port=8000, threaded=True)
\ No newline at end of file
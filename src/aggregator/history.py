@@ -0,0 +1,126 @@
+import math
+import struct
+import time
+
+# Downsampled per-service history, for dashboards, capacity planning and post-incident
+# analysis. Every complete 2s slot is folded into each tier.
+#
+# Redis layout (next to store.py's)
+#   hist:{tier}:{svc}   STRING ring of `points` fixed-size records, written in place with
+#                       SETRANGE and read with GETRANGE (expires after the tier's retention)
+#
+# A record is <bucket u32, count u32, errors u32, latency sum ms f64, worst p99 ms f32>.
+# The bucket (time // step) tells a live record from one left by an earlier lap.
+# Counts and sums add up exactly across tiers; p99 doesn't, so coarser tiers keep the
+# worst p99 of their slots.
+
+RECORD = struct.Struct("<IIIdf")
+# name, step seconds, retention seconds
+TIERS = [("2s", 2, 3600), ("1m", 60, 86400), ("10m", 600, 30 * 86400)]
+# Default answer size when ?step= is not given
+MAX_POINTS = 1000
+
+# ARGV[1]: slot start time, then per service: name, count, errors, latency sum ms, p99 ms.
+# A slot already in the 2s tier was recorded before (leader change, retry): skipped.
+WRITE_LUA = """
+local tiers = {%s}
+local t = tonumber(ARGV[1])
+for i = 2, #ARGV, 5 do
+    local svc = ARGV[i]
+    local count, errors, sum, p99 = tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2]), tonumber(ARGV[i + 3]), tonumber(ARGV[i + 4])
+    for n, tier in ipairs(tiers) do
+        local key = 'hist:' .. tier[1] .. ':' .. svc
+        local bucket = math.floor(t / tier[2])
+        local offset = (bucket %% tier[3]) * %d
+        local old = redis.call('GETRANGE', key, offset, offset + %d)
+        local c, e, s, p = count, errors, sum, p99
+        if #old == %d then
+            local ob, oc, oe, os, op = struct.unpack('%s', old)
+            if ob == bucket then
+                if n == 1 then break end
+                c, e, s, p = c + oc, e + oe, s + os, math.max(p, op)
+            end
+        end
+        redis.call('SETRANGE', key, offset, struct.pack('%s', bucket, c, e, s, p))
+        redis.call('EXPIRE', key, tier[4])
+    end
+end
+""" % (", ".join(f"{{'{name}', {step}, {retention // step}, {retention}}}" for name, step, retention in TIERS),
+       RECORD.size, RECORD.size - 1, RECORD.size, RECORD.format, RECORD.format)
+
+_write = None
+
+def write_slot(redis_conn, start, slots):
+    """slots: {svc: Partial} counted in the 2s slot beginning at `start`. One EVALSHA."""
+    global _write
+    if not slots: return
+    if _write is None: _write = redis_conn.register_script(WRITE_LUA)
+    args = [start]
+    for svc, p in slots.items():
+        args += [svc, p.count, p.errors, p.sum_us / 1000.0, p.sketch.quantile(0.99) / 1000.0 if p.count else 0.0]
+    _write(args=args, client=redis_conn)
+
+def pick_tier(start, end, step, now):
+    """Coarsest tier no coarser than `step` (or the finest within MAX_POINTS) that still holds `start`."""
+    kept = [t for t in TIERS if now - start <= t[2]] or TIERS[-1:]
+    if step: fitting = [t for t in kept if t[1] <= step]
+    else: fitting = [t for t in kept if (end - start) / t[1] <= MAX_POINTS]
+    return fitting[-1] if step and fitting else fitting[0] if fitting else kept[-1]
+
+def query(redis_conn, services, start, end, step=None, now=None):
+    """
+    {"tier", "step", "from", "to", "series": {svc: {"t", "rps", "latency", "error_ratio", "p99"}}}
+    with one point per `step` (rounded to a multiple of the tier step), oldest first, up
+    to the last complete bucket. Points with no record at all are None.
+    Reads only the records in range from a single tier, in one round trip.
+    redis_conn must return bytes (decode_responses=False).
+    """
+    now = now or time.time()
+    end = min(end, now)
+    name, tier_step, retention = pick_tier(start, end, step, now)
+    points = retention // tier_step
+    last = int(end // tier_step)
+    # The bucket `now` falls in is still filling: left out
+    if (last + 1) * tier_step > now: last -= 1
+    first = max(int(start // tier_step), last - points + 1)
+    group = max(1, round(step / tier_step)) if step else max(1, math.ceil((last - first + 1) / MAX_POINTS))
+    # Whole groups only, aligned so repeated queries return the same points
+    first = max(first - first % group, last - points + 1)
+
+    # The range is one or two contiguous runs of the ring (two whenever it wraps, also
+    # when it covers the whole ring)
+    a, b = first % points, last % points
+    runs = [(first, a, b)] if a <= b else [(first, a, points - 1), (first + points - a, 0, b)]
+    if last < first: runs = []
+    pipe = redis_conn.pipeline(transaction=False)
+    for svc in services:
+        for _, lo, hi in runs: pipe.getrange(f"hist:{name}:{svc}", lo * RECORD.size, (hi + 1) * RECORD.size - 1)
+    raw = pipe.execute() if runs else []
+
+    out = {}
+    for k, svc in enumerate(services):
+        records = {}
+        for (bucket, _, _), blob in zip(runs, raw[k * len(runs):(k + 1) * len(runs)]):
+            for j, rec in enumerate(RECORD.iter_unpack(blob[:len(blob) - len(blob) % RECORD.size])):
+                if rec[0] == bucket + j: records[bucket + j] = rec
+        if not records: continue
+        series = {"t": [], "rps": [], "latency": [], "error_ratio": [], "p99": []}
+        for g in range(first, last + 1, group):
+            count = errors = known = 0
+            total_ms = p99 = 0.0
+            for bucket in range(g, min(g + group, last + 1)):
+                rec = records.get(bucket)
+                if rec is None: continue
+                known += 1
+                count, errors, total_ms, p99 = count + rec[1], errors + rec[2], total_ms + rec[3], max(p99, rec[4])
+            series["t"].append(g * tier_step)
+            if not known:
+                # Nothing recorded (aggregator down, service not followed yet): unknown, not idle
+                for key in ("rps", "latency", "error_ratio", "p99"): series[key].append(None)
+                continue
+            series["rps"].append(round(count / (known * tier_step), 2))
+            series["latency"].append(round(total_ms / count, 3) if count else 0.0)
+            series["error_ratio"].append(round(errors / count, 4) if count else 0.0)
+            series["p99"].append(round(p99, 3))
+        out[svc] = series
+    return {"tier": name, "step": group * tier_step, "from": first * tier_step, "to": (last + 1) * tier_step, "series": out}
@@ -0,0 +1,321 @@
+import math
+import time
+from itertools import accumulate
+from common.sketch import LatencySketch
+
+# Rolling windows reported for every service. The first one is the default
+# that /api/graph exposes at the top level and the controller acts on.
+WINDOWS = {"10s": 10, "1m": 60, "5m": 300}
+DEFAULT_WINDOW = "10s"
+# An edge with no connect() and no traffic for this long is dropped from the graph
+EDGE_TTL = 60
+
+def split_int(n, bounds):
+    """Cut n at cumulative fractions `bounds` (the last is 1): the pieces add up to n exactly."""
+    # Rounded first: a cut that lands on a whole count (steady rate) must not lose it to float error
+    cuts = [math.floor(round(n * b, 6)) for b in bounds]
+    return [c - p for c, p in zip(cuts, [0] + cuts[:-1])]
+
+def covered_seconds(seconds, now, started, slot_seconds):
+    """Length of a window of complete slots, shorter while the history since `started` is."""
+    return min(seconds, (now // slot_seconds) * slot_seconds - started)
+
+class Partial:
+    """Additive aggregate: merging two partials is exact (counts and buckets add)."""
+
+    __slots__ = ("count", "sum_us", "errors", "sketch", "responses")
+
+    def __init__(self, count=0, sum_us=0, errors=0, sketch=None, responses=None):
+        self.count = count
+        self.sum_us = sum_us
+        self.errors = errors
+        self.sketch = sketch if sketch is not None else LatencySketch()
+        self.responses = responses if responses is not None else {}
+
+    @classmethod
+    def from_agent(cls, m):
+        return cls(m.get("count", 0), m.get("sum_us", 0), m.get("errors", 0),
+                   LatencySketch.from_wire(m.get("sketch", [])), dict(m.get("responses", {})))
+
+    def to_wire(self):
+        """Same shape as an agent's per-service counters, so from_agent() reads it back."""
+        return {"count": self.count, "sum_us": self.sum_us, "errors": self.errors,
+                "responses": self.responses, "sketch": self.sketch.to_wire()}
+
+    def minus(self, prev):
+        """Delta between two cumulative readings of the same counters."""
+        buckets = {}
+        for idx, n in self.sketch.buckets.items():
+            d = n - prev.sketch.buckets.get(idx, 0)
+            if d > 0: buckets[idx] = d
+        responses = {}
+        for cls, n in self.responses.items():
+            d = n - prev.responses.get(cls, 0)
+            if d > 0: responses[cls] = d
+        return Partial(self.count - prev.count, self.sum_us - prev.sum_us,
+                       self.errors - prev.errors, LatencySketch(buckets), responses)
+
+    def split(self, bounds):
+        """Pieces at cumulative fractions `bounds` (the last is 1); merged back they give this partial."""
+        counts = split_int(self.count, bounds)
+        # Latency sums follow the counts, so every piece keeps the mean
+        sums = split_int(self.sum_us, [c / self.count for c in accumulate(counts)] if self.count else bounds)
+        errors = split_int(self.errors, bounds)
+        buckets = {idx: split_int(n, bounds) for idx, n in self.sketch.buckets.items()}
+        responses = {cls: split_int(n, bounds) for cls, n in self.responses.items()}
+        return [Partial(counts[k], sums[k], errors[k],
+                        LatencySketch({idx: v[k] for idx, v in buckets.items() if v[k]}),
+                        {cls: v[k] for cls, v in responses.items() if v[k]}) for k in range(len(bounds))]
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum_us += other.sum_us
+        self.errors += other.errors
+        self.sketch.merge(other.sketch)
+        for cls, n in other.responses.items():
+            self.responses[cls] = self.responses.get(cls, 0) + n
+        return self
+
+    def stats(self, seconds):
+        seconds = max(seconds, 1)
+        # Timed-out/reset requests never produce a latency sample, so they add to the total
+        total = self.count + self.responses.get("timeout", 0) + self.responses.get("reset", 0)
+        return {
+            "latency": round(self.sum_us / self.count / 1000.0, 3) if self.count else 0,
+            "rps": round(self.count / seconds, 2),
+            "error_rate": round(self.errors / seconds, 2),
+            "error_ratio": round(self.errors / total, 4) if total else 0,
+            "count": self.count,
+            "responses": dict(self.responses),
+            **self.sketch.percentiles_ms()
+        }
+
+class EdgePartial(Partial):
+    """Partial for one call edge (src -> dst): no latency histogram, bytes exchanged instead."""
+
+    __slots__ = ("bytes",)
+
+    def __init__(self, count=0, sum_us=0, errors=0, nbytes=0):
+        super().__init__(count, sum_us, errors)
+        self.bytes = nbytes
+
+    @classmethod
+    def from_agent(cls, e):
+        return cls(e.get("count", 0), e.get("sum_us", 0), e.get("errors", 0), e.get("bytes", 0))
+
+    def to_wire(self):
+        return {"count": self.count, "sum_us": self.sum_us, "errors": self.errors, "bytes": self.bytes}
+
+    def minus(self, prev):
+        return EdgePartial(self.count - prev.count, self.sum_us - prev.sum_us,
+                           self.errors - prev.errors, self.bytes - prev.bytes)
+
+    def split(self, bounds):
+        counts = split_int(self.count, bounds)
+        sums = split_int(self.sum_us, [c / self.count for c in accumulate(counts)] if self.count else bounds)
+        return [EdgePartial(*piece) for piece in
+                zip(counts, sums, split_int(self.errors, bounds), split_int(self.bytes, bounds))]
+
+    def merge(self, other):
+        super().merge(other)
+        self.bytes += other.bytes
+        return self
+
+    def stats(self, seconds):
+        seconds = max(seconds, 1)
+        return {
+            "latency": round(self.sum_us / self.count / 1000.0, 3) if self.count else 0,
+            "rps": round(self.count / seconds, 2),
+            "error_ratio": round(self.errors / self.count, 4) if self.count else 0,
+            "bytes_per_s": round(self.bytes / seconds, 1),
+            "count": self.count
+        }
+
+class RollingWindows:
+    """
+    Fixed ring of time slots for one service. Each slot keeps one partial per agent,
+    so a service running on several nodes is summed, never overwritten. A delta is
+    spread over the slots between the two readings it came from, so scrape rounds
+    that don't line up with the slots still fill every slot with what was counted in it.
+    """
+
+    def __init__(self, slot_seconds=2, horizon=max(WINDOWS.values()), partial=Partial):
+        self.slot_seconds = slot_seconds
+        self.partial = partial
+        self.size = horizon // slot_seconds + 1
+        self.epochs = [-1] * self.size
+        self.slots = [None] * self.size
+        self.last_update = 0
+
+    def add(self, agent, partial, now, since=None):
+        """`partial` was counted between `since` (default: just now) and `now`."""
+        s = self.slot_seconds
+        since = min(now, since if since is not None else now)
+        first, last = int(since // s), int(now // s)
+        if first == last: pieces = [(last, partial)]
+        else:
+            # Share of the interval that fell into each slot; what is older than the ring is dropped
+            bounds = [(min(now, (e + 1) * s) - since) / (now - since) for e in range(first, last + 1)]
+            bounds[-1] = 1.0
+            keep = max(first, last - self.size + 1)
+            pieces = [(e, p) for e, p in zip(range(first, last + 1), partial.split(bounds)) if e >= keep]
+        for epoch, p in pieces:
+            i = epoch % self.size
+            if self.epochs[i] != epoch:
+                self.epochs[i] = epoch
+                self.slots[i] = {}
+            per_agent = self.slots[i]
+            if agent in per_agent: per_agent[agent].merge(p)
+            else: per_agent[agent] = p
+        self.last_update = now
+
+    def slot(self, epoch):
+        """Everything counted in one slot (epoch = time // slot_seconds)."""
+        merged = self.partial()
+        i = epoch % self.size
+        if self.epochs[i] == epoch:
+            for p in self.slots[i].values(): merged.merge(p)
+        return merged
+
+    def window(self, seconds, now):
+        """The complete slots of the last `seconds`: the one `now` falls in is still filling."""
+        last = int(now // self.slot_seconds) - 1
+        oldest = last - seconds // self.slot_seconds
+        merged = self.partial()
+        for epoch, per_agent in zip(self.epochs, self.slots):
+            if not oldest < epoch <= last or per_agent is None: continue
+            for p in per_agent.values(): merged.merge(p)
+        return merged
+
+class Rollups:
+    """
+    Agents export cumulative counters. Each scraper keeps its own previous reading per
+    (agent, service) and turns the difference into a partial, so rates are computed
+    here and any number of scrapers can read the same agent.
+    """
+
+    def __init__(self, slot_seconds=2):
+        self.slot_seconds = slot_seconds
+        self.services = {}
+        self.edges = {}     # (src, dst) -> RollingWindows of EdgePartial
+        self.edge_seen = {} # (src, dst) -> last connect/traffic seen by any agent
+        self.previous = {}  # (agent, svc or (src, dst)) -> (agent_start, cumulative Partial, seen at)
+        self.agents = {}    # agent -> agent_start of the last reading
+        self.read_at = {}   # agent -> time of the last reading
+        self.started = time.time()
+
+    def _delta(self, agent, key, agent_start, current, new_since, now):
+        """(Partial counted since the previous reading of `key` from `agent`, counted since when), or None."""
+        prev = self.previous.get((agent, key))
+        self.previous[(agent, key)] = (agent_start, current, now)
+
+        if prev is not None and prev[0] == agent_start and current.count >= prev[1].count:
+            delta, since = current.minus(prev[1]), prev[2]
+        elif new_since is not None:
+            # New service on an agent we already follow, or an agent that (re)started
+            # moments ago: everything it counted is new
+            delta, since = current, new_since
+        else:
+            # First reading of a long-running agent: only a baseline, not a burst
+            return None
+        if delta.count <= 0 and delta.errors <= 0: return None
+        return delta, since
+
+    def ingest(self, agent, payload, now=None):
+        now = now or time.time()
+        agent_start = payload.get("agent_start", 0)
+        known_agent = self.agents.get(agent) == agent_start
+        # Where counters seen for the first time started counting
+        if known_agent: new_since = self.read_at.get(agent, now)
+        elif now - agent_start < 2 * self.slot_seconds: new_since = agent_start
+        else: new_since = None
+        self.agents[agent] = agent_start
+        self.read_at[agent] = now
+        for svc, m in payload.get("metrics", {}).items():
+            delta = self._delta(agent, svc, agent_start, Partial.from_agent(m), new_since, now)
+            if delta is None: continue
+            rw = self.services.get(svc)
+            if rw is None: rw = self.services[svc] = RollingWindows(self.slot_seconds)
+            rw.add(agent, delta[0], now, delta[1])
+
+        edges = payload.get("edges")
+        if edges is None:
+            # Agent without edge counters: every reported link counts as seen now
+            edges = [{"src": src, "dst": dst, "last_seen": now}
+                     for src, dests in payload.get("topology", {}).items() for dst in dests]
+        for e in edges:
+            key = (e["src"], e["dst"])
+            self.edge_seen[key] = max(self.edge_seen.get(key, 0), e.get("last_seen", now))
+            delta = self._delta(agent, key, agent_start, EdgePartial.from_agent(e), new_since, now)
+            if delta is None: continue
+            rw = self.edges.get(key)
+            if rw is None: rw = self.edges[key] = RollingWindows(self.slot_seconds, partial=EdgePartial)
+            rw.add(agent, delta[0], now, delta[1])
+
+    def ingest_all(self, payloads, now=None):
+        """ingest() every {agent: payload}; a payload that fails is logged and skipped. Returns how many failed."""
+        failed = 0
+        for agent, data in payloads.items():
+            try: self.ingest(agent, data, now)
+            except Exception as e:
+                failed += 1
+                print(f"⚠️ Ingest failed for {agent}: {e}", flush=True)
+        return failed
+
+    def slots(self, epoch):
+        """{svc: Partial} counted in one slot (epoch = time // slot_seconds), every service we follow."""
+        return {svc: rw.slot(epoch) for svc, rw in list(self.services.items())}
+
+    def forget(self, agents):
+        """Drop the readings of agents another scraper took over: if they come back, the first is a baseline again."""
+        agents = set(agents)
+        for key in [k for k in self.previous if k[0] in agents]: del self.previous[key]
+        for agent in agents:
+            self.agents.pop(agent, None)
+            self.read_at.pop(agent, None)
+
+    def partials(self, now=None):
+        """{svc: {window: Partial}} for every service with data inside the longest window."""
+        now = now or time.time()
+        horizon = max(WINDOWS.values())
+        for key, (_, _, seen) in list(self.previous.items()):
+            if now - seen > horizon: del self.previous[key]
+        out = {}
+        for svc, rw in list(self.services.items()):
+            if now - rw.last_update > horizon:
+                del self.services[svc]
+                continue
+            out[svc] = {name: rw.window(seconds, now) for name, seconds in WINDOWS.items()}
+        return out
+
+    def merged(self, now=None):
+        """{svc: {window: stats}}, see partials()."""
+        now = now or time.time()
+        # Right after start-up a window is only as long as the history we have
+        return {svc: {name: p.stats(covered_seconds(WINDOWS[name], now, self.started, self.slot_seconds))
+                      for name, p in windows.items()}
+                for svc, windows in self.partials(now).items()}
+
+    def edge_partials(self, now=None, ttl=EDGE_TTL):
+        """{(src, dst): (EdgePartial over the default window, last_seen)} for edges used within `ttl`."""
+        now = now or time.time()
+        seconds = WINDOWS[DEFAULT_WINDOW]
+        out = {}
+        for key, seen in list(self.edge_seen.items()):
+            if now - seen > ttl:
+                # Stale dependency: forget it so it stops weighing on decisions
+                del self.edge_seen[key]
+                self.edges.pop(key, None)
+                continue
+            rw = self.edges.get(key)
+            out[key] = (rw.window(seconds, now) if rw else EdgePartial(), seen)
+        return out
+
+    def merged_edges(self, now=None, ttl=EDGE_TTL):
+        """{src: {dst: stats over the default window + last_seen}}, see edge_partials()."""
+        now = now or time.time()
+        seconds = covered_seconds(WINDOWS[DEFAULT_WINDOW], now, self.started, self.slot_seconds)
+        out = {}
+        for (src, dst), (p, seen) in self.edge_partials(now, ttl).items():
+            out.setdefault(src, {})[dst] = {**p.stats(seconds), "last_seen": round(seen, 1)}
+        return out
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from common import wire
+
+class AgentScraper:
+    """
+    Scrapes all agents of a round concurrently.
+
+    - One shared Session: urllib3 keeps a keep-alive connection per agent between rounds.
+    - Bounded concurrency: at most max_workers requests in flight.
+    - Per-agent deadline: (connect, read) timeouts on every request, plus a hard
+      round deadline after which stragglers are abandoned and reported as timed out.
+    - Compact wire format (common/wire.py): msgpack or compact JSON with topology and
+      counters sent as deltas since this scraper's last decoded payload, compressed
+      with whatever urllib3 can decode. Agents that don't know it answer plain JSON.
+    """
+
+    def __init__(self, max_workers=32, connect_timeout=0.3, read_timeout=1.0, round_deadline=1.5, max_agents=1024,
+                 compact=True):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape")
+        self.timeout = (connect_timeout, read_timeout)
+        self.round_deadline = round_deadline
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_agents, pool_maxsize=2, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.accept = wire.accept_header() if compact else wire.JSON
+        self.decoders = {}  # agent -> WireDecoder
+
+    def _fetch(self, url, decoder):
+        start = time.perf_counter()
+        headers = {"Accept": self.accept}
+        if decoder.ack: headers["X-Wire-Ack"] = decoder.ack
+        response = self.session.get(url, timeout=self.timeout, headers=headers)
+        response.raise_for_status()
+        # urllib3 undoes Content-Encoding; the raw length is what crossed the network
+        size = int(response.headers.get("Content-Length", 0))
+        data = decoder.decode(response.content, response.headers.get("Content-Type", wire.JSON))
+        return data, time.perf_counter() - start, size
+
+    def scrape(self, targets):
+        """targets: {agent_name: url}. Returns ({agent_name: payload}, timing stats)."""
+        start = time.perf_counter()
+        # Agents we no longer scrape start over from a full payload if they come back
+        for name in [n for n in self.decoders if n not in targets]: del self.decoders[name]
+        decoders = {name: self.decoders.setdefault(name, wire.WireDecoder()) for name in targets}
+        futures = {self.pool.submit(self._fetch, url, decoders[name]): name for name, url in targets.items()}
+        done, not_done = wait(futures, timeout=self.round_deadline)
+        for f in not_done: f.cancel()
+
+        results = {}
+        latencies = []
+        failed = 0
+        received = 0
+        for f in done:
+            try:
+                data, elapsed, size = f.result()
+                results[futures[f]] = data
+                latencies.append(elapsed)
+                received += size
+            except Exception:
+                failed += 1
+
+        latencies.sort()
+        stats = {
+            "agents": len(targets),
+            "ok": len(results),
+            "failed": failed,
+            "timed_out": len(not_done),
+            "scrape_s": time.perf_counter() - start,
+            "p50_s": latencies[len(latencies) // 2] if latencies else 0.0,
+            "max_s": latencies[-1] if latencies else 0.0,
+            "bytes": received,
+        }
+        return results, stats
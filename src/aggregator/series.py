@@ -0,0 +1,84 @@
+import math
+from array import array
+
+# How many slots of history every service keeps (2s slots: 10 minutes)
+SERIES_LENGTH = 300
+NAN = float("nan")
+
+class Ring:
+    """Fixed-size ring of (rps, mean latency ms) per completed slot, one float each (NaN: not recorded)."""
+
+    __slots__ = ("rps", "latency", "last_epoch")
+
+    def __init__(self, length):
+        self.rps = array("f", [NAN]) * length
+        self.latency = array("f", [NAN]) * length
+        self.last_epoch = None
+
+    def put(self, epoch, rps, latency):
+        size = len(self.rps)
+        if self.last_epoch is not None:
+            # Slots nobody recorded: unknown, not idle
+            for e in range(max(self.last_epoch + 1, epoch - size + 1), epoch):
+                self.rps[e % size] = self.latency[e % size] = NAN
+        self.rps[epoch % size] = rps
+        self.latency[epoch % size] = latency
+        self.last_epoch = epoch
+
+    def tail(self, epoch, points):
+        """The `points` slots ending at `epoch`, oldest first (None where unknown)."""
+        size = len(self.rps)
+        out_rps, out_lat = [], []
+        for e in range(epoch - points + 1, epoch + 1):
+            known = self.last_epoch is not None and self.last_epoch - size < e <= self.last_epoch
+            rps, latency = self.rps[e % size], self.latency[e % size]
+            known = known and not math.isnan(rps)
+            out_rps.append(round(rps, 2) if known else None)
+            out_lat.append(round(latency, 3) if known else None)
+        return out_rps, out_lat
+
+class SeriesStore:
+    """
+    Per-service request rate and latency history at slot resolution, for forecasting.
+    Every sync round records the rollups' slots completed since the previous one.
+    """
+
+    def __init__(self, slot_seconds=2, length=SERIES_LENGTH):
+        self.slot_seconds = slot_seconds
+        self.length = length
+        self.rings = {}
+        self.epoch = None  # last complete slot recorded
+
+    def record(self, rollups, now):
+        """Record every slot completed since the last call. Returns {epoch: {svc: Partial}} of those."""
+        last = int(now // self.slot_seconds) - 1
+        # The slot the rollups started in is only partly counted
+        first = int(rollups.started // self.slot_seconds) + 1
+        if self.epoch is not None: first = max(first, self.epoch + 1)
+        recorded = {}
+        for epoch in range(max(first, last - self.length + 1), last + 1):
+            recorded[epoch] = rollups.slots(epoch)
+            self.put(epoch, recorded[epoch])
+        return recorded
+
+    def put(self, epoch, slots):
+        """slots: {svc: Partial} counted in slot `epoch`; services missing from it are dropped."""
+        for svc, p in slots.items():
+            ring = self.rings.get(svc)
+            if ring is None: ring = self.rings[svc] = Ring(self.length)
+            ring.put(epoch, p.count / self.slot_seconds, p.sum_us / p.count / 1000.0 if p.count else 0.0)
+        for svc in [s for s in self.rings if s not in slots]: del self.rings[svc]
+        self.epoch = epoch
+
+    def query(self, services=None, points=None):
+        """{"step", "end", "series": {svc: {"rps": [...], "latency": [...]}}}, oldest sample first."""
+        points = min(points or self.length, self.length)
+        out = {}
+        if self.epoch is not None:
+            for svc in services or list(self.rings):
+                ring = self.rings.get(svc)
+                if ring is None: continue
+                rps, latency = ring.tail(self.epoch, points)
+                out[svc] = {"rps": rps, "latency": latency}
+        end = (self.epoch + 1) * self.slot_seconds if self.epoch is not None else None
+        return {"step": self.slot_seconds, "end": end, "series": out}
@@ -0,0 +1,178 @@
+import bisect
+import hashlib
+import json
+import time
+from rollup import Partial, EdgePartial, WINDOWS, DEFAULT_WINDOW, covered_seconds
+import history
+import store
+
+# Sharded mode: every aggregator replica scrapes only the agents the hash ring gives
+# it and publishes what it counted as mergeable partials; any replica can merge them.
+#
+# Redis layout (next to store.py's)
+#   aggregators        ZSET of replica ids scored by last heartbeat; members older than
+#                           the member TTL are pruned by whoever heartbeats next
+#   partial:{replica}  STRING JSON export() of one replica's rollups (expires with the member)
+
+MEMBERS_KEY = "aggregators"
+MEMBER_TTL = 10
+# Slots of series history each replica exports, so replicas out of phase still line up
+EXPORT_SLOTS = 3
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hashing: when a replica joins or leaves only ~1/n of the agents move."""
+
+    def __init__(self, members=(), vnodes=64):
+        self.members = tuple(sorted(members))
+        points = sorted((ring_hash(f"{m}#{i}"), m) for m in self.members for i in range(vnodes))
+        self.hashes = [h for h, _ in points]
+        self.owners = [m for _, m in points]
+
+    def owner(self, key):
+        if not self.hashes: return None
+        return self.owners[bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)]
+
+def export(rollups, now):
+    """One replica's contribution: window partials, edge partials and the last slots, as JSON."""
+    epoch = int(now // rollups.slot_seconds) - 1
+    slots = {}
+    for e in range(epoch - EXPORT_SLOTS + 1, epoch + 1):
+        slots[e] = {svc: p.to_wire() for svc, p in rollups.slots(e).items() if p.count or p.errors}
+    return json.dumps({
+        "at": now,
+        "started": rollups.started,
+        "services": {svc: {name: p.to_wire() for name, p in windows.items()}
+                     for svc, windows in rollups.partials(now).items()},
+        "edges": [{"src": src, "dst": dst, **p.to_wire(), "last_seen": seen}
+                  for (src, dst), (p, seen) in rollups.edge_partials(now).items()],
+        "slots": slots
+    })
+
+def merge(exports, now, slot_seconds=2):
+    """
+    Sum every replica's partials. Returns what a single aggregator would have computed:
+    ({svc: {window: stats}}, {src: {dst: stats}}, {epoch: {svc: Partial counted in that slot}})
+    with the slots every replica has completed.
+    """
+    services, edges = {}, {}
+    epochs = set.intersection(*(set(x["slots"]) for x in exports)) if exports else set()
+    slots = {int(e): {} for e in epochs}
+    started = min((x["started"] for x in exports), default=now)
+    for x in exports:
+        for svc, windows in x["services"].items():
+            acc = services.setdefault(svc, {})
+            for name, m in windows.items():
+                p = Partial.from_agent(m)
+                if name in acc: acc[name].merge(p)
+                else: acc[name] = p
+        for e in x["edges"]:
+            key = (e["src"], e["dst"])
+            p = EdgePartial.from_agent(e)
+            if key in edges: edges[key] = (edges[key][0].merge(p), max(edges[key][1], e["last_seen"]))
+            else: edges[key] = (p, e["last_seen"])
+        for e in epochs:
+            acc = slots[int(e)]
+            for svc, m in x["slots"][e].items():
+                p = Partial.from_agent(m)
+                if svc in acc: acc[svc].merge(p)
+                else: acc[svc] = p
+
+    merged = {svc: {name: acc.get(name, Partial()).stats(covered_seconds(seconds, now, started, slot_seconds))
+                    for name, seconds in WINDOWS.items()} for svc, acc in services.items()}
+    seconds = covered_seconds(WINDOWS[DEFAULT_WINDOW], now, started, slot_seconds)
+    merged_edges = {}
+    for (src, dst), (p, seen) in edges.items():
+        merged_edges.setdefault(src, {})[dst] = {**p.stats(seconds), "last_seen": round(seen, 1)}
+    # Services that only appear in the windows still get a (zero) sample, as in SeriesStore.record
+    for acc in slots.values():
+        for svc in services: acc.setdefault(svc, Partial())
+    return merged, merged_edges, slots
+
+class ShardMember:
+    """
+    Membership of one replica. Every round: heartbeat, prune replicas that stopped
+    heartbeating, rebuild the ring if the live set changed. The lowest live id is the
+    leader and the only one that writes the merged round to Redis.
+    """
+
+    def __init__(self, replica_id, ttl=MEMBER_TTL, vnodes=64):
+        self.replica_id = replica_id
+        self.ttl = ttl
+        self.vnodes = vnodes
+        self.ring = HashRing((replica_id,), vnodes)
+
+    @property
+    def members(self):
+        return self.ring.members
+
+    @property
+    def leader(self):
+        return self.ring.members[0] == self.replica_id
+
+    def heartbeat(self, redis_conn, now=None):
+        """One round trip. Returns True when the ring changed."""
+        now = now or time.time()
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.zadd(MEMBERS_KEY, {self.replica_id: now})
+        pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now - self.ttl)
+        pipe.zrange(MEMBERS_KEY, 0, -1)
+        members = tuple(sorted(pipe.execute()[2]))
+        if members == self.ring.members: return False
+        joined = set(members) - set(self.ring.members)
+        left = set(self.ring.members) - set(members)
+        self.ring = HashRing(members, self.vnodes)
+        print(f"🔀 Rebalanced: {len(members)} replicas (joined {sorted(joined)}, left {sorted(left)}) | "
+              f"leader {members[0]}", flush=True)
+        return True
+
+    def owns(self, agent):
+        return self.ring.owner(agent) == self.replica_id
+
+    def exchange(self, redis_conn, payload):
+        """Publish our partials and read every live replica's, in one round trip."""
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.set(f"partial:{self.replica_id}", payload, ex=self.ttl)
+        pipe.mget([f"partial:{m}" for m in self.members])
+        return [json.loads(x) for x in pipe.execute()[1] if x]
+
+    def leave(self, redis_conn):
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.zrem(MEMBERS_KEY, self.replica_id)
+        pipe.delete(f"partial:{self.replica_id}")
+        pipe.execute()
+
+def run_round(member, redis_conn, scraper, rollups, series, agents):
+    """
+    One sharded sync round over `agents` ({name: url}, every running agent): heartbeat,
+    scrape the ones the ring gives us, ingest, exchange partials, merge, leader writes,
+    build the graph. Returns (graph, merged, scrape stats + ingest_failed and write_s).
+    """
+    if member.heartbeat(redis_conn):
+        rollups.forget([a for a in list(rollups.agents) if not member.owns(a)])
+
+    # 1. SCRAPE OUR AGENTS
+    payloads, stats = scraper.scrape({name: url for name, url in agents.items() if member.owns(name)})
+
+    # 2. ADD PER-AGENT PARTIALS TO THE ROLLING WINDOWS
+    write_start = time.perf_counter()
+    now = time.time()
+    stats["ingest_failed"] = rollups.ingest_all(payloads, now)
+
+    # 3. PUBLISH OUR PARTIALS, MERGE EVERY LIVE REPLICA'S (one round trip)
+    exports = member.exchange(redis_conn, export(rollups, now))
+    merged, edges, slots = merge(exports, now, rollups.slot_seconds)
+    slots = {e: p for e, p in sorted(slots.items()) if series.epoch is None or e > series.epoch}
+    for epoch, partials in slots.items(): series.put(epoch, partials)
+
+    # 4. ONLY THE LEADER DUMPS THE MERGED ROUND (AND THE HISTORY) TO REDIS
+    if member.leader:
+        store.write_round(redis_conn, merged, edges, now)
+        for epoch, partials in slots.items(): history.write_slot(redis_conn, epoch * rollups.slot_seconds, partials)
+
+    # 5. THE GRAPH, FROM THIS ROUND'S MERGE (on every replica)
+    graph = store.graph(merged, edges)
+    stats["write_s"] = time.perf_counter() - write_start
+    return graph, merged, stats
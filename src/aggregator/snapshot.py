@@ -0,0 +1,98 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+class GraphSnapshot:
+    """Immutable, pre-serialized /api/graph response built once per sync round."""
+
+    __slots__ = ("version", "data", "body", "etag", "built_at")
+
+    def __init__(self, version, data, body):
+        self.version = version
+        self.data = data
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        self.built_at = time.time()
+
+def edges(topology):
+    return {(src, dst) for src, dests in topology.items() for dst in dests}
+
+def diff(old, new):
+    """Changed/removed nodes, added/removed edges and changed edge metrics between two graph payloads."""
+    old_m, new_m = old["metrics"], new["metrics"]
+    old_e, new_e = edges(old["topology"]), edges(new["topology"])
+    old_x, new_x = old.get("edges", {}), new.get("edges", {})
+    return {
+        "metrics": {svc: m for svc, m in new_m.items() if old_m.get(svc) != m},
+        "removed_nodes": [svc for svc in old_m if svc not in new_m],
+        "edges_added": sorted([src, dst] for src, dst in new_e - old_e),
+        "edges_removed": sorted([src, dst] for src, dst in old_e - new_e),
+        "edge_metrics": [[src, dst, e] for src in sorted(new_x) for dst, e in sorted(new_x[src].items())
+                         if old_x.get(src, {}).get(dst) != e],
+    }
+
+class SnapshotStore:
+    """
+    Holds the current snapshot plus a short history of older versions so clients can
+    ask for a delta. Deltas are memoized per (since, current) pair: every client that
+    polls at the same cadence asks for the same one, so serving cost doesn't grow
+    with the number of clients.
+
+    Versions are "<store epoch>-<n>": a version from another aggregator replica, or
+    from before a restart, is unknown here and gets a full payload, never a diff
+    against the wrong base.
+    """
+
+    def __init__(self, history=30):
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.history = OrderedDict()
+        self.max_history = history
+        self.current = None
+        self.deltas = {}
+        self.epoch = "%x" % time.time_ns()
+        self.published = 0
+
+    def publish(self, data):
+        body = json.dumps(data, sort_keys=True).encode()
+        with self.lock:
+            # Unchanged round: keep version and ETag so conditional requests still hit
+            if self.current is not None and self.current.body == body: return self.current
+            self.published += 1
+            version = f"{self.epoch}-{self.published}"
+            snap = GraphSnapshot(version, data, body)
+            self.history[version] = snap
+            while len(self.history) > self.max_history: self.history.popitem(last=False)
+            self.current = snap
+            self.deltas = {}
+            self.changed.notify_all()
+            return snap
+
+    def wait_newer(self, version, timeout):
+        """Block until a snapshot newer than `version` is published. False on timeout."""
+        with self.lock:
+            return self.changed.wait_for(lambda: self.current is not None and self.current.version != version, timeout)
+
+    def delta(self, since):
+        """Delta from version `since` to now, or a full payload if `since` is too old."""
+        with self.lock:
+            snap = self.current
+            if snap is None: return None, None
+            cached = self.deltas.get(since)
+            if cached is not None: return snap, cached
+            base = self.history.get(since)
+
+        if since == snap.version:
+            out = {"version": snap.version, "since": since, "full": False,
+                   "metrics": {}, "removed_nodes": [], "edges_added": [], "edges_removed": [], "edge_metrics": []}
+        elif base is None:
+            out = {"version": snap.version, "since": since, "full": True, **snap.data}
+        else:
+            out = {"version": snap.version, "since": since, "full": False, **diff(base.data, snap.data)}
+        body = json.dumps(out).encode()
+
+        with self.lock:
+            if self.current is snap: self.deltas[since] = body
+        return snap, body
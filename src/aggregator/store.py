@@ -0,0 +1,104 @@
+import json
+from common.sketch import PERCENTILES
+import time
+from rollup import DEFAULT_WINDOW, EDGE_TTL
+
+# Redis layout
+#   services        SET  of every service seen
+#   metric:{svc}    HASH latency / rps / error_rate / error_ratio / count / p50..  for the default
+#                        window, plus "windows": JSON {window: same fields + responses by class}
+#                        (expires after 30s)
+#   topo:{src}      ZSET of downstream services scored by last seen; members older than
+#                        EDGE_TTL are trimmed on write and ignored on read
+#   edge:{src}      HASH dst -> JSON {rps, latency, error_ratio, bytes_per_s, count, last_seen}
+#
+# Both paths are batched: a sync round is one pipelined round trip and a graph
+# read is one EVALSHA, independent of the number of services.
+
+METRIC_TTL = 30
+
+# Returns {svc, metric hash as flat list, live topo members, edge hash as flat list}
+# for every service in one call. ARGV[1]: oldest last-seen score still considered live.
+READ_GRAPH_LUA = """
+local out = {}
+local services = redis.call('SMEMBERS', 'services')
+for i, svc in ipairs(services) do
+    out[i] = {svc, redis.call('HGETALL', 'metric:' .. svc),
+              redis.call('ZRANGEBYSCORE', 'topo:' .. svc, ARGV[1], '+inf'),
+              redis.call('HGETALL', 'edge:' .. svc)}
+end
+return out
+"""
+
+_read_graph = None
+
+def metric_fields(windows):
+    """windows: {window: stats} as produced by Rollups.merged()."""
+    return {
+        **{k: str(v) for k, v in windows[DEFAULT_WINDOW].items() if not isinstance(v, dict)},
+        "windows": json.dumps(windows)
+    }
+
+def write_round(redis_conn, merged, edges, now=None):
+    """merged: {svc: {window: stats}}, edges: {src: {dst: stats}} (Rollups.merged_edges). One round trip."""
+    now = now or time.time()
+    pipe = redis_conn.pipeline(transaction=False)
+    services = set(merged)
+    for svc, windows in merged.items():
+        pipe.hset(f"metric:{svc}", mapping=metric_fields(windows))
+        # Set expiry so old dead nodes eventually disappear (30s)
+        pipe.expire(f"metric:{svc}", METRIC_TTL)
+    for src, dests in edges.items():
+        if not dests: continue
+        pipe.zadd(f"topo:{src}", {dst: e["last_seen"] for dst, e in dests.items()})
+        pipe.zremrangebyscore(f"topo:{src}", "-inf", now - EDGE_TTL)
+        pipe.expire(f"topo:{src}", EDGE_TTL)
+        pipe.delete(f"edge:{src}")
+        pipe.hset(f"edge:{src}", mapping={dst: json.dumps(e) for dst, e in dests.items()})
+        pipe.expire(f"edge:{src}", METRIC_TTL)
+        # Ensure both sides are in the service list
+        services.add(src)
+        services.update(dests)
+    if services: pipe.sadd("services", *services)
+    pipe.execute()
+
+def parse_metric(m):
+    if not m:
+        # Default if no traffic right now
+        return {"latency": 0, "rps": 0, "error_rate": 0, "error_ratio": 0, "count": 0, "responses": {},
+                **{p: 0 for p in PERCENTILES}}
+    windows = json.loads(m.get("windows", "{}"))
+    return {
+        "latency": float(m["latency"]),
+        "rps": float(m["rps"]),
+        "error_rate": float(m["error_rate"]),
+        "error_ratio": float(m.get("error_ratio", 0)),
+        "count": int(m["count"]),
+        "responses": windows.get(DEFAULT_WINDOW, {}).get("responses", {}),
+        **{p: float(m.get(p, 0)) for p in PERCENTILES},
+        "windows": windows
+    }
+
+def graph(merged, edges):
+    """What read_graph() returns right after write_round(merged, edges), without the round trip."""
+    services = set(merged) | set(edges) | {dst for dests in edges.values() for dst in dests}
+    return {"metrics": {svc: parse_metric(metric_fields(merged[svc]) if svc in merged else {}) for svc in services},
+            "topology": {src: sorted(dests) for src, dests in edges.items() if dests},
+            "edges": {src: dict(dests) for src, dests in edges.items() if dests}}
+
+def read_graph(redis_conn, now=None):
+    global _read_graph
+    # EVALSHA, falls back to EVAL once if the server doesn't have the script cached
+    if _read_graph is None: _read_graph = redis_conn.register_script(READ_GRAPH_LUA)
+    now = now or time.time()
+
+    resp_metrics = {}
+    resp_topo = {}
+    resp_edges = {}
+    for svc, flat, links, edge_flat in _read_graph(args=[now - EDGE_TTL], client=redis_conn):
+        resp_metrics[svc] = parse_metric(dict(zip(flat[::2], flat[1::2])))
+        if links:
+            resp_topo[svc] = sorted(links)
+            stats = dict(zip(edge_flat[::2], edge_flat[1::2]))
+            resp_edges[svc] = {dst: json.loads(stats[dst]) for dst in links if dst in stats}
+    return {"metrics": resp_metrics, "topology": resp_topo, "edges": resp_edges}
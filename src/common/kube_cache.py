@@ -0,0 +1,134 @@
+import threading
+import time
+
+# Informer-style cache: one LIST, then a WATCH that resumes from the last seen
+# resourceVersion. Readers get an in-memory view and never touch the apiserver.
+#
+#   pods = Informer(v1.list_namespaced_pod, "default",
+#                   field_selector=f"spec.nodeName={node}")      # only this node
+#   pods.add_handler(lambda kind, obj, old: ...)                 # incremental updates
+#   pods.start(); pods.wait_synced()
+#   pods.list(), pods.get("default/my-pod"), pods.by_index("app", "svc-cpu")
+
+def meta(obj, field):
+    """Read a metadata field from a typed model or a raw dict (custom objects)."""
+    if isinstance(obj, dict):
+        m = obj.get("metadata", {})
+        return m.get({"resource_version": "resourceVersion"}.get(field, field))
+    return getattr(obj.metadata, field, None)
+
+def object_key(obj):
+    return f"{meta(obj, 'namespace')}/{meta(obj, 'name')}"
+
+class Informer:
+    def __init__(self, list_func, *args, label_selector=None, field_selector=None,
+                 indexers=None, watch_timeout=300, **kwargs):
+        self.list_func = list_func
+        self.args = args
+        self.kwargs = dict(kwargs)
+        if label_selector: self.kwargs["label_selector"] = label_selector
+        if field_selector: self.kwargs["field_selector"] = field_selector
+        self.indexers = indexers or {}
+        self.watch_timeout = watch_timeout
+
+        self.lock = threading.Lock()
+        self.store = {}
+        self.indices = {name: {} for name in self.indexers}
+        self.handlers = []
+        self.resource_version = None
+        self.synced = threading.Event()
+
+    # --- READ SIDE ---
+    def list(self):
+        with self.lock: return list(self.store.values())
+
+    def get(self, key):
+        with self.lock: return self.store.get(key)
+
+    def by_index(self, name, value):
+        with self.lock: return [self.store[k] for k in self.indices[name].get(value, ())]
+
+    def add_handler(self, fn):
+        """fn(event_type, obj, old_obj) with event_type in ADDED / MODIFIED / DELETED."""
+        self.handlers.append(fn)
+
+    def wait_synced(self, timeout=None):
+        return self.synced.wait(timeout)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    # --- WRITE SIDE ---
+    def _index(self, key, obj, add):
+        for name, fn in self.indexers.items():
+            for value in fn(obj) or ():
+                keys = self.indices[name].setdefault(value, set())
+                if add: keys.add(key)
+                else:
+                    keys.discard(key)
+                    if not keys: del self.indices[name][value]
+
+    def _apply(self, event_type, obj):
+        key = object_key(obj)
+        with self.lock:
+            old = self.store.get(key)
+            if old is not None: self._index(key, old, add=False)
+            if event_type == "DELETED":
+                self.store.pop(key, None)
+            else:
+                self.store[key] = obj
+                self._index(key, obj, add=True)
+        for fn in self.handlers:
+            try: fn(event_type, obj, old)
+            except Exception as e: print(f"Informer handler error: {e}", flush=True)
+
+    def _relist(self):
+        resp = self.list_func(*self.args, **self.kwargs)
+        if isinstance(resp, dict):
+            items, rv = resp.get("items", []), resp.get("metadata", {}).get("resourceVersion")
+        else:
+            items, rv = resp.items, resp.metadata.resource_version
+
+        fresh = {object_key(obj): obj for obj in items}
+        # Objects that vanished while we were not watching
+        for key in [k for k in self.store if k not in fresh]:
+            self._apply("DELETED", self.store[key])
+        for key, obj in fresh.items():
+            self._apply("MODIFIED" if key in self.store else "ADDED", obj)
+
+        self.resource_version = rv
+        self.synced.set()
+
+    def run(self):
+        # Only the watch loop needs the client library; the cache itself works without it
+        from kubernetes import watch
+        from kubernetes.client.rest import ApiException
+        backoff = 1
+        while True:
+            try:
+                if self.resource_version is None: self._relist()
+
+                w = watch.Watch()
+                for event in w.stream(self.list_func, *self.args, resource_version=self.resource_version,
+                                      timeout_seconds=self.watch_timeout, allow_watch_bookmarks=True, **self.kwargs):
+                    event_type, obj = event["type"], event["object"]
+                    if event_type == "ERROR":
+                        # 410 Gone: our resourceVersion was compacted away, start over
+                        if (obj.get("code") if isinstance(obj, dict) else getattr(obj, "code", None)) == 410:
+                            self.resource_version = None
+                            break
+                        continue
+                    self.resource_version = meta(obj, "resource_version") or self.resource_version
+                    if event_type != "BOOKMARK": self._apply(event_type, obj)
+                backoff = 1
+            except ApiException as e:
+                if e.status == 410: self.resource_version = None
+                else:
+                    print(f"Informer watch error: {e.status} {e.reason}", flush=True)
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 30)
+            except Exception as e:
+                print(f"Informer error: {e}", flush=True)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
@@ -0,0 +1,84 @@
+import math
+
+# Log-linear latency histogram shared by the agent, aggregator and controller.
+# Values are microseconds. Every power of two is split into 4 linear
+# sub-buckets, so a bucket is at most 25% wide and a percentile read from its
+# midpoint is within ~12.5% of the true value. The same index is computed in
+# the kernel by the agent's BPF program, so kernel maps drain straight into it.
+
+SUB_BUCKETS = 4
+PERCENTILES = {"p50": 0.50, "p90": 0.90, "p99": 0.99, "p999": 0.999}
+
+def bucket_index(value_us):
+    value_us = int(value_us)
+    if value_us < SUB_BUCKETS: return max(value_us, 0)
+    b = value_us.bit_length() - 1
+    return SUB_BUCKETS * b - 8 + (value_us >> (b - 2))
+
+def bucket_bounds(idx):
+    if idx < SUB_BUCKETS: return idx, idx + 1
+    b = idx // SUB_BUCKETS + 1
+    width = 1 << (b - 2)
+    lower = (SUB_BUCKETS + idx % SUB_BUCKETS) * width
+    return lower, lower + width
+
+class LatencySketch:
+    """Mergeable bucket -> count histogram with percentile estimation."""
+
+    __slots__ = ("buckets",)
+
+    def __init__(self, buckets=None):
+        self.buckets = dict(buckets) if buckets else {}
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    def add(self, value_us, n=1):
+        idx = bucket_index(value_us)
+        self.buckets[idx] = self.buckets.get(idx, 0) + n
+
+    def add_buckets(self, buckets):
+        for idx, n in buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+
+    def merge(self, other):
+        self.add_buckets(other.buckets)
+        return self
+
+    def quantile(self, q):
+        total = self.count
+        if total == 0: return 0.0
+        rank = max(1, math.ceil(q * total))
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                lower, upper = bucket_bounds(idx)
+                return (lower + upper) / 2.0
+        return float(bucket_bounds(max(self.buckets))[1])
+
+    def percentiles_ms(self):
+        return {name: round(self.quantile(q) / 1000.0, 3) for name, q in PERCENTILES.items()}
+
+    # Wire format: flat [idx, count, idx, count, ...] with delta-encoded indices.
+    # Sparse and small enough to ride inside the existing JSON payloads.
+    def to_wire(self):
+        out = []
+        prev = 0
+        for idx in sorted(self.buckets):
+            n = self.buckets[idx]
+            if n <= 0: continue
+            out.append(idx - prev)
+            out.append(n)
+            prev = idx
+        return out
+
+    @classmethod
+    def from_wire(cls, data):
+        sketch = cls()
+        idx = 0
+        for i in range(0, len(data) - 1, 2):
+            idx += int(data[i])
+            sketch.buckets[idx] = sketch.buckets.get(idx, 0) + int(data[i + 1])
+        return sketch
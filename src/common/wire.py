@@ -0,0 +1,171 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+try: import msgpack
+except ImportError: msgpack = None
+try: import zstandard
+except ImportError: zstandard = None
+
+# Agent -> aggregator wire format, negotiated per scrape. Plain JSON (the agent's
+# collect() payload as is) stays the default for anyone who doesn't ask.
+#
+#   Accept: application/x-msgpack     compact payload as msgpack (msgpack on both sides)
+#           application/x-wire+json   compact payload as JSON
+#   Accept-Encoding: zstd / gzip      compressed when the body is over COMPRESS_MIN bytes
+#   X-Wire-Ack: <epoch>:<version>     last compact payload this scraper decoded; the reply
+#                                     only carries what changed since (full if unknown)
+#
+# Compact payload: service names are interned (ids stable for the agent's lifetime, only
+# new names are sent) and rows are positional:
+#   {"epoch", "version", "base" (0 = full), "agent_start", "timestamp", "sensor",
+#    "names_from", "names": [name of id names_from, ...],
+#    "metrics": [[id, count, sum_us, errors, responses, sketch], ...]          changed only
+#    "metrics_removed": [id, ...],
+#    "edges": [[src, dst, count, sum_us, errors, bytes, last_seen], ...]      changed only
+#    "edges_removed": [[src, dst], ...]}
+# Topology isn't sent: the agent records every link in both, so it is the set of edges.
+# WireDecoder rebuilds exactly the JSON payload, the rollups never see the difference.
+
+JSON = "application/json"
+COMPACT_JSON = "application/x-wire+json"
+MSGPACK = "application/x-msgpack"
+COMPRESS_MIN = 1024
+# Versions the agent can still diff against (one per changed scrape)
+HISTORY = 8
+
+def serialize(obj, content_type):
+    if content_type == MSGPACK: return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def deserialize(body, content_type):
+    if content_type == MSGPACK: return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+def compress(body, accept_encoding):
+    """(body, Content-Encoding or None): zstd if both sides have it, else gzip."""
+    if len(body) < COMPRESS_MIN: return body, None
+    if "zstd" in accept_encoding and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    if "gzip" in accept_encoding: return gzip.compress(body, compresslevel=1), "gzip"
+    return body, None
+
+def decompress(body, encoding):
+    if encoding == "zstd": return zstandard.ZstdDecompressor().decompress(body)
+    if encoding == "gzip": return gzip.decompress(body)
+    return body
+
+def negotiate(accept):
+    if MSGPACK in accept and msgpack is not None: return MSGPACK
+    if COMPACT_JSON in accept: return COMPACT_JSON
+    return JSON
+
+def accept_header():
+    """What a scraper asks for: the most compact format it can decode, JSON as the fallback."""
+    return f"{MSGPACK if msgpack is not None else COMPACT_JSON}, {JSON};q=0.5"
+
+class WireEncoder:
+    """
+    Agent side, shared by every scraper. Keeps the last HISTORY states it sent,
+    so each scraper (sharded aggregators, a replica taking over) gets a delta
+    against whatever it acknowledged last.
+    """
+
+    def __init__(self, epoch, history=HISTORY):
+        self.epoch = str(epoch)
+        self.history = history
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.names = []
+        self.states = OrderedDict()  # version -> (metrics {id: row}, edges {(src, dst): row}, names known)
+        self.version = 0
+
+    def intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def acked(self, ack):
+        epoch, _, version = (ack or "").partition(":")
+        if epoch != self.epoch or not version.isdigit(): return None
+        return self.states.get(int(version)) and int(version)
+
+    def compact(self, payload, ack=None):
+        """Compact form of a collect() payload, as a delta against `ack` when we still have it."""
+        with self.lock:
+            metrics = {self.intern(svc): [m["count"], m["sum_us"], m["errors"], m["responses"], m["sketch"]]
+                       for svc, m in payload["metrics"].items()}
+            edges = {(self.intern(e["src"]), self.intern(e["dst"])): [e["count"], e["sum_us"], e["errors"], e["bytes"], e["last_seen"]]
+                     for e in payload["edges"]}
+            latest = self.states.get(self.version)
+            if latest is None or latest[0] != metrics or latest[1] != edges:
+                self.version += 1
+                self.states[self.version] = (metrics, edges, len(self.names))
+                while len(self.states) > self.history: self.states.popitem(last=False)
+            base = self.acked(ack)
+            old_metrics, old_edges, names_from = self.states[base] if base else ({}, {}, 0)
+            return {
+                "epoch": self.epoch, "version": self.version, "base": base or 0,
+                "agent_start": payload["agent_start"], "timestamp": payload["timestamp"], "sensor": payload["sensor"],
+                "names_from": names_from, "names": self.names[names_from:],
+                "metrics": [[i, *row] for i, row in metrics.items() if old_metrics.get(i) != row],
+                "metrics_removed": [i for i in old_metrics if i not in metrics],
+                "edges": [[*key, *row] for key, row in edges.items() if old_edges.get(key) != row],
+                "edges_removed": [list(key) for key in old_edges if key not in edges]
+            }
+
+    def encode(self, payload, accept="", accept_encoding="", ack=None):
+        """(body, Content-Type, Content-Encoding or None) for one scrape."""
+        content_type = negotiate(accept)
+        obj = payload if content_type == JSON else self.compact(payload, ack)
+        body, encoding = compress(serialize(obj, content_type), accept_encoding)
+        return body, content_type, encoding
+
+class WireDecoder:
+    """Aggregator side, one per agent: applies each compact payload to the last full state."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.epoch, self.version = None, 0
+        self.names, self.metrics, self.edges = [], {}, {}
+
+    @property
+    def ack(self):
+        return f"{self.epoch}:{self.version}" if self.epoch is not None else None
+
+    def decode(self, body, content_type):
+        """The agent's JSON payload, whatever format it was sent in (body already decompressed)."""
+        content_type = content_type.split(";")[0].strip()
+        if content_type not in (COMPACT_JSON, MSGPACK): return json.loads(body)
+        x = deserialize(body, content_type)
+        with self.lock:
+            if x["base"] and (x["epoch"] != self.epoch or x["base"] != self.version):
+                # Delta against a state we don't have (straggler, restart): ask for a full one
+                self.reset()
+                raise ValueError(f"wire delta from v{x['base']}, have {self.ack}")
+            if not x["base"]: self.reset()
+            del self.names[x["names_from"]:]
+            self.names.extend(x["names"])
+            for row in x["metrics"]: self.metrics[row[0]] = row[1:]
+            for i in x["metrics_removed"]: self.metrics.pop(i, None)
+            for row in x["edges"]: self.edges[(row[0], row[1])] = row[2:]
+            for src, dst in x["edges_removed"]: self.edges.pop((src, dst), None)
+            self.epoch, self.version = x["epoch"], x["version"]
+
+            names, topology = self.names, {}
+            for src, dst in self.edges: topology.setdefault(names[src], []).append(names[dst])
+            return {
+                "agent_start": x["agent_start"], "timestamp": x["timestamp"],
+                "metrics": {names[i]: {"count": c, "sum_us": s, "errors": e, "responses": r, "sketch": k}
+                            for i, (c, s, e, r, k) in self.metrics.items()},
+                "topology": topology,
+                "edges": [{"src": names[src], "dst": names[dst], "count": c, "sum_us": s, "errors": e, "bytes": b, "last_seen": t}
+                          for (src, dst), (c, s, e, b, t) in self.edges.items()],
+                "sensor": x["sensor"]
+            }
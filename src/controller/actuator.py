@@ -0,0 +1,194 @@
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger("Brain")
+
+# Work queue between scaling decisions and the apiserver, in the spirit of client-go's:
+#
+#   actuator = Actuator(patch, workers=4, qps=10, burst=20).start()
+#   actuator.submit("svc-cpu", current=2, desired=4, reason="...")   # returns at once
+#   actuator.intent("svc-cpu")   # 4 until the deployment cache shows it
+#
+# - one entry per deployment: a newer decision replaces a queued one, and a deployment
+#   is never patched by two workers at once
+# - all workers share one token bucket (qps/burst) so a burst of decisions can't flood
+#   the apiserver
+# - failed patches are retried with per-deployment exponential backoff
+# - every decision is timed to the patch being accepted and to the watch cache
+#   reflecting it
+
+class TokenBucket:
+    def __init__(self, qps, burst):
+        self.qps, self.burst = qps, burst
+        self.tokens, self.stamp = float(burst), time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.qps)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.qps
+            time.sleep(wait)
+
+class ActuationStats:
+    __slots__ = ("applied", "failures", "patch_ms", "observe_ms", "max_patch_ms", "last_patch_ms", "last_observe_ms")
+
+    def __init__(self):
+        self.applied = self.failures = 0
+        self.patch_ms = self.observe_ms = self.max_patch_ms = 0.0
+        self.last_patch_ms = self.last_observe_ms = None
+
+class Actuator:
+    def __init__(self, patch_func, workers=4, qps=10.0, burst=20, base_delay=0.5, max_delay=60.0,
+                 max_retries=8, intent_ttl=30.0):
+        self.patch_func = patch_func     # patch_func(name, replicas), raises on failure
+        self.workers = workers
+        self.bucket = TokenBucket(qps, burst)
+        self.base_delay, self.max_delay, self.max_retries = base_delay, max_delay, max_retries
+        self.intent_ttl = intent_ttl
+
+        self.cond = threading.Condition()
+        self.ready = []          # FIFO of names due now
+        self.delayed = []        # heap of (due, name) waiting out a backoff
+        self.queued = set()      # in ready or delayed
+        self.processing = set()
+        self.latest = {}         # name -> (current, desired, reason, decided_at) not applied yet
+        self.retries = {}        # name -> consecutive failures
+        self.intents = {}        # name -> (replicas, decided_at, applied_at, seen_at) until the cache shows it
+        self.stats = {}          # name -> ActuationStats
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self.run, name=f"actuator-{i}", daemon=True).start()
+        return self
+
+    # --- DECISION SIDE ---
+    def submit(self, name, current, desired, reason=""):
+        with self.cond:
+            prev = self.latest.get(name)
+            # A decision superseding an unapplied one is as old as the first of them
+            decided_at = prev[3] if prev else time.monotonic()
+            self.latest[name] = (current, desired, reason, decided_at)
+            self.intents[name] = (desired, decided_at, None, None)
+            if name not in self.queued and name not in self.processing:
+                self.queued.add(name)
+                self.ready.append(name)
+                self.cond.notify()
+
+    def intent(self, name):
+        """Replica count last asked for, while the deployment cache may still be behind."""
+        with self.cond:
+            entry = self.intents.get(name)
+            if entry is None: return None
+            replicas, decided_at, applied_at, seen_at = entry
+            if applied_at is not None and time.monotonic() - applied_at > self.intent_ttl:
+                del self.intents[name]  # never observed (changed again by someone else)
+                return None
+            return replicas
+
+    def observed(self, name, replicas):
+        """Deployment cache handler: the watch now shows `replicas` for `name`."""
+        with self.cond:
+            entry = self.intents.get(name)
+            if entry is None: return
+            replicas_wanted, decided_at, applied_at, seen_at = entry
+            if applied_at is None:
+                # The watch can beat the patch response: remember it, _done resolves it
+                self.intents[name] = (replicas_wanted, decided_at, None,
+                                      (seen_at or time.monotonic()) if replicas == replicas_wanted else None)
+                return
+            if replicas == replicas_wanted: self._resolve(name, decided_at, time.monotonic())
+
+    def _resolve(self, name, decided_at, seen_at):
+        del self.intents[name]
+        stats = self.stats.setdefault(name, ActuationStats())
+        stats.last_observe_ms = (seen_at - decided_at) * 1000
+        stats.observe_ms += stats.last_observe_ms
+
+    def backlog(self):
+        with self.cond: return len(self.queued) + len(self.processing)
+
+    def report(self):
+        """{name: {...}} decision -> patch accepted / -> visible in the cache, in ms."""
+        with self.cond:
+            return {name: {"applied": s.applied, "failures": s.failures,
+                           "patch_ms": round(s.patch_ms / s.applied, 1) if s.applied else None,
+                           "max_patch_ms": round(s.max_patch_ms, 1),
+                           "last_patch_ms": s.last_patch_ms and round(s.last_patch_ms, 1),
+                           "last_observe_ms": s.last_observe_ms and round(s.last_observe_ms, 1),
+                           "pending": name in self.latest}
+                    for name, s in self.stats.items()}
+
+    # --- WORKER SIDE ---
+    def _next(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                while self.delayed and self.delayed[0][0] <= now:
+                    self.ready.append(heapq.heappop(self.delayed)[1])
+                if self.ready:
+                    name = self.ready.pop(0)
+                    self.queued.discard(name)
+                    self.processing.add(name)
+                    return name, self.latest.pop(name, None)
+                self.cond.wait(self.delayed[0][0] - now if self.delayed else None)
+
+    def _done(self, name, work, error):
+        with self.cond:
+            self.processing.discard(name)
+            stats = self.stats.setdefault(name, ActuationStats())
+            if work is None: delay = 0
+            elif error is None:
+                self.retries.pop(name, None)
+                now = time.monotonic()
+                stats.applied += 1
+                stats.last_patch_ms = (now - work[3]) * 1000
+                stats.patch_ms += stats.last_patch_ms
+                stats.max_patch_ms = max(stats.max_patch_ms, stats.last_patch_ms)
+                intent = self.intents.get(name)
+                if intent is not None and intent[0] == work[1]:
+                    if intent[3] is not None: self._resolve(name, work[3], intent[3])
+                    else: self.intents[name] = (work[1], work[3], now, None)
+                delay = 0
+            else:
+                stats.failures += 1
+                attempt = self.retries[name] = self.retries.get(name, 0) + 1
+                if attempt > self.max_retries:
+                    logger.warning(f"Giving up on scaling {name} after {attempt} attempts: {error}")
+                    self.retries.pop(name, None)
+                    if self.intents.get(name, (None,))[0] == work[1]: del self.intents[name]
+                    # A newer decision waiting behind this one goes out now, not after the backoff
+                    delay = 0
+                else:
+                    # Retry this decision unless a newer one came in meanwhile
+                    self.latest.setdefault(name, work)
+                    delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+                    logger.warning(f"Failed to scale {name} (attempt {attempt}, retry in {delay:.1f}s): {error}")
+            if name in self.latest and name not in self.queued:
+                self.queued.add(name)
+                if delay: heapq.heappush(self.delayed, (time.monotonic() + delay, name))
+                else: self.ready.append(name)
+                self.cond.notify()
+
+    def run(self):
+        while True:
+            name, work = self._next()
+            if work is None:
+                self._done(name, None, None)  # nothing left to apply
+                continue
+            current, desired, reason, decided_at = work
+            self.bucket.acquire()
+            try:
+                self.patch_func(name, desired)
+                logger.info(f"⚡ SCALING {name}: {current} -> {desired} "
+                            f"({(time.monotonic() - decided_at) * 1000:.0f}ms after decision){' | ' + reason if reason else ''}")
+                self._done(name, work, None)
+            except Exception as e:
+                self._done(name, work, e)
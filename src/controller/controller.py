@@ -3,11 +3,35 @@ import requests
 import logging
 import os
 import math
+import numpy as np
 from kubernetes import client, config
+from common.kube_cache import Informer, meta
+from actuator import Actuator
+from graph_stream import GraphStream
+from rca import CriticalPath
+from planner import CapacityPlanner
+from forecast import HoltForecaster
 
 # CONFIGURATION
 AGGREGATOR_URL = os.getenv("AGGREGATOR_URL", "http://aggregator:8000")
 COOLDOWN = 15  # Seconds between checks
+# Scale down only to the highest replica count needed during this window...
+SCALE_DOWN_WINDOW = int(os.getenv("SCALE_DOWN_WINDOW", "300"))
+# ...and only if the smaller count fits the SLO with this much margin
+SCALE_TOLERANCE = float(os.getenv("SCALE_TOLERANCE", "0.2"))
+LATENCY_FIELDS = {"mean": "latency", "p50": "p50", "p90": "p90", "p99": "p99", "p999": "p999"}
+# Mostly 5xx = the service is broken, not saturated: more replicas won't help
+ERROR_HOLD_RATIO = float(os.getenv("ERROR_HOLD_RATIO", "0.5"))
+# Timed-out/reset requests never report a latency: above this share, treat as an SLO breach
+TIMEOUT_SCALE_RATIO = float(os.getenv("TIMEOUT_SCALE_RATIO", "0.05"))
+# Scale patches go through a work queue: concurrent workers sharing one apiserver rate limit
+ACTUATOR_WORKERS = int(os.getenv("ACTUATOR_WORKERS", "4"))
+ACTUATOR_QPS = float(os.getenv("ACTUATOR_QPS", "10"))
+ACTUATOR_BURST = int(os.getenv("ACTUATOR_BURST", "20"))
+REPORT_INTERVAL = 60  # Seconds between decision -> actuation latency reports
+# Pre-scale for the load forecast this far ahead (about a pod's time to ready); 0 disables
+FORECAST_HORIZON = int(os.getenv("FORECAST_HORIZON", "30"))
+FORECAST_POINTS = 150  # History the forecast is fitted on (aggregator slots)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger("Brain")
@@ -21,25 +45,31 @@ except:
 app_api = client.AppsV1Api()
 custom_api = client.CustomObjectsApi()
 
+# Watched caches: SLOs and deployment replica counts are read from memory every round
+SLOS = Informer(custom_api.list_namespaced_custom_object, "autoscaling.fyp.io", "v1alpha1", "default", "serviceslos").start()
+DEPLOYMENTS = Informer(app_api.list_namespaced_deployment, "default").start()
+
+def patch_scale(deploy_name, replicas):
+    app_api.patch_namespaced_deployment_scale(deploy_name, "default", {"spec": {"replicas": replicas}})
+
+ACTUATOR = Actuator(patch_scale, workers=ACTUATOR_WORKERS, qps=ACTUATOR_QPS, burst=ACTUATOR_BURST).start()
+# The watch confirms when a patch has landed (and ends the actuator's override)
+DEPLOYMENTS.add_handler(lambda kind, obj, old: kind != "DELETED" and ACTUATOR.observed(meta(obj, "name"), obj.spec.replicas))
+
 def get_slo_configs():
     """
-    Reads all ServiceSLO resources from Kubernetes.
-    Safe against CRD missing errors.
+    Reads all ServiceSLO resources from the watch cache.
+    Safe against CRD missing errors (the informer keeps retrying).
     """
     configs = {}
     try:
-        raw = custom_api.list_namespaced_custom_object(
-            group="autoscaling.fyp.io",
-            version="v1alpha1",
-            namespace="default",
-            plural="serviceslos"
-        )
-        for item in raw.get('items', []):
+        for item in SLOS.list():
             spec = item.get('spec', {})
             deploy = spec.get('targetDeployment')
             if deploy:
                 configs[deploy] = {
                     "slo": spec.get('sloLatency', 30),
+                    "percentile": spec.get('sloPercentile', 'mean'),
                     "min": spec.get('minReplicas', 1),
                     "max": spec.get('maxReplicas', 10)
                 }
@@ -48,60 +78,145 @@ def get_slo_configs():
         logger.warning(f"Waiting for ServiceSLO CRDs... ({e})")
     return configs
 
-def scale_deployment(deploy_name, current_replicas, desired_replicas):
+def get_replicas(deploy_name):
+    """Replica count from the watch cache; a patch still in flight wins. None if unknown yet."""
+    pending = ACTUATOR.intent(deploy_name)
+    if pending is not None: return pending
+    deploy = DEPLOYMENTS.get(f"default/{deploy_name}")
+    return deploy.spec.replicas if deploy is not None else None
+
+def scale_deployment(deploy_name, current_replicas, desired_replicas, reason=""):
+    """Queue the patch (applied asynchronously by the actuator workers)."""
     if desired_replicas == current_replicas: return False
-    
+    ACTUATOR.submit(deploy_name, current_replicas, desired_replicas, reason)
+    return True
+
+def report_actuation():
+    for svc, r in sorted(ACTUATOR.report().items()):
+        logger.info(f"⏱️  Actuation {svc}: {r['applied']} applied, {r['failures']} failed | decision -> patch "
+                    f"avg {r['patch_ms']}ms, max {r['max_patch_ms']}ms | last visible after {r['last_observe_ms']}ms"
+                    f"{' | pending' if r['pending'] else ''}")
+
+def forecast_rps(forecaster, services):
+    """{svc: upper-band peak RPS expected within FORECAST_HORIZON} from the aggregator's series."""
+    if FORECAST_HORIZON <= 0 or not services: return {}
     try:
-        app_api.patch_namespaced_deployment_scale(
-            deploy_name, "default", {"spec": {"replicas": desired_replicas}}
-        )
-        logger.info(f"⚡ SCALING {deploy_name}: {current_replicas} -> {desired_replicas}")
-        return True
+        data = requests.get(f"{AGGREGATOR_URL}/api/series",
+                            params={"svc": ",".join(services), "points": FORECAST_POINTS}, timeout=2).json()
     except Exception as e:
-        logger.warning(f"Failed to scale {deploy_name}: {e}")
-        return False
+        logger.warning(f"No RPS history for forecasting ({e})")
+        return {}
+    series = data.get("series", {})
+    # Slots the aggregator didn't record come back as null: NaN, skipped by the fit
+    names = [svc for svc in services if sum(x is not None for x in series.get(svc, {}).get("rps", [])) >= 2]
+    if not names: return {}
+    # One row per service, all fitted together
+    _, upper = forecaster.forecast(np.array([series[svc]["rps"] for svc in names], dtype=np.float64),
+                                   max(1, round(FORECAST_HORIZON / data.get("step", 2))))
+    return dict(zip(names, upper.tolist()))
+
+def slo_latency(metric_data, cfg):
+    """Latency the SLO is written against: the mean or one of the exported percentiles."""
+    if not isinstance(metric_data, dict): return metric_data
+    field = LATENCY_FIELDS.get(cfg.get('percentile'), "latency")
+    return metric_data.get(field, metric_data.get("latency", 0))
+
+def error_signals(metric_data):
+    """(5xx share, timeout+reset share) of the requests in the default window."""
+    if not isinstance(metric_data, dict): return 0, 0
+    responses = metric_data.get("responses", {})
+    total = sum(responses.values())
+    if not total: return 0, 0
+    return responses.get("5xx", 0) / total, (responses.get("timeout", 0) + responses.get("reset", 0)) / total
 
-def calculate_replicas(current_replicas, current_latency, target_slo, rps):
+def breaching(metric_data, cfg):
+    """Over the SLO, or too many requests timing out to trust the latency of the rest."""
+    return slo_latency(metric_data, cfg) > cfg['slo'] or error_signals(metric_data)[1] > TIMEOUT_SCALE_RATIO
+
+def planned_replicas(planner, svc, cfg, metric_data, node, needed_ms=0.0):
+    """
+    Replica count from the queueing model: the service's own (exclusive) latency must
+    drop by needed_ms, and its own SLO must hold once downstream time is added back.
+    None while the model has no estimate for the service.
+    """
+    rps = metric_data.get("rps", 0) if isinstance(metric_data, dict) else 0
+    budgets = [(cfg['slo'] - node.downstream, cfg['percentile'])]
+    if needed_ms > 0: budgets.append((node.exclusive - needed_ms, "mean"))
+    counts = []
+    for budget, percentile in budgets:
+        # Not reachable by scaling this service alone: ask for as much as allowed
+        if budget <= 0: counts.append(cfg['max']); continue
+        count = planner.required(svc, rps, budget, percentile, cfg['min'], cfg['max'])
+        if count is None: return None
+        counts.append(count)
+    return max(counts)
+
+def calculate_replicas(current_replicas, plan):
     """
     RESEARCH GAP 3 SOLUTION: Deterministic Calculation
-    Formula: New = Current * (Current_Latency / Target_SLO)
+    Formula: New = Current * (Exclusive / (Exclusive - Needed)), on the critical-path
+    target, where Needed is the reduction of its own latency the breaching service requires
     """
-    if current_latency <= target_slo:
-        return current_replicas
-    
-    # Calculate scale factor
-    ratio = current_latency / target_slo
-    new_count = math.ceil(current_replicas * ratio)
-    
-    return new_count
+    return max(current_replicas, math.ceil(current_replicas * plan["factor"] - 1e-9))
 
 def main():
     logger.info(f"🤖 Controller V2.1 (Resilient Logic) Started - Connecting to {AGGREGATOR_URL}")
     last_scale = {}
+    graph_etag = None
+    engine = CriticalPath()
+    planner = CapacityPlanner(scale_down_window=SCALE_DOWN_WINDOW, tolerance=SCALE_TOLERANCE)
+    forecaster = HoltForecaster()
+    last_report = time.time()
+
+    stream = GraphStream(AGGREGATOR_URL).start()
 
     while True:
         try:
-            # 1. Fetch Live Configs
+            # 1. Fetch Live Metrics (FROM AGGREGATOR)
+            # Pushed by the aggregator as soon as a sync round finishes; polling while the stream is down.
+            if stream.connected:
+                graph = stream.next_graph(timeout=10)
+                if graph is None: continue  # No new sync round yet
+                metrics, topology, edges = graph
+            else:
+                # This is where the crash happened. We catch it specifically.
+                try:
+                    headers = {"If-None-Match": graph_etag} if graph_etag else {}
+                    response = requests.get(f"{AGGREGATOR_URL}/api/graph", headers=headers, timeout=2)
+                    if response.status_code == 304:
+                        # Same snapshot as last round, nothing new to decide on
+                        time.sleep(2)
+                        continue
+                    if response.status_code != 200:
+                        raise Exception(f"Status {response.status_code}")
+                    graph_etag = response.headers.get("ETag")
+                    
+                    data = response.json()
+                    metrics = data.get("metrics", {})
+                    topology = data.get("topology", {})
+                    edges = data.get("edges", {})
+                    
+                except Exception as e:
+                    # Catch connection errors here so the loop doesn't break
+                    logger.warning(f"⏳ Waiting for Aggregator... ({e})")
+                    time.sleep(5)
+                    continue
+
+            # 2. Fetch Live Configs
             slo_configs = get_slo_configs()
-            
-            # 2. Fetch Live Metrics (FROM AGGREGATOR)
-            # This is where the crash happened. We catch it specifically.
-            try:
-                response = requests.get(f"{AGGREGATOR_URL}/api/graph", timeout=2)
-                if response.status_code != 200:
-                    raise Exception(f"Status {response.status_code}")
-                
-                data = response.json()
-                metrics = data.get("metrics", {})
-                topology = data.get("topology", {})
-                
-            except Exception as e:
-                # Catch connection errors here so the loop doesn't break
-                logger.warning(f"⏳ Waiting for Aggregator... ({e})")
-                time.sleep(5)
-                continue
 
-            # 3. Analyze (YOUR ORIGINAL LOGIC)
+            # 3. Analyze: exclusive vs downstream latency of every service (incremental),
+            #    and the per-replica service rate each one is showing
+            engine.update(metrics, topology, edges)
+            replicas = {}
+            for svc_name in slo_configs:
+                metric_data, node = metrics.get(svc_name), engine.nodes.get(svc_name)
+                if not isinstance(metric_data, dict) or node is None: continue
+                replicas[svc_name] = get_replicas(svc_name)
+                if replicas[svc_name] is None: del replicas[svc_name]; continue
+                planner.observe(svc_name, metric_data.get("rps", 0), node.exclusive, replicas[svc_name])
+
+            breached = set()
             for svc_name, metric_data in metrics.items():
                 
                 config = slo_configs.get(svc_name)
@@ -114,69 +229,118 @@ def main():
                     latency = metric_data
                     rps = 0
                 else:
-                    latency = metric_data.get("latency", 0)
+                    latency = slo_latency(metric_data, config)
                     rps = metric_data.get("rps", 0)
+                server_err, timeout_err = error_signals(metric_data)
                 
-                logger.info(f"🔍 Seeing {svc_name} | Latency: {latency}ms | RPS: {rps}")        
+                logger.info(f"🔍 Seeing {svc_name} | Latency ({config['percentile']}): {latency}ms | RPS: {rps} "
+                            f"| 5xx: {server_err:.0%} | Timeouts: {timeout_err:.0%}")
 
                 # RPS Filter (Your logic)
                 if rps < 1.0:
                     continue
 
-                if latency <= target_slo: continue
+                if not breaching(metric_data, config): continue
+                if latency <= target_slo:
+                    # Requests are timing out: the latency we see only covers the ones that made it
+                    latency = round(target_slo * (1 + timeout_err), 3)
+                breached.add(svc_name)
 
-                # ROOT CAUSE ANALYSIS (Downstream Check - Your logic)
-                dependencies = topology.get(svc_name, [])
-                blame_downstream = None
+                # ROOT CAUSE ANALYSIS (critical path over the whole dependency graph)
+                # The SLO may be on a percentile; the decomposition works on means, so ask
+                # for the same relative reduction of the mean.
+                mean_latency = metric_data.get("latency", latency) if isinstance(metric_data, dict) else latency
+                reduction = (1 - target_slo / latency) * mean_latency
+                plan = engine.scale_target(svc_name, reduction, scalable=slo_configs)
 
-                for child_svc in dependencies:
-                    child_data = metrics.get(child_svc, {})
-                    child_lat = child_data.get("latency", 0) if isinstance(child_data, dict) else child_data
-                    
-                    child_cfg = slo_configs.get(child_svc)
-                    
-                    if child_cfg and child_lat > child_cfg['slo']:
-                        blame_downstream = child_svc
-                        break 
-                
                 # DECISION
-                target_svc = blame_downstream if blame_downstream else svc_name
+                target_svc = plan["target"]
+                blame_downstream = target_svc if target_svc != svc_name else None
                 target_cfg = slo_configs.get(target_svc)
                 
                 if not target_cfg: continue
 
+                target_err, _ = error_signals(metrics.get(target_svc, {}))
+                if target_err > ERROR_HOLD_RATIO:
+                    logger.info(f"🛑 Holding {target_svc}: {target_err:.0%} of requests fail with 5xx, not a capacity problem")
+                    continue
+
                 # Check Cooldown
                 if time.time() - last_scale.get(target_svc, 0) < COOLDOWN:
                     continue
 
                 # Calculate Scale Up
                 try:
-                    scale_obj = app_api.read_namespaced_deployment_scale(target_svc, "default")
-                    curr_replicas = scale_obj.spec.replicas
+                    curr_replicas = get_replicas(target_svc)
+                    if curr_replicas is None: continue  # Deployment not in the cache (yet)
                     
-                    # USE DETERMINISTIC LOGIC
-                    ideal_replicas = calculate_replicas(curr_replicas, latency, target_slo, rps)
+                    # QUEUEING MODEL, sized from the target's own latency (linear rule until it has data)
+                    ideal_replicas = planned_replicas(planner, target_svc, target_cfg, metrics.get(target_svc, {}),
+                                                      engine.nodes[target_svc], plan["needed_ms"] if blame_downstream else 0)
+                    if ideal_replicas is None: ideal_replicas = calculate_replicas(curr_replicas, plan)
                     
                     # Apply Limits (Min/Max)
                     new_replicas = min(target_cfg['max'], max(target_cfg['min'], ideal_replicas))
                     
                     if new_replicas > curr_replicas:
-                        reason = f"Bottleneck in {target_svc}" if blame_downstream else f"{target_svc} Latency {latency}ms > {target_slo}ms"
+                        reason = (f"Bottleneck in {target_svc} via {' -> '.join(plan['path'])}" if blame_downstream
+                                  else f"{target_svc} Latency {latency}ms > {target_slo}ms")
+                        reason += f" | exclusive {plan['exclusive_ms']}ms, needs -{plan['needed_ms']}ms"
                         logger.info(f"⚠️  Logic: {reason} | RPS: {rps} | Calculating: {curr_replicas} -> {new_replicas}")
                         
-                        if scale_deployment(target_svc, curr_replicas, new_replicas):
+                        if scale_deployment(target_svc, curr_replicas, new_replicas, reason):
                             last_scale[target_svc] = time.time()
                             
                 except Exception as e:
                     logger.error(f"Error processing {target_svc}: {e}")
 
+            # 4. Pre-scale for the load forecast, before it turns into an SLO breach
+            now = time.time()
+            forecasts = forecast_rps(forecaster, list(replicas))
+            for svc_name, predicted in forecasts.items():
+                cfg, node = slo_configs[svc_name], engine.nodes[svc_name]
+                rps = metrics[svc_name].get("rps", 0)
+                if svc_name in breached or predicted <= max(rps, 1.0) * (1 + SCALE_TOLERANCE): continue
+                if now - last_scale.get(svc_name, 0) < COOLDOWN: continue
+                curr_replicas = get_replicas(svc_name)
+                if curr_replicas is None: continue
+                needed = planner.required(svc_name, predicted, cfg['slo'] - node.downstream,
+                                          cfg['percentile'], cfg['min'], cfg['max'])
+                # No model yet: replicas in proportion to the load
+                if needed is None: needed = math.ceil(curr_replicas * predicted / max(rps, 1.0))
+                needed = min(cfg['max'], max(cfg['min'], needed))
+                if needed <= curr_replicas: continue
+                reason = f"forecast {predicted:.1f} RPS within {FORECAST_HORIZON}s (now {rps})"
+                logger.info(f"📈 Logic: {svc_name} {reason} | Calculating: {curr_replicas} -> {needed}")
+                if scale_deployment(svc_name, curr_replicas, needed, reason):
+                    last_scale[svc_name] = now
+
+            # 5. Scale down what the model says is over-provisioned, stabilized over SCALE_DOWN_WINDOW,
+            #    never below what the forecast load needs
+            for svc_name, cfg in slo_configs.items():
+                node = engine.nodes.get(svc_name)
+                if svc_name not in replicas or node is None: continue
+                curr_replicas = replicas[svc_name]
+                rps = round(max(metrics[svc_name].get("rps", 0), forecasts.get(svc_name, 0)), 2)
+                desired = planner.decide(svc_name, curr_replicas, rps, cfg['slo'] - node.downstream,
+                                         cfg['percentile'], cfg['min'], cfg['max'], now)
+                if svc_name in breached or desired >= curr_replicas: continue
+                if now - last_scale.get(svc_name, 0) < COOLDOWN: continue
+                logger.info(f"📉 Logic: {svc_name} over-provisioned for {rps} RPS | Calculating: {curr_replicas} -> {desired}")
+                if scale_deployment(svc_name, curr_replicas, desired, "over-provisioned"):
+                    last_scale[svc_name] = now
+
+            if now - last_report >= REPORT_INTERVAL:
+                last_report = now
+                report_actuation()
+
         except KeyboardInterrupt:
             break
         except Exception as e:
             logger.error(f"Critical Loop Error: {e}")
             time.sleep(5)
         
-        time.sleep(2)
+        if not stream.connected: time.sleep(2)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
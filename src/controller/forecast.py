@@ -0,0 +1,45 @@
+import numpy as np
+
+# Damped Holt (level + trend) smoothing run over every service at once: one row per
+# service, the recursion goes over time with whole-column numpy updates.
+#
+#   f = HoltForecaster(alpha=0.5, beta=0.2, phi=0.9)
+#   expected, upper = f.forecast(matrix, horizon=15)   # matrix: services x samples, NaN where missing
+
+class HoltForecaster:
+    def __init__(self, alpha=0.5, beta=0.2, phi=0.9, z=1.0):
+        self.alpha = alpha  # level smoothing
+        self.beta = beta    # trend smoothing
+        self.phi = phi      # trend damping (< 1: growth flattens out instead of running away)
+        self.z = z          # upper band = expected + z * one-step error std
+
+    def fit(self, y):
+        """(level, trend, one-step residual std) per row of y (services x samples, NaN: missing)."""
+        y = np.asarray(y, dtype=np.float64)
+        rows = np.arange(len(y))
+        # Start from each row's first known sample; missing samples neither move the
+        # level nor count as an error, the damped trend just carries on
+        level = np.nan_to_num(y[rows, np.argmax(~np.isnan(y), axis=1)])
+        trend = np.zeros(len(y)) if y.shape[1] < 2 else np.nan_to_num(y[:, 1] - y[:, 0])
+        sq_err, seen = np.zeros(len(y)), np.zeros(len(y))
+        a, b, phi = self.alpha, self.beta, self.phi
+        for t in range(1, y.shape[1]):
+            predicted = level + phi * trend
+            known = ~np.isnan(y[:, t])
+            err = np.where(known, y[:, t] - predicted, 0.0)
+            sq_err += err * err
+            seen += known
+            new_level = predicted + a * err
+            trend = phi * trend + b * (new_level - level - phi * trend)
+            level = new_level
+        return level, trend, np.sqrt(sq_err / np.maximum(seen, 1))
+
+    def forecast(self, y, horizon):
+        """
+        (expected, upper) peak value over the next `horizon` samples per row, never below
+        zero. The damped trend is monotonic, so the peak is at 1 step or at `horizon`.
+        """
+        level, trend, sigma = self.fit(y)
+        damp = self.phi * (1 - self.phi ** horizon) / (1 - self.phi) if self.phi != 1 else horizon
+        expected = np.maximum(level + np.maximum(trend * damp, trend * self.phi), 0)
+        return expected, expected + self.z * sigma
@@ -0,0 +1,81 @@
+import json
+import logging
+import threading
+import time
+import requests
+
+logger = logging.getLogger("Brain")
+
+def apply_delta(state, d):
+    """Apply one /api/graph/delta (or /api/stream event) payload to a {metrics, topology, edges} dict."""
+    if d.get("full"):
+        state["metrics"] = d.get("metrics", {})
+        state["topology"] = d.get("topology", {})
+        state["edges"] = d.get("edges", {})
+        return
+    state["metrics"].update(d.get("metrics", {}))
+    for svc in d.get("removed_nodes", []): state["metrics"].pop(svc, None)
+    for src, dst in d.get("edges_added", []):
+        dests = state["topology"].setdefault(src, [])
+        if dst not in dests: dests.append(dst)
+    for src, dst in d.get("edges_removed", []):
+        if dst in state["topology"].get(src, []): state["topology"][src].remove(dst)
+        state["edges"].get(src, {}).pop(dst, None)
+    for src, dst, e in d.get("edge_metrics", []):
+        state["edges"].setdefault(src, {})[dst] = e
+
+class GraphStream:
+    """
+    Subscribes to the aggregator's /api/stream (Server-Sent Events) and keeps a local
+    copy of the graph. next_graph() returns as soon as a sync round is pushed.
+    """
+
+    def __init__(self, base_url):
+        self.url = f"{base_url}/api/stream"
+        self.state = {"metrics": {}, "topology": {}, "edges": {}}
+        self.version = None
+        self.seen = None
+        self.connected = False
+        self.cond = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def next_graph(self, timeout):
+        """(metrics, topology, edges) copy of a version newer than the last one returned, or None."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.version != self.seen, timeout): return None
+            self.seen = self.version
+            return (dict(self.state["metrics"]),
+                    {src: list(dests) for src, dests in self.state["topology"].items()},
+                    {src: dict(dests) for src, dests in self.state["edges"].items()})
+
+    def _handle(self, event_id, data):
+        d = json.loads(data)
+        with self.cond:
+            apply_delta(self.state, d)
+            self.version = d.get("version", event_id)
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            try:
+                headers = {"Last-Event-ID": str(self.version)} if self.version else {}
+                with requests.get(self.url, headers=headers, stream=True, timeout=(3, 60)) as resp:
+                    resp.raise_for_status()
+                    self.connected = True
+                    logger.info("📡 Subscribed to aggregator stream")
+                    event_id, data = None, []
+                    for line in resp.iter_lines(decode_unicode=True):
+                        if line is None: continue
+                        if line == "":
+                            # Blank line terminates an event
+                            if data: self._handle(event_id, "\n".join(data))
+                            event_id, data = None, []
+                        elif line.startswith("data:"): data.append(line[5:].lstrip())
+                        elif line.startswith("id:"): event_id = line[3:].strip()
+            except Exception as e:
+                logger.warning(f"⏳ Stream unavailable, falling back to polling... ({e})")
+            self.connected = False
+            time.sleep(2)
@@ -0,0 +1,117 @@
+import math
+from collections import deque
+
+# Queueing model of one Deployment: M/M/c, every replica a server with rate mu (req/s).
+# mu is not configured anywhere: it is solved from what we observe (arrival rate,
+# mean time spent in the service, current replica count) and smoothed across rounds.
+
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99, "p999": 0.999}
+
+def erlang_c(c, a):
+    """Probability that an arrival waits (c servers, offered load a = lambda/mu < c)."""
+    term, total = 1.0, 1.0
+    for k in range(1, c):
+        term *= a / k
+        total += term
+    last = term * a / c * c / (c - a)
+    return last / (total + last)
+
+def mmc_mean(lam, mu, c):
+    """Mean sojourn time (s)."""
+    if lam <= 0: return 1.0 / mu
+    if lam >= c * mu: return math.inf
+    return 1.0 / mu + erlang_c(c, lam / mu) / (c * mu - lam)
+
+def mmc_tail(t, lam, mu, c):
+    """P(sojourn time > t): exponential service plus the M/M/c waiting time."""
+    if lam <= 0: return math.exp(-mu * t)
+    pw = erlang_c(c, lam / mu)
+    k = c - 1 - lam / mu
+    if abs(k) < 1e-9: return math.exp(-mu * t) * (1 + pw * mu * t)
+    # Written as two decaying exponentials so large t can't overflow
+    return math.exp(-mu * t) * (1 + pw / k) - pw / k * math.exp(-(c * mu - lam) * t)
+
+def mmc_quantile(p, lam, mu, c):
+    """Sojourn time (s) not exceeded by a fraction p of requests."""
+    if lam >= c * mu: return math.inf
+    lo, hi = 0.0, 1.0 / mu
+    while mmc_tail(hi, lam, mu, c) > 1 - p: hi *= 2
+    for _ in range(50):
+        mid = (lo + hi) / 2
+        if mmc_tail(mid, lam, mu, c) > 1 - p: lo = mid
+        else: hi = mid
+    return hi
+
+def predict_ms(lam, mu, c, percentile="mean"):
+    if percentile in PERCENTILES: return mmc_quantile(PERCENTILES[percentile], lam, mu, c) * 1000
+    return mmc_mean(lam, mu, c) * 1000
+
+def estimate_mu(lam, mean_s, c):
+    """Per-replica service rate that makes the M/M/c mean sojourn time equal mean_s."""
+    # mmc_mean falls monotonically from inf (mu -> lam/c) to 0 (mu -> inf)
+    lo = max(lam / c, 1.0 / mean_s) * (1 + 1e-9)
+    if mmc_mean(lam, lo, c) <= mean_s: return lo
+    hi = lo * 2
+    while mmc_mean(lam, hi, c) > mean_s: hi *= 2
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if mmc_mean(lam, mid, c) > mean_s: lo = mid
+        else: hi = mid
+    return hi
+
+class CapacityPlanner:
+    """
+    Per-service capacity model plus the scaling policy built on it.
+
+    observe()  updates the service-rate estimate (EWMA) from one round of metrics.
+    required() is the smallest replica count whose predicted latency fits a budget.
+    decide()   turns the requirement into a replica count: scale-ups apply at once,
+               scale-downs only to the highest requirement seen during the
+               stabilization window, with a tolerance band in between (hysteresis).
+    """
+
+    def __init__(self, scale_down_window=300, tolerance=0.2, smoothing=0.3, min_rps=1.0):
+        self.scale_down_window = scale_down_window
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.min_rps = min_rps
+        self.mu = {}       # svc -> smoothed per-replica service rate (req/s)
+        self.history = {}  # svc -> deque of (time, required replicas)
+
+    def observe(self, svc, rps, latency_ms, replicas):
+        """Fold one observation in. Ignored when there is too little traffic to learn from."""
+        if rps < self.min_rps or latency_ms <= 0 or replicas < 1: return self.mu.get(svc)
+        mu = estimate_mu(rps, latency_ms / 1000.0, replicas)
+        prev = self.mu.get(svc)
+        self.mu[svc] = mu if prev is None else prev + self.smoothing * (mu - prev)
+        return self.mu[svc]
+
+    def required(self, svc, rps, budget_ms, percentile="mean", lo=1, hi=10):
+        """Smallest replica count in [lo, hi] predicted to keep latency within budget_ms (None: no model)."""
+        mu = self.mu.get(svc)
+        if mu is None: return None
+        if rps <= 0: return lo
+        # No replica count beats the service time itself: aim just above that floor
+        budget_ms = max(budget_ms, predict_ms(0, mu, 1, percentile) * 1.1)
+        c = max(lo, math.floor(rps / mu) + 1)
+        while c < hi and predict_ms(rps, mu, c, percentile) > budget_ms: c += 1
+        return min(c, hi)
+
+    def record(self, svc, replicas, now):
+        hist = self.history.setdefault(svc, deque())
+        hist.append((now, replicas))
+        while hist and now - hist[0][0] > self.scale_down_window: hist.popleft()
+
+    def decide(self, svc, current, rps, budget_ms, percentile="mean", lo=1, hi=10, now=0):
+        """Replica count to run now (== current when nothing should change)."""
+        mu = self.mu.get(svc)
+        if mu is None: return current
+        # Target: the count that fits with `tolerance` to spare. Scale up as soon as the
+        # current count eats into half of that margin, so new pods are ready before the
+        # budget itself is blown; scale down only once the whole window agrees.
+        target = self.required(svc, rps, budget_ms * (1 - self.tolerance), percentile, lo, hi)
+        self.record(svc, target, now)
+        if target > current and predict_ms(rps, mu, current, percentile) > budget_ms * (1 - self.tolerance / 2):
+            return target
+        stable = max(r for _, r in self.history[svc])
+        return max(stable, lo) if stable < current else current
@@ -0,0 +1,203 @@
+# Never ask for more than this factor in one step (the reduction needed may not be
+# reachable by scaling one tier)
+MAX_SCALE_FACTOR = 4.0
+
+class Node:
+    __slots__ = ("latency", "rps", "calls", "exclusive", "downstream", "contrib")
+
+    def __init__(self):
+        self.latency = 0.0     # inclusive mean latency (ms)
+        self.rps = 0.0
+        self.calls = {}        # child -> (calls per request, latency per call ms)
+        self.exclusive = 0.0   # latency spent in the service itself
+        self.downstream = 0.0  # latency spent waiting on children
+        self.contrib = {}      # child -> ms of this service's latency induced by the child
+
+class CriticalPath:
+    """
+    Latency decomposition over the whole dependency graph.
+
+    Mean latencies add up along calls, so for every service
+        downstream(s) = sum over children c of calls_per_request(s, c) * latency(s -> c)
+        exclusive(s)  = latency(s) - downstream(s)
+    using the client-observed edge latency when edge metrics exist. Calls that close
+    a dependency cycle (see back_edges) are not subtracted: that time stays exclusive,
+    so a cycle can't make latency vanish or the critical path loop forever.
+
+    update() is incremental: only services whose own metrics or outgoing edges changed,
+    plus their parents, are recomputed; the cycle analysis reruns only when the edge
+    set changes.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.parents = {}
+        self.edge_set = frozenset()
+        self.cyclic = frozenset()   # edges that close a cycle
+        self.inputs = {}            # svc -> last inputs, to detect changes
+        self.recomputed = 0
+
+    # --- graph maintenance ---
+
+    def update(self, metrics, topology, edges=None):
+        edges = edges or {}
+        edge_set = frozenset((src, dst) for src, dests in topology.items() for dst in dests if src != dst)
+        topology_changed = edge_set != self.edge_set
+        if topology_changed:
+            self.edge_set = edge_set
+            # Busiest first; a caller is never faster than its callee, so on equal traffic
+            # the edge going "down" in latency is the real one
+            latency = lambda svc: metrics.get(svc, {}).get("latency", 0) if isinstance(metrics.get(svc), dict) else 0
+            self.cyclic = back_edges(edge_set, lambda e: ((edges.get(e[0], {}).get(e[1]) or {}).get("rps", 1),
+                                                          latency(e[0]) - latency(e[1])))
+            self.parents = {}
+            for src, dst in edge_set: self.parents.setdefault(dst, set()).add(src)
+
+        services = set(metrics) | {s for e in edge_set for s in e}
+        dirty = set()
+        for svc in services:
+            m = metrics.get(svc)
+            if not isinstance(m, dict): m = {"latency": m or 0}
+            inputs = (m.get("latency", 0), m.get("rps", 0), tuple(sorted(topology.get(svc, []))),
+                      tuple(sorted((dst, e.get("rps", 0), e.get("latency", 0)) for dst, e in edges.get(svc, {}).items())))
+            if self.inputs.get(svc) != inputs:
+                self.inputs[svc] = inputs
+                dirty.add(svc)
+                dirty.update(self.parents.get(svc, ()))
+        for svc in list(self.nodes):
+            if svc not in services:
+                del self.nodes[svc]
+                self.inputs.pop(svc, None)
+                dirty.update(p for p in self.parents.get(svc, ()) if p in services)
+        if topology_changed: dirty = services
+
+        for svc in dirty:
+            m = metrics.get(svc)
+            self._load(svc, m if isinstance(m, dict) else {"latency": m or 0}, topology.get(svc, []), edges.get(svc, {}))
+        for svc in dirty: self._decompose(svc)
+        self.recomputed = len(dirty)
+        return self
+
+    def _load(self, svc, m, children, out_edges):
+        node = self.nodes.get(svc)
+        if node is None: node = self.nodes[svc] = Node()
+        node.latency = float(m.get("latency", 0))
+        node.rps = float(m.get("rps", 0))
+        node.calls = {}
+        for child in children:
+            if child == svc: continue
+            edge = out_edges.get(child)
+            if edge is not None and node.rps > 0:
+                node.calls[child] = (edge.get("rps", 0) / node.rps, edge.get("latency"))
+            elif not out_edges:
+                # No edge metrics at all: assume one sequential call per request
+                node.calls[child] = (1.0, None)
+
+    def _decompose(self, svc):
+        node = self.nodes[svc]
+        node.contrib = {}
+        for child, (per_request, edge_latency) in node.calls.items():
+            if (svc, child) in self.cyclic: continue
+            if edge_latency is None:
+                child_node = self.nodes.get(child)
+                edge_latency = child_node.latency if child_node else 0
+            node.contrib[child] = per_request * edge_latency
+        # Parallel fan-out can make the sum exceed the wall time: never more than all of it
+        node.downstream = min(sum(node.contrib.values()), node.latency)
+        node.exclusive = node.latency - node.downstream
+
+    # --- queries ---
+
+    def critical_path(self, root):
+        """
+        Services from `root` down to the one whose own work dominates, following the
+        child that induces the most latency at each step. Returns (path, weights) where
+        weights[i] is the number of calls to path[i] per request to `root`.
+        """
+        path, weights, seen = [root], [1.0], {root}
+        node = self.nodes.get(root)
+        while node is not None and node.contrib:
+            child, induced = max(node.contrib.items(), key=lambda kv: kv[1])
+            if child in seen or induced <= node.exclusive: break
+            path.append(child)
+            weights.append(weights[-1] * node.calls[child][0])
+            seen.add(child)
+            node = self.nodes.get(child)
+        return path, weights
+
+    def scale_target(self, root, reduction_ms, scalable=None):
+        """
+        Where to add capacity so `root` gets `reduction_ms` faster, and by what factor:
+        the deepest service on the critical path that is in `scalable` (any if None).
+        Scaling it shrinks its exclusive latency roughly in proportion to the replica
+        count; every ms saved there saves `weight` ms at the root.
+        """
+        path, weights = self.critical_path(root)
+        i = len(path) - 1
+        while scalable is not None and i > 0 and path[i] not in scalable: i -= 1
+        target, weight = path[i], weights[i]
+        node = self.nodes.get(target) or Node()
+        needed = reduction_ms / max(weight, 1e-9)
+        if node.exclusive <= 0: factor = 1.0
+        else: factor = node.exclusive / max(node.exclusive - needed, node.exclusive / MAX_SCALE_FACTOR)
+        return {"target": target, "path": path[:i + 1], "weight": round(weight, 3),
+                "exclusive_ms": round(node.exclusive, 3), "downstream_ms": round(node.downstream, 3),
+                "needed_ms": round(needed, 3), "factor": factor}
+
+def components(edge_set):
+    """Strongly connected component id of every service (iterative Tarjan)."""
+    graph = {}
+    for src, dst in sorted(edge_set):
+        graph.setdefault(src, []).append(dst)
+        graph.setdefault(dst, [])
+    index, low, comp = {}, {}, {}
+    stack, on_stack = [], set()
+    for start in graph:
+        if start in index: continue
+        index[start] = low[start] = len(index)
+        stack.append(start); on_stack.add(start)
+        work = [(start, iter(graph[start]))]
+        while work:
+            v, children = work[-1]
+            for w in children:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w); on_stack.add(w)
+                    work.append((w, iter(graph[w])))
+                    break
+                if w in on_stack: low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work: low[work[-1][0]] = min(low[work[-1][0]], low[v])
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        comp[w] = v
+                        if w == v: break
+    return comp
+
+def reaches(graph, src, dst):
+    seen, todo = {src}, [src]
+    while todo:
+        v = todo.pop()
+        if v == dst: return True
+        for w in graph.get(v, ()):
+            if w not in seen:
+                seen.add(w)
+                todo.append(w)
+    return False
+
+def back_edges(edge_set, priority=lambda e: 0):
+    """
+    Edges to leave out so the rest is acyclic. Only edges inside a cycle (same strongly
+    connected component) are candidates; they are kept in descending `priority` and an
+    edge is dropped when it would close a loop, so retries/callbacks go before real traffic.
+    """
+    comp = components(edge_set)
+    kept, back = {}, set()
+    inner = sorted(e for e in edge_set if comp[e[0]] == comp[e[1]])
+    for src, dst in sorted(inner, key=priority, reverse=True):
+        if reaches(kept, dst, src): back.add((src, dst))
+        else: kept.setdefault(src, []).append(dst)
+    return frozenset(back)
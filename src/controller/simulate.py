@@ -0,0 +1,178 @@
+"""
+Offline replay of a metric trace against the scaling policies.
+
+    python3 simulate.py record --url http://localhost:8000 --seconds 600 --out trace.jsonl
+    python3 simulate.py run --trace trace.jsonl --svc svc-cpu --service-ms 20 --slo 50
+    python3 simulate.py run --synthetic --slo 50 --percentile p99
+
+The trace only provides the offered load (rps per round). The service itself is
+simulated as M/M/c with a known per-request service time, so every policy sees the
+latency its own replica counts would have produced. New replicas become ready after
+--startup seconds, removed ones go away at once.
+"""
+import argparse
+import json
+import math
+import random
+import time
+from collections import deque
+import numpy as np
+from forecast import HoltForecaster
+from planner import CapacityPlanner, predict_ms
+
+COOLDOWN = 15
+TIMEOUT_MS = 10000  # what an overloaded service "reports"
+
+def synthetic_trace(seconds=3600, step=2, base=40, seed=1):
+    """Diurnal-ish load with noise and two spikes."""
+    rng = random.Random(seed)
+    rounds = []
+    for t in range(0, seconds, step):
+        rps = base * (1 + 0.6 * math.sin(2 * math.pi * t / 1800))
+        if 900 <= t < 1080 or 2700 <= t < 2760: rps *= 2.5
+        rounds.append({"t": t, "metrics": {"svc": {"rps": max(rps * rng.uniform(0.9, 1.1), 0)}}})
+    return rounds
+
+def load_trace(path):
+    with open(path) as f: return [json.loads(line) for line in f if line.strip()]
+
+class LinearPolicy:
+    """The controller's original rule: New = Current * latency / SLO, never down."""
+
+    name = "linear"
+
+    def decide(self, ready, current, rps, latency_ms, now, args):
+        if rps < 1.0 or latency_ms <= args.slo: return current
+        return min(args.max, max(args.min, math.ceil(current * latency_ms / args.slo)))
+
+class QueueingPolicy:
+    name = "queueing"
+
+    def __init__(self, args):
+        self.planner = CapacityPlanner(scale_down_window=args.window, tolerance=args.tolerance)
+
+    def decide(self, ready, current, rps, latency_ms, now, args):
+        # The model learns from the replicas actually serving, not the requested count
+        self.planner.observe("svc", rps, latency_ms, ready)
+        return self.planner.decide("svc", current, self.expected(rps, now, args), args.slo,
+                                   args.percentile, args.min, args.max, now)
+
+    def expected(self, rps, now, args):
+        """Load to provision for."""
+        return rps
+
+class PredictivePolicy(QueueingPolicy):
+    """Queueing model sized for the forecast peak over the next --startup seconds."""
+
+    name = "forecast"
+
+    def __init__(self, args, points=150):
+        super().__init__(args)
+        self.forecaster = HoltForecaster()
+        self.history = deque(maxlen=points)
+        self.last_t = None
+
+    def expected(self, rps, now, args):
+        step = now - self.last_t if self.last_t is not None else 2
+        self.last_t = now
+        self.history.append(rps)
+        if len(self.history) < 2: return rps
+        _, upper = self.forecaster.forecast(np.array([self.history]), max(1, round(args.startup / max(step, 1e-9))))
+        return max(rps, float(upper[0]))
+
+def simulate(policy, rounds, svc, args):
+    mu = 1000.0 / args.service_ms
+    ready, pending = args.initial, []  # pending: (ready at, count)
+    last_scale = -math.inf
+    stats = {"violations": 0, "rounds": 0, "replica_s": 0.0, "actions": 0, "reversals": 0, "peak": ready}
+    last_direction = 0
+    prev_t = rounds[0]["t"]
+    for r in rounds:
+        now = r["t"] - rounds[0]["t"]
+        dt = r["t"] - prev_t
+        prev_t = r["t"]
+        ready += sum(n for at, n in pending if at <= now)
+        pending = [(at, n) for at, n in pending if at > now]
+        desired_total = ready + sum(n for _, n in pending)
+
+        rps = r["metrics"].get(svc, {}).get("rps", 0)
+        mean_ms = min(predict_ms(rps, mu, ready), TIMEOUT_MS)
+        slo_ms = min(predict_ms(rps, mu, ready, args.percentile), TIMEOUT_MS)
+        stats["rounds"] += 1
+        stats["violations"] += slo_ms > args.slo
+        stats["replica_s"] += desired_total * dt
+
+        # The linear rule compares the SLO statistic; the planner learns from the mean
+        observed = slo_ms if policy.name == "linear" else mean_ms
+        want = policy.decide(ready, desired_total, rps, observed, now, args)
+        if want != desired_total and now - last_scale >= COOLDOWN:
+            direction = 1 if want > desired_total else -1
+            if last_direction and direction != last_direction: stats["reversals"] += 1
+            last_direction = direction
+            stats["actions"] += 1
+            last_scale = now
+            if want > desired_total: pending.append((now + args.startup, want - desired_total))
+            else:
+                # Cancel pending starts first, then remove ready replicas
+                drop = desired_total - want
+                starting = sum(n for _, n in pending)
+                pending = [(max(at for at, _ in pending), starting - drop)] if drop < starting else []
+                ready -= max(drop - starting, 0)
+            stats["peak"] = max(stats["peak"], want)
+    return stats
+
+def run(args):
+    rounds = synthetic_trace() if args.synthetic else load_trace(args.trace)
+    svc = args.svc or next(iter(rounds[0]["metrics"]))
+    duration = max(rounds[-1]["t"] - rounds[0]["t"], 1)
+    print(f"[*] {len(rounds)} rounds, {duration:.0f}s | {svc}: service {args.service_ms}ms, "
+          f"SLO {args.percentile} <= {args.slo}ms, replicas {args.min}-{args.max}, startup {args.startup}s")
+    print(f"{'policy':<9} | {'SLO miss':>8} | {'avg replicas':>12} {'peak':>4} | {'actions':>7} {'reversals':>9}")
+    for policy in (LinearPolicy(), QueueingPolicy(args), PredictivePolicy(args)):
+        s = simulate(policy, rounds, svc, args)
+        print(f"{policy.name:<9} | {s['violations'] / s['rounds']:>8.1%} | {s['replica_s'] / duration:>12.2f} {s['peak']:>4} | "
+              f"{s['actions']:>7} {s['reversals']:>9}")
+
+def record(args):
+    """Poll the aggregator's /api/graph and write one line per round."""
+    import requests
+    end = time.time() + args.seconds
+    with open(args.out, "w") as f:
+        while time.time() < end:
+            try:
+                data = requests.get(f"{args.url}/api/graph", timeout=2).json()
+                metrics = {svc: {"rps": m.get("rps", 0), "latency": m.get("latency", 0)}
+                           for svc, m in data.get("metrics", {}).items()}
+                f.write(json.dumps({"t": round(time.time(), 1), "metrics": metrics}) + "\n")
+                f.flush()
+            except Exception as e:
+                print(f"⏳ Waiting for Aggregator... ({e})")
+            time.sleep(2)
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("--url", default="http://localhost:8000")
+    rec.add_argument("--seconds", type=int, default=600)
+    rec.add_argument("--out", default="trace.jsonl")
+    sim = sub.add_parser("run")
+    sim.add_argument("--trace")
+    sim.add_argument("--synthetic", action="store_true")
+    sim.add_argument("--svc")
+    sim.add_argument("--service-ms", type=float, default=20)
+    sim.add_argument("--slo", type=float, default=50)
+    sim.add_argument("--percentile", default="mean")
+    sim.add_argument("--min", type=int, default=1)
+    sim.add_argument("--max", type=int, default=10)
+    sim.add_argument("--initial", type=int, default=1)
+    sim.add_argument("--startup", type=float, default=15)
+    sim.add_argument("--window", type=int, default=300)
+    sim.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.cmd == "record": record(args)
+    elif not args.synthetic and not args.trace: parser.error("run needs --trace or --synthetic")
+    else: run(args)
+
+if __name__ == "__main__":
+    main()
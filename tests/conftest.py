@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Components run from their own directory with common/ next to them (see the Dockerfiles)
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+for path in (SRC, *(os.path.join(SRC, c) for c in ("agent", "aggregator", "controller"))):
+    sys.path.insert(0, os.path.abspath(path))
@@ -0,0 +1,95 @@
+import logging
+import threading
+import pytest
+import actuator
+from actuator import Actuator
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(actuator, "time", fake)
+    return fake
+
+def fail(a, name, clock):
+    """Take the next work item for `name` and fail it; the delay it got (None: not requeued)."""
+    got, work = a._next()
+    assert got == name
+    a._done(name, work, RuntimeError("apiserver says no"))
+    due = [d for d, n in a.delayed if n == name]
+    if due: return due[0] - clock.now
+    return 0 if name in a.ready else None
+
+def test_newer_decision_replaces_a_queued_one(clock):
+    a = Actuator(lambda name, replicas: None)
+    a.submit("svc", 2, 3, "first")
+    clock.now += 1
+    a.submit("svc", 2, 5, "second")
+    assert a.ready == ["svc"] and a.backlog() == 1
+    name, work = a._next()
+    # Timed from the first decision, which it supersedes
+    assert work == (2, 5, "second", 1_000.0)
+    assert a.intent("svc") == 5
+
+def test_backoff_grows_and_is_capped(clock):
+    a = Actuator(lambda name, replicas: None, base_delay=0.5, max_delay=3.0, max_retries=10)
+    a.submit("svc", 1, 4)
+    delays = []
+    for _ in range(6):
+        delays.append(fail(a, "svc", clock))
+        clock.now += delays[-1]
+    assert delays == [0.5, 1.0, 2.0, 3.0, 3.0, 3.0]
+    assert a.stats["svc"].failures == 6
+
+def test_newer_decision_goes_out_at_once_after_a_give_up(clock, caplog):
+    a = Actuator(lambda name, replicas: None, base_delay=0.5, max_delay=60.0, max_retries=1)
+    a.submit("svc", 1, 4)
+    clock.now += fail(a, "svc", clock)
+    name, work = a._next()
+    a.submit("svc", 1, 6, "newer")
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="Brain"):
+        a._done(name, work, RuntimeError("apiserver says no"))
+    assert a.ready == ["svc"] and a.delayed == []
+    assert "Giving up" in caplog.text and "retry in" not in caplog.text
+    assert a._next()[1][1] == 6
+    assert a.intent("svc") == 6
+
+def test_give_up_without_newer_decision_drops_it(clock):
+    a = Actuator(lambda name, replicas: None, max_retries=0)
+    a.submit("svc", 1, 4)
+    assert fail(a, "svc", clock) is None
+    assert a.backlog() == 0 and a.intent("svc") is None
+
+def test_watch_event_before_patch_returns_is_resolved(clock):
+    a = Actuator(lambda name, replicas: None)
+    a.submit("svc", 1, 3)
+    name, work = a._next()
+    clock.now += 0.2
+    a.observed("svc", 3)
+    clock.now += 0.3
+    a._done(name, work, None)
+    assert "svc" not in a.intents
+    assert a.stats["svc"].last_observe_ms == pytest.approx(200)
+
+def test_workers_patch_every_deployment():
+    patched, lock, done = {}, threading.Lock(), threading.Event()
+
+    def patch(name, replicas):
+        with lock:
+            patched[name] = replicas
+            if len(patched) == 20: done.set()
+
+    a = Actuator(patch, workers=4, qps=1000, burst=100).start()
+    for i in range(20): a.submit(f"svc-{i}", 1, i + 2)
+    assert done.wait(5)
+    assert patched == {f"svc-{i}": i + 2 for i in range(20)}
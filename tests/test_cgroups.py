@@ -0,0 +1,91 @@
+import os
+import shutil
+import pytest
+import cgroups
+from cgroups import CgroupResolver
+
+UID_A = "0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0"
+UID_B = "11112222-3333-4444-5555-666677778888"
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(cgroups, "time", fake)
+    return fake
+
+def mkcgroup(root, *parts):
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return os.stat(path).st_ino
+
+def systemd_pod(root, uid, container):
+    """kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod<uid_>.slice/cri-containerd-<id>.scope"""
+    slice_ = f"kubepods-burstable-pod{uid.replace('-', '_')}.slice"
+    return mkcgroup(root, "kubepods.slice", "kubepods-burstable.slice", slice_, f"cri-containerd-{container}.scope")
+
+def cgroupfs_pod(root, uid, container):
+    return mkcgroup(root, "kubepods", "besteffort", f"pod{uid}", container)
+
+def resolver(root, pods):
+    """A resolver fed from a pod list the way the agent's pod watch feeds it."""
+    r = CgroupResolver(str(root), rescan_interval=1.0, negative_ttl=30.0)
+    for uid, app in pods.items(): r.add_pod(uid, app)
+    return r
+
+def test_both_cgroup_drivers_resolve(tmp_path, clock):
+    a = systemd_pod(tmp_path, UID_A, "abc")
+    b = cgroupfs_pod(tmp_path, UID_B.upper(), "def")
+    pod_dir = os.stat(tmp_path / "kubepods" / "besteffort" / f"pod{UID_B.upper()}").st_ino
+    host = mkcgroup(tmp_path, "system.slice", "sshd.service")
+    r = resolver(tmp_path, {UID_A: "checkout", UID_B: "payments"})
+    r.scan()
+    assert r.resolve(a) == "checkout"
+    assert r.resolve(b) == r.resolve(pod_dir) == "payments"
+    assert r.resolve(host) is None
+    assert r.stats()["pods"] == 2
+
+def test_new_pod_found_by_a_rescan(tmp_path, clock):
+    r = resolver(tmp_path, {UID_A: "checkout"})
+    r.scan()
+    a = systemd_pod(tmp_path, UID_A, "abc")
+    # Walked at most once per rescan_interval
+    assert r.resolve(a) is None
+    clock.now += 0.5
+    assert r.resolve(a) is None and r.scans == 1
+    clock.now += 1
+    assert r.resolve(a) == "checkout" and r.scans == 2
+
+def test_misses_are_remembered_then_expire(tmp_path, clock):
+    host = mkcgroup(tmp_path, "system.slice", "cron.service")
+    r = resolver(tmp_path, {})
+    clock.now += 5
+    assert r.resolve(host) is None and r.scans == 1
+    clock.now += 10
+    assert r.resolve(host) is None and r.scans == 1
+    assert r.stats()["negative"] == 1
+    clock.now += 30
+    r.scan()
+    assert r.stats()["negative"] == 0
+
+def test_stale_entries_are_evicted(tmp_path, clock):
+    a = systemd_pod(tmp_path, UID_A, "abc")
+    b = cgroupfs_pod(tmp_path, UID_B, "def")
+    r = resolver(tmp_path, {UID_A: "checkout", UID_B: "payments"})
+    r.scan()
+    # cgroup_rmdir: dropped at once, the inode may come back as another cgroup
+    r.forget(a)
+    assert a not in r.cgid_to_uid
+    # Directory gone: the next walk no longer has it
+    shutil.rmtree(tmp_path / "kubepods")
+    r.scan()
+    assert b not in r.cgid_to_uid
+    # Pod deleted from the watch
+    r.remove_pod(UID_A.upper())
+    assert r.uid_to_svc == {UID_B: "payments"}
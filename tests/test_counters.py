@@ -0,0 +1,52 @@
+import threading
+from counters import ServiceCounters, EdgeCounters
+
+def test_concurrent_records_sum_across_shards():
+    counters, edges = ServiceCounters(), EdgeCounters()
+    threads, per_thread = 8, 5000
+
+    def writer(k):
+        for i in range(per_thread):
+            counters.record("a", 100, 1, {i % 4: 1})
+            counters.record_responses("a", {"2xx": 1} if i % 10 else {"5xx": 1})
+            edges.record("a", f"b{k % 2}", 1, 50, 0, 10)
+
+    pool = [threading.Thread(target=writer, args=(k,)) for k in range(threads)]
+    for t in pool: t.start()
+    for t in pool: t.join()
+    total = threads * per_thread
+    snap = counters.snapshot()["a"]
+    assert len(counters.shards) == threads
+    assert (snap["count"], snap["sum_us"], snap["errors"]) == (total, total * 100, total // 10)
+    assert snap["buckets"] == {i: total // 4 for i in range(4)}
+    assert snap["responses"] == {"2xx": total - total // 10, "5xx": total // 10}
+    edge_snap = edges.snapshot()
+    assert edge_snap[("a", "b0")] == edge_snap[("a", "b1")] == {"count": total // 2, "sum_us": total * 25, "errors": 0,
+                                                                 "bytes": total * 5}
+
+def test_snapshots_are_monotonic_under_writes():
+    counters = ServiceCounters()
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            counters.record("a", 10, 1, {3: 1})
+            counters.record_responses("a", {"5xx": 1})
+
+    pool = [threading.Thread(target=writer) for _ in range(4)]
+    for t in pool: t.start()
+    try:
+        previous = {"count": 0, "sum_us": 0, "errors": 0, "buckets": {}, "responses": {}}
+        for _ in range(2000):
+            snap = counters.snapshot().get("a")
+            if snap is None: continue
+            assert snap["count"] >= previous["count"] and snap["sum_us"] >= previous["sum_us"]
+            assert snap["errors"] >= previous["errors"]
+            assert snap["buckets"].get(3, 0) >= previous["buckets"].get(3, 0)
+            assert snap["responses"].get("5xx", 0) >= previous["responses"].get("5xx", 0)
+            previous = snap
+    finally:
+        stop.set()
+        for t in pool: t.join()
+    # Readers never reset anything
+    assert counters.snapshot()["a"]["count"] >= previous["count"] > 0
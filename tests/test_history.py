@@ -0,0 +1,118 @@
+import pytest
+import history
+
+STEP, POINTS = 2, 3600 // 2
+NOW = 1_700_000_001.0  # 1s into a 2s bucket
+
+class FakeRedis:
+    """GETRANGE over byte strings, through a pipeline: all history.query needs."""
+
+    def __init__(self):
+        self.data = {}
+        self.reads = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, conn):
+        self.conn, self.ops = conn, []
+
+    def getrange(self, key, start, end):
+        self.ops.append((key, start, end))
+
+    def execute(self):
+        self.conn.reads.extend(self.ops)
+        return [bytes(self.conn.data.get(key, b"")[start:end + 1]) for key, start, end in self.ops]
+
+def put(conn, svc, bucket, count, errors=0, sum_ms=None, p99=5.0):
+    """One 2s-tier record, laid out as WRITE_LUA does."""
+    buf = conn.data.setdefault(f"hist:2s:{svc}", bytearray())
+    offset = (bucket % POINTS) * history.RECORD.size
+    if len(buf) < offset + history.RECORD.size: buf.extend(bytes(offset + history.RECORD.size - len(buf)))
+    sum_ms = count * 2.0 if sum_ms is None else sum_ms
+    buf[offset:offset + history.RECORD.size] = history.RECORD.pack(bucket, count, errors, sum_ms, p99)
+
+def fill(conn, svc, first, last, count=200):
+    for bucket in range(first, last + 1): put(conn, svc, bucket, count)
+
+def test_full_ring_returns_every_bucket():
+    conn = FakeRedis()
+    last = int(NOW // STEP) - 1
+    fill(conn, "a", last - POINTS + 1, last)
+    out = history.query(conn, ["a"], NOW - 3600, NOW, step=2, now=NOW)
+    series = out["series"]["a"]
+    assert out["tier"] == "2s" and out["step"] == 2
+    assert len(series["t"]) == POINTS
+    assert series["rps"] == [100.0] * POINTS
+    assert series["t"][-1] == last * STEP
+    assert out["to"] == (last + 1) * STEP
+
+def test_wrapped_range_reads_two_runs():
+    conn = FakeRedis()
+    last = int(NOW // STEP) - 1
+    # Pick a range that crosses the end of the ring
+    first = last - (last % POINTS) - 10
+    fill(conn, "a", first, last)
+    out = history.query(conn, ["a"], first * STEP, NOW, step=2, now=NOW)
+    assert len(conn.reads) == 2
+    assert out["series"]["a"]["t"] == [b * STEP for b in range(first, last + 1)]
+    assert out["series"]["a"]["rps"] == [100.0] * (last - first + 1)
+
+def test_open_bucket_is_left_out():
+    conn = FakeRedis()
+    open_bucket = int(NOW // STEP)
+    fill(conn, "a", open_bucket - 5, open_bucket)
+    out = history.query(conn, ["a"], (open_bucket - 5) * STEP, NOW + 10, step=2, now=NOW)
+    assert out["series"]["a"]["t"][-1] == (open_bucket - 1) * STEP
+    assert out["to"] == open_bucket * STEP
+
+def test_missing_and_stale_records_are_unknown():
+    conn = FakeRedis()
+    last = int(NOW // STEP) - 1
+    fill(conn, "a", last - 9, last)
+    # A record left by the previous lap of the ring, and a slot never written
+    put(conn, "a", last - 5 - POINTS, 999)
+    buf = conn.data["hist:2s:a"]
+    offset = ((last - 3) % POINTS) * history.RECORD.size
+    buf[offset:offset + history.RECORD.size] = bytes(history.RECORD.size)
+    out = history.query(conn, ["a"], (last - 9) * STEP, NOW, step=2, now=NOW)
+    rps = out["series"]["a"]["rps"]
+    assert rps[4] is None and rps[6] is None
+    assert [x for x in rps if x is not None] == [100.0] * 8
+
+def test_groups_average_over_recorded_buckets():
+    conn = FakeRedis()
+    last = int(NOW // STEP) - 1
+    first = last - 29
+    first -= first % 5
+    fill(conn, "a", first, last)
+    # Half of the first group was never recorded: its rate is still the rate it had
+    for bucket in (first, first + 1): conn.data["hist:2s:a"][(bucket % POINTS) * history.RECORD.size] ^= 1
+    out = history.query(conn, ["a"], first * STEP, NOW, step=10, now=NOW)
+    assert out["step"] == 10
+    assert out["series"]["a"]["t"][0] == first * STEP
+    assert out["series"]["a"]["rps"] == [100.0] * len(out["series"]["a"]["t"])
+
+def test_service_without_records_is_omitted():
+    out = history.query(FakeRedis(), ["nothing"], NOW - 60, NOW, now=NOW)
+    assert out["series"] == {}
+
+def test_write_slot_then_query():
+    redislite = pytest.importorskip("redislite")
+    from rollup import Partial
+    conn = redislite.Redis()
+    history._write = None
+    # Two whole minutes of slots, queried just after
+    minute = NOW // 60 * 60
+    now = minute + 1
+    for t in range(int(minute) - 120, int(minute), STEP):
+        history.write_slot(conn, t, {"a": Partial(200, 200 * 2000, 2)})
+    # Replayed slot (leader change): not counted twice
+    history.write_slot(conn, minute - STEP, {"a": Partial(200, 200 * 2000, 2)})
+    fine = history.query(conn, ["a"], minute - 120, now, step=2, now=now)["series"]["a"]
+    assert fine["rps"] == [100.0] * 60 and fine["latency"] == [2.0] * 60 and fine["error_ratio"] == [0.01] * 60
+    coarse = history.query(conn, ["a"], minute - 120, now, step=60, now=now)
+    assert coarse["tier"] == "1m"
+    assert coarse["series"]["a"]["t"] == [minute - 120, minute - 60]
+    assert coarse["series"]["a"]["rps"] == [100.0, 100.0]
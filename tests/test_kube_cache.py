@@ -0,0 +1,109 @@
+import sys
+import threading
+import types
+import pytest
+from common.kube_cache import Informer
+
+def pod(name, rv, app="web"):
+    return {"metadata": {"name": name, "namespace": "default", "resourceVersion": rv, "labels": {"app": app}}}
+
+def listing(rv, *pods):
+    return {"items": list(pods), "metadata": {"resourceVersion": rv}}
+
+class ApiException(Exception):
+    def __init__(self, status, reason=""):
+        self.status, self.reason = status, reason
+
+class Apiserver:
+    """Scripted LIST responses and WATCH streams; once the script runs out the watch blocks."""
+
+    def __init__(self, lists, streams):
+        self.lists, self.streams = list(lists), list(streams)
+        self.watched_from = []
+        self.idle = threading.Event()
+        self.stop = threading.Event()
+
+    def list_pods(self, namespace, **kwargs):
+        return self.lists.pop(0)
+
+    def stream(self, func, *args, resource_version=None, **kwargs):
+        self.watched_from.append(resource_version)
+        if not self.streams:
+            self.idle.set()
+            self.stop.wait(5)
+            return
+        script = self.streams.pop(0)
+        if isinstance(script, Exception): raise script
+        yield from script
+
+@pytest.fixture
+def apiserver(monkeypatch):
+    """Factory of Apiservers, with the kubernetes watch module pointing at the last one."""
+    servers = []
+
+    def make(lists, streams):
+        server = Apiserver(lists, streams)
+        servers.append(server)
+        rest = types.SimpleNamespace(ApiException=ApiException)
+        kubernetes = types.ModuleType("kubernetes")
+        kubernetes.watch = types.SimpleNamespace(Watch=lambda: types.SimpleNamespace(stream=server.stream))
+        kubernetes.client = types.SimpleNamespace(rest=rest)
+        monkeypatch.setitem(sys.modules, "kubernetes", kubernetes)
+        monkeypatch.setitem(sys.modules, "kubernetes.client", kubernetes.client)
+        monkeypatch.setitem(sys.modules, "kubernetes.client.rest", rest)
+        return server
+
+    yield make
+    for server in servers: server.stop.set()
+
+def run(server):
+    informer = Informer(server.list_pods, "default", indexers={"app": lambda p: [p["metadata"]["labels"]["app"]]})
+    events = []
+    informer.add_handler(lambda kind, obj, old: events.append((kind, obj["metadata"]["name"])))
+    informer.start()
+    assert informer.wait_synced(5)
+    assert server.idle.wait(5)
+    return informer, events
+
+def names(pods):
+    return sorted(p["metadata"]["name"] for p in pods)
+
+def test_events_are_applied_to_the_cache(apiserver):
+    server = apiserver([listing("10", pod("a", "1"), pod("b", "2"))], [[
+        {"type": "ADDED", "object": pod("c", "11")},
+        {"type": "MODIFIED", "object": pod("a", "12", app="api")},
+        {"type": "DELETED", "object": pod("b", "13")},
+    ]])
+    informer, events = run(server)
+    assert names(informer.list()) == ["a", "c"]
+    assert informer.get("default/a")["metadata"]["labels"]["app"] == "api"
+    assert names(informer.by_index("app", "api")) == ["a"]
+    assert names(informer.by_index("app", "web")) == ["c"]
+    assert events == [("ADDED", "a"), ("ADDED", "b"), ("ADDED", "c"), ("MODIFIED", "a"), ("DELETED", "b")]
+    # The watch resumes where the last event left off
+    assert server.watched_from == ["10", "13"]
+
+def test_bookmarks_advance_the_resource_version(apiserver):
+    server = apiserver([listing("10", pod("a", "1"))], [[
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "40"}}},
+    ]])
+    informer, events = run(server)
+    assert server.watched_from == ["10", "40"]
+    assert informer.resource_version == "40"
+    assert names(informer.list()) == ["a"] and events == [("ADDED", "a")]
+
+def test_resync_after_410_gone(apiserver):
+    server = apiserver([listing("10", pod("a", "1"), pod("b", "2")),
+                        listing("30", pod("a", "25", app="api"), pod("d", "26")),
+                        listing("50", pod("d", "26"))], [
+        [{"type": "ERROR", "object": {"kind": "Status", "code": 410, "reason": "Expired"}}],
+        ApiException(410, "Gone"),
+    ])
+    informer, events = run(server)
+    # Relisted twice: once for the ERROR event, once for the exception
+    assert server.watched_from == ["10", "30", "50"]
+    assert names(informer.list()) == ["d"]
+    assert events == [("ADDED", "a"), ("ADDED", "b"),
+                      ("DELETED", "b"), ("MODIFIED", "a"), ("ADDED", "d"),
+                      ("DELETED", "a"), ("MODIFIED", "d")]
+    assert informer.by_index("app", "api") == [] and names(informer.by_index("app", "web")) == ["d"]
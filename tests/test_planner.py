@@ -0,0 +1,76 @@
+import math
+import pytest
+from planner import CapacityPlanner, erlang_c, mmc_mean, mmc_quantile, mmc_tail, estimate_mu, predict_ms
+
+def test_single_server_matches_mm1():
+    lam, mu = 60.0, 100.0
+    assert erlang_c(1, lam / mu) == pytest.approx(lam / mu)
+    assert mmc_mean(lam, mu, 1) == pytest.approx(1 / (mu - lam))
+    # M/M/1 sojourn time is exponential with rate mu - lam
+    assert mmc_tail(0.01, lam, mu, 1) == pytest.approx(math.exp(-(mu - lam) * 0.01))
+    assert mmc_quantile(0.99, lam, mu, 1) == pytest.approx(-math.log(0.01) / (mu - lam), rel=1e-6)
+
+def test_erlang_c_textbook_value():
+    # 2 servers, offered load 1 Erlang: P(wait) = 1/3
+    assert erlang_c(2, 1.0) == pytest.approx(1 / 3)
+
+def test_tail_without_queueing_slack():
+    # c - 1 == lam / mu: the two exponentials coincide
+    lam, mu = 100.0, 100.0
+    assert mmc_tail(0.02, lam, mu, 2) == pytest.approx(mmc_tail(0.02, lam * (1 + 1e-6), mu, 2), rel=1e-4)
+
+def test_overload_and_idle():
+    assert mmc_mean(300, 100, 3) == math.inf
+    assert mmc_quantile(0.99, 300, 100, 3) == math.inf
+    assert mmc_mean(0, 100, 3) == pytest.approx(0.01)
+
+@pytest.mark.parametrize("lam,mu,c", [(50, 100, 1), (350, 100, 4), (900, 120, 10)])
+def test_estimate_mu_inverts_the_mean(lam, mu, c):
+    assert estimate_mu(lam, mmc_mean(lam, mu, c), c) == pytest.approx(mu, rel=1e-6)
+
+def test_percentiles_are_ordered():
+    values = [predict_ms(350, 100, 4, p) for p in ("p50", "p90", "p99", "p999")]
+    assert values == sorted(values)
+    assert predict_ms(350, 100, 4) == pytest.approx(mmc_mean(350, 100, 4) * 1000)
+
+def learned(mu=100.0, replicas=4, rps=300.0):
+    planner = CapacityPlanner(scale_down_window=60, tolerance=0.2)
+    planner.observe("svc", rps, mmc_mean(rps, mu, replicas) * 1000, replicas)
+    return planner
+
+def test_observe_learns_and_smooths_mu():
+    planner = learned()
+    assert planner.mu["svc"] == pytest.approx(100.0)
+    planner.observe("svc", 300.0, mmc_mean(300.0, 200.0, 4) * 1000, 4)
+    assert planner.mu["svc"] == pytest.approx(100.0 + 0.3 * 100.0)
+    # Too little traffic to learn from
+    assert planner.observe("svc", 0.5, 1.0, 4) == planner.mu["svc"]
+
+def test_required_is_the_smallest_count_within_budget():
+    planner = learned()
+    for rps, budget in [(300, 15), (550, 12), (900, 11)]:
+        c = planner.required("svc", rps, budget, hi=20)
+        assert predict_ms(rps, 100.0, c) <= budget
+        assert c == 1 or predict_ms(rps, 100.0, c - 1) > budget
+    assert planner.required("unknown", 300, 15) is None
+    assert planner.required("svc", 10_000, 15, hi=10) == 10
+
+def test_scale_up_at_once_scale_down_after_the_window():
+    planner = learned()
+    budget = 15.0
+    up = planner.decide("svc", 4, 700, budget, now=0)
+    assert up > 4
+    # Load drops: held at the peak until it leaves the stabilization window
+    assert planner.decide("svc", up, 200, budget, now=30) == up
+    assert planner.decide("svc", up, 200, budget, now=59) == up
+    down = planner.decide("svc", up, 200, budget, now=61)
+    assert down < up and down == planner.required("svc", 200, budget * 0.8)
+
+def test_no_change_inside_the_tolerance_band():
+    planner = learned()
+    budget = 17.0
+    c = planner.required("svc", 300, budget * 0.8)
+    assert c == 5
+    # One replica short of the target, but still well within budget: leave it
+    assert predict_ms(300, 100.0, c - 1) <= budget * 0.9
+    assert planner.decide("svc", c - 1, 300, budget, now=0) == c - 1
@@ -0,0 +1,111 @@
+import random
+import pytest
+from rca import CriticalPath, back_edges, components
+
+SERVICES = 300
+LAYERS = 6
+
+def make_graph(rng, n=SERVICES):
+    """Layered call graph: every service calls 1-3 services of the next tier, some of them twice."""
+    tiers = [[] for _ in range(LAYERS)]
+    for i in range(n): tiers[i * LAYERS // n].append(f"svc-{i}")
+    topology, calls = {}, {}
+    for depth, tier in enumerate(tiers[:-1]):
+        for svc in tier:
+            topology[svc] = rng.sample(tiers[depth + 1], rng.randint(1, 3))
+            for child in topology[svc]: calls[(svc, child)] = rng.choice((1, 1, 1, 2))
+    return tiers, topology, calls
+
+def observe(tiers, topology, calls, exclusive, entry_rps=100.0):
+    """Service and edge metrics of sequential calls, as the aggregator reports them."""
+    rps = {svc: 0.0 for tier in tiers for svc in tier}
+    for svc in tiers[0]: rps[svc] = entry_rps
+    for tier in tiers:
+        for svc in tier:
+            for child in topology.get(svc, []):
+                # Cycle-closing calls are a trickle: left out of the rates
+                if calls[(svc, child)] >= 1: rps[child] += rps[svc] * calls[(svc, child)]
+    latency = {}
+    for tier in reversed(tiers):
+        for svc in tier:
+            latency[svc] = exclusive[svc] + sum(calls[(svc, c)] * latency.get(c, 0)
+                                                for c in topology.get(svc, []) if calls[(svc, c)] >= 1)
+    metrics = {svc: {"latency": latency[svc], "rps": rps[svc]} for svc in latency}
+    edges = {svc: {c: {"rps": rps[svc] * calls[(svc, c)], "latency": latency[c]} for c in children}
+             for svc, children in topology.items()}
+    return metrics, edges
+
+def slowed(seed, depth, cycle=False):
+    """(engine, root, reduction, slow, cycle edge): one service `depth` hops below an entry service made slow."""
+    rng = random.Random(seed)
+    tiers, topology, calls = make_graph(rng)
+    exclusive = {svc: rng.uniform(1, 5) for tier in tiers for svc in tier}
+    healthy, _ = observe(tiers, topology, calls, exclusive)
+    slo = {svc: m["latency"] * 1.5 for svc, m in healthy.items()}
+
+    root = rng.choice(tiers[0])
+    path = [root]
+    for _ in range(depth): path.append(rng.choice(topology[path[-1]]))
+    slow = path[-1]
+    back = None
+    if cycle:
+        # Callback from the slow service to the first service on its path: all of them one SCC
+        back = (slow, path[1])
+        topology.setdefault(slow, []).append(path[1])
+        calls[back] = 0.001
+    exclusive[slow] += 2 * max(m["latency"] for m in healthy.values())
+    metrics, edges = observe(tiers, topology, calls, exclusive)
+    reduction = metrics[root]["latency"] - slo[root]
+    assert reduction > 0
+    return CriticalPath().update(metrics, topology, edges), root, reduction, slow, back
+
+@pytest.mark.parametrize("seed", range(5))
+def test_slow_dependency_one_hop_away(seed):
+    engine, root, reduction, slow, _ = slowed(seed, depth=1)
+    decision = engine.scale_target(root, reduction)
+    assert decision["target"] == slow
+    assert decision["path"] == [root, slow]
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("depth", [2, 3, 5])
+def test_slow_dependency_several_hops_away(seed, depth):
+    engine, root, reduction, slow, _ = slowed(seed, depth)
+    decision = engine.scale_target(root, reduction)
+    assert decision["target"] == slow
+    assert len(decision["path"]) == depth + 1
+    assert decision["exclusive_ms"] > decision["downstream_ms"]
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("depth", [2, 4])
+def test_slow_dependency_inside_a_cycle(seed, depth):
+    engine, root, reduction, slow, back = slowed(seed, depth, cycle=True)
+    comp = components(engine.edge_set)
+    assert comp[back[0]] == comp[back[1]]
+    # The callback is the edge cut to break the cycle, not the real traffic
+    assert back in engine.cyclic
+    assert engine.scale_target(root, reduction)["target"] == slow
+
+def test_scalable_restricts_the_target():
+    engine, root, reduction, slow, _ = slowed(0, depth=3)
+    path = engine.critical_path(root)[0]
+    assert engine.scale_target(root, reduction, scalable=set(path[:2]))["target"] == path[1]
+
+def test_incremental_update_matches_a_full_build():
+    rng = random.Random(9)
+    tiers, topology, calls = make_graph(rng)
+    exclusive = {svc: rng.uniform(1, 5) for tier in tiers for svc in tier}
+    metrics, edges = observe(tiers, topology, calls, exclusive)
+    engine = CriticalPath().update(metrics, topology, edges)
+    leaf = tiers[-1][0]
+    exclusive[leaf] += 50
+    metrics, edges = observe(tiers, topology, calls, exclusive)
+    engine.update(metrics, topology, edges)
+    assert engine.recomputed < SERVICES // 4
+    fresh = CriticalPath().update(metrics, topology, edges)
+    for root in tiers[0]:
+        assert engine.critical_path(root) == fresh.critical_path(root)
+
+def test_back_edges_leave_an_acyclic_graph():
+    edges = {("a", "b"), ("b", "c"), ("c", "a"), ("c", "d"), ("d", "d2"), ("d2", "d")}
+    back = back_edges(edges, priority=lambda e: 0.001 if e in {("c", "a"), ("d2", "d")} else 1)
+    assert back == {("c", "a"), ("d2", "d")}
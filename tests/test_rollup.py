@@ -0,0 +1,84 @@
+import random
+import pytest
+from rollup import Rollups, RollingWindows, Partial, EdgePartial, split_int
+
+RATE = 100      # requests/s
+START = 1_000.0 # agent_start, long before the first scrape
+
+def payload(t):
+    count = round(RATE * (t - START))
+    return {"agent_start": START, "timestamp": t,
+            "metrics": {"a": {"count": count, "sum_us": count * 1000, "errors": count // 100}},
+            "edges": [{"src": "a", "dst": "b", "count": count, "sum_us": count * 500, "errors": 0,
+                       "bytes": count * 64, "last_seen": t}]}
+
+def scrape_times(first, rounds, jitter, seed=1):
+    """Sync rounds every 2s that each land up to `jitter` seconds late (in 0.1s steps)."""
+    rng = random.Random(seed)
+    return [first + 2 * k + rng.randint(0, int(jitter * 10)) / 10 for k in range(rounds)]
+
+def test_split_int_adds_up():
+    for n in (0, 1, 7, 200, 12345):
+        pieces = split_int(n, [0.1, 0.35, 0.9, 1.0])
+        assert sum(pieces) == n and min(pieces) >= 0
+
+def test_partial_split_keeps_totals_and_mean():
+    p = Partial(200, 200 * 1500, 3, responses={"2xx": 197, "5xx": 3})
+    pieces = p.split([0.25, 1.0])
+    assert [x.count for x in pieces] == [50, 150]
+    merged = Partial()
+    for x in pieces: merged.merge(x)
+    assert (merged.count, merged.sum_us, merged.errors, merged.responses) == (200, 300000, 3, {"2xx": 197, "5xx": 3})
+    assert all(x.sum_us == x.count * 1500 for x in pieces)
+
+def test_edge_split_keeps_bytes():
+    pieces = EdgePartial(0, 0, 0, 1000).split([0.5, 1.0])
+    assert [x.bytes for x in pieces] == [500, 500]
+
+def test_delta_spread_over_the_slots_it_covers():
+    rw = RollingWindows(slot_seconds=2)
+    # 600 requests counted from t=101 to t=107: 1s, 2s, 2s, 1s in slots 50..53
+    rw.add("agent", Partial(600), 107.0, since=101.0)
+    assert [rw.slot(e).count for e in range(50, 54)] == [100, 200, 200, 100]
+
+@pytest.mark.parametrize("jitter", [0.0, 0.5, 1.9])
+def test_jittered_scrapes_fill_every_slot(jitter):
+    rollups = Rollups(slot_seconds=2)
+    rollups.started = 1_999.0
+    times = scrape_times(2_000.0, 60, jitter)
+    for t in times: rollups.ingest("agent", payload(t), t)
+    now = times[-1]
+    # Every complete slot after the baseline reading holds exactly 2s of traffic
+    first, last = int(times[0] // 2) + 1, int(now // 2) - 1
+    counts = [rollups.services["a"].slot(e).count for e in range(first, last + 1)]
+    assert counts == [2 * RATE] * len(counts)
+    windows = rollups.merged(now)["a"]
+    assert windows["10s"]["rps"] == RATE and windows["1m"]["rps"] == RATE
+    assert windows["10s"]["error_ratio"] == 0.01
+    assert rollups.merged_edges(now)["a"]["b"]["rps"] == RATE
+
+def test_missed_scrape_is_spread_not_bunched():
+    rollups = Rollups(slot_seconds=2)
+    rollups.started = 1_999.0
+    for t in (2_000.3, 2_002.3, 2_010.3, 2_012.3):
+        rollups.ingest("agent", payload(t), t)
+    counts = [rollups.services["a"].slot(e).count for e in range(1_002, 1_006)]
+    assert counts == [2 * RATE] * 4
+
+def test_agents_are_summed_not_overwritten():
+    rollups = Rollups(slot_seconds=2)
+    rollups.started = 1_999.0
+    for t in scrape_times(2_000.0, 10, 0.7):
+        rollups.ingest("node-1", payload(t), t)
+        rollups.ingest("node-2", payload(t), t)
+    assert rollups.merged(t)["a"]["10s"]["rps"] == 2 * RATE
+
+def test_window_is_short_while_history_is():
+    rollups = Rollups(slot_seconds=2)
+    rollups.started = 2_000.0
+    # An agent that started with us: its first reading counts from agent_start
+    start_payload = lambda t: {**payload(t), "agent_start": 2_000.0,
+                               "metrics": {"a": {"count": round(RATE * (t - 2_000.0))}}}
+    for t in scrape_times(2_000.5, 5, 0.3): rollups.ingest("agent", start_payload(t), t)
+    # 8s of complete slots so far: the 1m window divides by 8, not 60
+    assert rollups.merged(t)["a"]["1m"]["rps"] == RATE
@@ -0,0 +1,109 @@
+import random
+import socket
+import struct
+import pytest
+import sensors
+from ipmap import ipv4_key
+from telemetry import Telemetry
+
+class Sink:
+    """Records every call a sensor makes, by method name."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def of(self, name):
+        return [args for n, args in self.calls if n == name]
+
+DEST = ipv4_key("10.0.0.1")
+
+# stdout of the aggregate-mode program over one interval, as bpftrace prints it:
+# every print(@map) is followed by an empty line, empty maps print nothing else
+FLUSH_BLOCK = f"""@lat_hist[4242, 37]: 12
+@lat_hist[4242, 41]: 3
+@lat_hist[5151, 20]: 7
+
+@lat_sum[4242]: 21000
+@lat_sum[5151]: 700
+
+@resp[4242, 2]: 14
+@resp[4242, 5]: 1
+@resp[5151, 2]: 7
+
+@edge_n[4242, {DEST}]: 4
+
+@edge_us[4242, {DEST}]: 8000
+
+@edge_err[4242, {DEST}]: 1
+
+@edge_bytes[4242, {DEST}]: 2048
+
+@dropped: 1
+
+@unmatched: 2
+
+@conn[4242, {DEST}]: 2
+
+
+
+FLUSH
+"""
+
+def test_bpftrace_flush_block():
+    sink, telemetry = Sink(), Telemetry()
+    sensors.BpftraceSensor(sink, telemetry=telemetry).consume(FLUSH_BLOCK.splitlines(keepends=True) * 3)
+    assert telemetry.counters.get("discarded", 0) == 0
+    assert telemetry.counters["events"] == 3 * sum(1 for line in FLUSH_BLOCK.splitlines() if line.strip())
+    assert sink.of("histogram")[0] == ({4242: {37: 12, 41: 3}, 5151: {20: 7}}, {4242: 21000, 5151: 700})
+    assert sink.of("responses")[0] == ({4242: {2: 14, 5: 1}, 5151: {2: 7}},)
+    assert sink.of("edges")[0] == ({(4242, "10.0.0.1"): [4, 8000, 1, 2048]},)
+    assert sink.of("connects")[0] == ({(4242, "10.0.0.1"): 2},)
+    assert sink.of("sensor_stats")[:2] == [({"dropped": 1},), ({"unmatched": 2},)]
+    assert len(sink.of("histogram")) == 3
+
+def test_bpftrace_malformed_lines_are_counted():
+    sink, telemetry = Sink(), Telemetry()
+    sensors.BpftraceSensor(sink, aggregate=False, telemetry=telemetry).consume(
+        ["LAT 4242 17 900 200\n", "LAT 4242\n", "WHAT 1 2 3\n", "\n", "FLUSH\n"])
+    assert telemetry.counters["discarded"] == 2
+    assert sink.of("latency") == [(4242, 17, 900, 200, 1)]
+
+def event(kind, cgroup, value, status=0, pid=7, addr=b"", weight=0):
+    """One packed event_t; latency records carry their sampling weight in the address bytes."""
+    if kind == sensors.EVENT_LAT: addr = weight.to_bytes(4, "little")
+    return struct.pack(sensors.EVENT_FORMAT, kind, status, pid, cgroup, value, addr.ljust(16, b"\0"))
+
+def packed_batch():
+    rng = random.Random(5)
+    records = [event(sensors.EVENT_LAT, rng.choice((11, 22, 33)), rng.randint(1, 2_000_000),
+                     status=rng.choice((200, 200, 404, 503)), weight=rng.choice((0, 1, 4)))
+               for _ in range(2000)]
+    records += [event(sensors.EVENT_ERR, 22, 110), event(sensors.EVENT_ERR, 11, 104),
+                event(sensors.EVENT_CONN, 33, 2, addr=socket.inet_aton("10.1.2.3")),
+                event(sensors.EVENT_CONN, 33, 10, addr=socket.inet_pton(socket.AF_INET6, "fd00::1")),
+                event(sensors.EVENT_CGRM, 44, 0)]
+    rng.shuffle(records)
+    # A trailing partial record is left for the next batch
+    return b"".join(records) + b"\0" * 7
+
+def test_decode_records_numpy_matches_struct(monkeypatch):
+    pytest.importorskip("numpy")
+    data = packed_batch()
+    vectorized = Sink()
+    assert sensors.decode_records(data, vectorized) == 2005
+    monkeypatch.setattr(sensors, "np", None)
+    fallback = Sink()
+    assert sensors.decode_records(data, fallback) == 2005
+    assert vectorized.calls == fallback.calls
+    hist, sums = fallback.of("histogram")[0]
+    assert set(hist) == {11, 22, 33}
+    assert fallback.of("responses")[0][0][22][-110] == 1
+    assert sorted(fallback.of("connect")) == [(33, 7, "10.1.2.3"), (33, 7, "fd00::1")]
+    assert fallback.of("cgroup_removed") == [(44,)]
+
+def test_event_record_layout():
+    assert sensors.EVENT_SIZE == 40
+    if sensors.np is not None: assert sensors.EVENT_DTYPE.itemsize == 40
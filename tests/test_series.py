@@ -0,0 +1,69 @@
+import random
+import numpy as np
+import pytest
+from rollup import Rollups, Partial
+from series import SeriesStore
+from forecast import HoltForecaster
+
+RATE = 100
+START = 1_000.0
+
+def payload(t):
+    count = round(RATE * (t - START))
+    return {"agent_start": START, "timestamp": t, "metrics": {"a": {"count": count, "sum_us": count * 1000}}}
+
+def run(times):
+    """Sync rounds at `times`: ingest, then record the slots completed since the last round."""
+    rollups, series = Rollups(slot_seconds=2), SeriesStore(slot_seconds=2)
+    rollups.started = times[0] - 1
+    recorded = {}
+    for t in times:
+        rollups.ingest("agent", payload(t), t)
+        for epoch, slots in series.record(rollups, t).items():
+            assert epoch not in recorded
+            recorded[epoch] = slots
+    return series, recorded
+
+def test_every_slot_recorded_once_under_jitter():
+    rng = random.Random(3)
+    times = [2_000.0 + 2 * k + rng.randint(0, 19) / 10 for k in range(40)]
+    series, recorded = run(times)
+    epochs = sorted(recorded)
+    assert epochs == list(range(epochs[0], int(times[-1] // 2)))
+    # The first slot only holds traffic from the baseline reading on
+    rps = series.query(["a"])["series"]["a"]["rps"]
+    known = [x for x in rps if x is not None]
+    assert len(known) == len(epochs)
+    assert known[1:] == [RATE] * (len(known) - 1)
+
+def test_late_round_still_records_the_slots_it_missed():
+    series, recorded = run([2_000.5, 2_002.5, 2_004.5, 2_013.7, 2_015.1])
+    assert sorted(recorded) == list(range(1_000, 1_007))
+    # Slot 1000 has the baseline reading in it; 1002..1006 all come from the 2_004.5 -> 2_013.7 delta
+    assert [recorded[e]["a"].count for e in range(1_001, 1_007)] == [2 * RATE] * 6
+
+def test_unrecorded_slots_are_unknown():
+    series = SeriesStore(slot_seconds=2, length=10)
+    series.put(100, {"a": Partial(200, 200 * 1000)})
+    series.put(103, {"a": Partial(400, 400 * 2000)})
+    out = series.query(["a"], points=4)
+    assert out["end"] == 208
+    assert out["series"]["a"] == {"rps": [100.0, None, None, 200.0], "latency": [1.0, None, None, 2.0]}
+
+def test_dropped_service_is_forgotten():
+    series = SeriesStore(slot_seconds=2)
+    series.put(1, {"a": Partial(2), "b": Partial(2)})
+    series.put(2, {"a": Partial(2)})
+    assert list(series.query()["series"]) == ["a"]
+
+def test_forecast_skips_missing_samples():
+    rps = [RATE] * 20
+    for i in (3, 4, 11): rps[i] = None
+    expected, upper = HoltForecaster().forecast(np.array([rps], dtype=np.float64), horizon=15)
+    assert expected[0] == pytest.approx(RATE)
+    assert upper[0] == pytest.approx(RATE)
+
+def test_forecast_follows_a_ramp():
+    ramp = np.arange(60, dtype=np.float64) * 2 + 100
+    expected, upper = HoltForecaster().forecast(ramp[None, :], horizon=15)
+    assert ramp[-1] < expected[0] <= upper[0]
@@ -0,0 +1,102 @@
+import json
+import pytest
+import shard
+import store
+from common.sketch import LatencySketch
+from rollup import Rollups
+from series import SeriesStore
+
+AGENTS = [f"agent-{i}" for i in range(8)]
+START = 1_000.0
+STARTED = 1_999.0
+
+def payload(agent, t):
+    """Cumulative counters of one agent; every agent runs a replica of svc-0..3, at its own rate."""
+    rate = 10 * (1 + AGENTS.index(agent))
+    n = round(rate * (t - START))
+    sketch = LatencySketch()
+    sketch.add(900, n // 2)
+    sketch.add(4000, n - n // 2)
+    metrics = {f"svc-{s}": {"count": n, "sum_us": n * 2450, "errors": n // 50,
+                            "responses": {"2xx": n - n // 50, "5xx": n // 50}, "sketch": sketch.to_wire()}
+               for s in range(4)}
+    edges = [{"src": f"svc-{s}", "dst": f"svc-{s + 1}", "count": n, "sum_us": n * 1200, "errors": 0,
+              "bytes": n * 300, "last_seen": t} for s in range(3)]
+    return {"agent_start": START, "timestamp": t, "metrics": metrics,
+            "topology": {e["src"]: [e["dst"]] for e in edges}, "edges": edges, "sensor": {}}
+
+def rollups():
+    r = Rollups(slot_seconds=2)
+    r.started = STARTED
+    return r
+
+def single_graph(single, now):
+    return store.graph(single.merged(now), single.merged_edges(now))
+
+ROUNDS = [2_000.3 + 2 * k + (0.7 if k % 3 == 0 else 0) for k in range(12)]
+
+def test_merged_exports_match_one_replica():
+    single, halves = rollups(), [rollups(), rollups()]
+    for now in ROUNDS:
+        for k, agent in enumerate(AGENTS):
+            single.ingest(agent, payload(agent, now), now)
+            halves[k % 2].ingest(agent, payload(agent, now), now)
+        exports = [json.loads(shard.export(r, now)) for r in halves]
+        merged, edges, slots = shard.merge(exports, now, 2)
+        assert merged == single.merged(now)
+        assert edges == single.merged_edges(now)
+        assert store.graph(merged, edges) == single_graph(single, now)
+        for epoch, partials in slots.items():
+            expected = single.slots(epoch)
+            assert {svc: p.to_wire() for svc, p in partials.items()} == {svc: p.to_wire() for svc, p in expected.items()}
+
+class FakeScraper:
+    """Serves the agents' payloads at the round's time, like AgentScraper.scrape."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.scraped = []
+
+    def scrape(self, targets):
+        self.scraped.append(sorted(targets))
+        return {name: payload(name, self.clock.now) for name in targets}, {"ok": len(targets), "agents": len(targets)}
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+def test_two_replicas_build_the_graph_of_one(monkeypatch):
+    redislite = pytest.importorskip("redislite")
+    clock = FakeTime()
+    monkeypatch.setattr(shard, "time", clock)
+    conn = redislite.Redis(decode_responses=True)
+    urls = {agent: f"http://{agent}:5000" for agent in AGENTS}
+    replicas = []
+    for name in ("replica-a", "replica-b"):
+        member = shard.ShardMember(name)
+        # Both live before the first round, so neither takes a baseline the other needs
+        member.heartbeat(conn, ROUNDS[0] - 1)
+        replicas.append((member, FakeScraper(clock), rollups(), SeriesStore(slot_seconds=2)))
+    single, single_series = rollups(), SeriesStore(slot_seconds=2)
+
+    for now in ROUNDS:
+        clock.now = now
+        graphs = [shard.run_round(member, conn, scraper, r, series, urls)[0]
+                  for member, scraper, r, series in replicas]
+        single.ingest_all({agent: payload(agent, now) for agent in AGENTS}, now)
+        single_series.record(single, now)
+        # The second replica merges both of this round's exports: exactly the single replica's view
+        assert graphs[1] == single_graph(single, now)
+
+    owned = [set(scraper.scraped[-1]) for _, scraper, _, _ in replicas]
+    assert owned[0] | owned[1] == set(AGENTS) and not owned[0] & owned[1]
+    assert replicas[0][0].leader and not replicas[1][0].leader
+    # The leader wrote the round it merged: reading it back gives the graph it built
+    assert store.read_graph(conn, ROUNDS[-1]) == graphs[0]
+    assert replicas[1][3].query()["series"] == single_series.query()["series"]
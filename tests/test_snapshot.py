@@ -0,0 +1,71 @@
+import json
+from snapshot import SnapshotStore
+
+def graph(metrics, topology, edges=None):
+    return {"metrics": metrics, "topology": topology, "edges": edges or {}}
+
+def body(store, since):
+    snap, raw = store.delta(since)
+    return snap, json.loads(raw)
+
+def test_versions_count_up_within_a_store():
+    store = SnapshotStore()
+    v1 = store.publish(graph({"a": {"rps": 1}}, {})).version
+    v2 = store.publish(graph({"a": {"rps": 2}}, {})).version
+    assert v1 != v2
+    assert v1.split("-")[0] == v2.split("-")[0] == store.epoch
+    assert [v1.split("-")[1], v2.split("-")[1]] == ["1", "2"]
+
+def test_unchanged_round_keeps_version_and_etag():
+    store = SnapshotStore()
+    first = store.publish(graph({"a": {"rps": 1}}, {}))
+    again = store.publish(graph({"a": {"rps": 1}}, {}))
+    assert again is first
+
+def test_delta_against_a_known_version():
+    store = SnapshotStore()
+    v1 = store.publish(graph({"a": {"rps": 1}, "b": {"rps": 1}}, {"a": ["b"]},
+                             {"a": {"b": {"rps": 1}}})).version
+    snap = store.publish(graph({"a": {"rps": 2}, "c": {"rps": 1}}, {"a": ["c"]},
+                               {"a": {"c": {"rps": 1}}}))
+    _, out = body(store, v1)
+    assert out["full"] is False and out["since"] == v1 and out["version"] == snap.version
+    assert out["metrics"] == {"a": {"rps": 2}, "c": {"rps": 1}}
+    assert out["removed_nodes"] == ["b"]
+    assert out["edges_added"] == [["a", "c"]] and out["edges_removed"] == [["a", "b"]]
+    assert out["edge_metrics"] == [["a", "c", {"rps": 1}]]
+
+def test_current_version_gets_an_empty_delta():
+    store = SnapshotStore()
+    v = store.publish(graph({"a": {"rps": 1}}, {})).version
+    _, out = body(store, v)
+    assert out["full"] is False and out["metrics"] == {} and out["edges_added"] == []
+
+def test_unknown_versions_get_everything():
+    store = SnapshotStore(history=2)
+    old = store.publish(graph({"a": {"rps": 1}}, {})).version
+    for rps in (2, 3): store.publish(graph({"a": {"rps": rps}}, {}))
+    other = SnapshotStore()
+    # Same counter, but from another replica (or before a restart)
+    other.epoch = "f" + store.epoch
+    foreign = other.publish(graph({"a": {"rps": 9}}, {})).version
+    assert foreign.split("-")[1] == old.split("-")[1]
+    for since in ("0", old, foreign, "garbage"):
+        _, out = body(store, since)
+        assert out["full"] is True and out["metrics"] == {"a": {"rps": 3}}
+
+def test_deltas_are_shared_until_the_next_publish():
+    store = SnapshotStore()
+    v1 = store.publish(graph({"a": {"rps": 1}}, {})).version
+    store.publish(graph({"a": {"rps": 2}}, {}))
+    assert store.delta(v1)[1] is store.delta(v1)[1]
+    store.publish(graph({"a": {"rps": 3}}, {}))
+    _, out = body(store, v1)
+    assert out["metrics"] == {"a": {"rps": 3}}
+
+def test_wait_newer():
+    store = SnapshotStore()
+    assert store.wait_newer("0", timeout=0) is False
+    v = store.publish(graph({}, {})).version
+    assert store.wait_newer("0", timeout=0) is True
+    assert store.wait_newer(v, timeout=0) is False
@@ -0,0 +1,75 @@
+import pytest
+from common import wire
+from common.wire import WireEncoder, WireDecoder
+
+def payload(t, services=("a", "b", "c"), rate=10):
+    n = int(rate * t)
+    metrics = {svc: {"count": n + i, "sum_us": (n + i) * 900, "errors": i, "responses": {"2xx": n},
+                     "sketch": [[12, n], [30, i]]} for i, svc in enumerate(services)}
+    edges = [{"src": src, "dst": dst, "count": n, "sum_us": n * 400, "errors": 0, "bytes": n * 64, "last_seen": t}
+             for src, dst in zip(services, services[1:])]
+    topology = {}
+    for e in edges: topology.setdefault(e["src"], []).append(e["dst"])
+    return {"agent_start": 100.0, "timestamp": t, "metrics": metrics, "topology": topology,
+            "edges": edges, "sensor": {"events": n}}
+
+def scrape(encoder, decoder, data, content_type, accept_encoding=""):
+    body, sent_type, encoding = encoder.encode(data, content_type, accept_encoding, decoder.ack)
+    return decoder.decode(wire.decompress(body, encoding), sent_type)
+
+FORMATS = [wire.COMPACT_JSON, pytest.param(wire.MSGPACK, marks=pytest.mark.skipif(wire.msgpack is None, reason="no msgpack"))]
+
+@pytest.mark.parametrize("content_type", FORMATS)
+def test_round_trip_through_deltas(content_type):
+    encoder, decoder = WireEncoder(epoch=100.0), WireDecoder()
+    steps = [payload(1.0), payload(2.0), payload(2.0),
+             payload(3.0, services=("a", "b", "d")),   # c gone, d new
+             payload(4.0, services=("d",))]           # every edge gone
+    for data in steps:
+        assert scrape(encoder, decoder, data, content_type) == data
+
+def test_unchanged_payload_sends_nothing_new():
+    encoder, decoder = WireEncoder(epoch=1), WireDecoder()
+    scrape(encoder, decoder, payload(1.0), wire.COMPACT_JSON)
+    compact = encoder.compact(payload(1.0), decoder.ack)
+    assert compact["base"] == compact["version"]
+    assert compact["metrics"] == compact["edges"] == compact["names"] == []
+
+def test_delta_against_unknown_base_is_rejected():
+    encoder, decoder = WireEncoder(epoch=1), WireDecoder()
+    scrape(encoder, decoder, payload(1.0), wire.COMPACT_JSON)
+    ack = decoder.ack
+    scrape(encoder, decoder, payload(2.0), wire.COMPACT_JSON)
+    # A reply meant for a scraper that acked an older version
+    body, content_type, _ = encoder.encode(payload(3.0), wire.COMPACT_JSON, "", ack)
+    with pytest.raises(ValueError):
+        decoder.decode(body, content_type)
+    assert decoder.ack is None
+    assert scrape(encoder, decoder, payload(3.0), wire.COMPACT_JSON) == payload(3.0)
+
+def test_restarted_agent_sends_a_full_payload():
+    decoder = WireDecoder()
+    scrape(WireEncoder(epoch=1), decoder, payload(1.0), wire.COMPACT_JSON)
+    assert scrape(WireEncoder(epoch=2), decoder, payload(5.0, services=("x", "y")), wire.COMPACT_JSON) == \
+        payload(5.0, services=("x", "y"))
+
+def test_acks_older_than_the_history_get_a_full_payload():
+    encoder, decoder = WireEncoder(epoch=1, history=2), WireDecoder()
+    scrape(encoder, decoder, payload(1.0), wire.COMPACT_JSON)
+    for t in (2.0, 3.0, 4.0): encoder.compact(payload(t))
+    assert encoder.compact(payload(5.0), decoder.ack)["base"] == 0
+
+def test_plain_json_and_compression():
+    encoder, decoder = WireEncoder(epoch=1), WireDecoder()
+    data = payload(1.0, services=[f"svc-{i}" for i in range(50)])
+    for accept_encoding in ("gzip", "zstd, gzip") if wire.zstandard is not None else ("gzip",):
+        body, content_type, encoding = encoder.encode(data, "application/json", accept_encoding)
+        assert content_type == wire.JSON and encoding == accept_encoding.split(",")[0]
+        assert decoder.decode(wire.decompress(body, encoding), content_type) == data
+    # Too small to be worth compressing
+    assert encoder.encode(payload(1.0, services=("a",)), "", "gzip")[2] is None
+
+def test_negotiation():
+    assert wire.negotiate("") == wire.JSON
+    assert wire.negotiate(f"{wire.COMPACT_JSON}, {wire.JSON};q=0.5") == wire.COMPACT_JSON
+    if wire.msgpack is not None: assert wire.negotiate(wire.accept_header()) == wire.MSGPACK